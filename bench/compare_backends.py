@@ -0,0 +1,190 @@
+""" Compare the pdf extraction backends (src/utils/pdf_backends.py) against the pdfminer reference:
+throughput, and what changes in the blocks of the glyph path (find_all_textboxes_glyphs) and in the images.
+
+    python bench/compare_backends.py --docs 40 --output backends.json
+    python bench/compare_backends.py --pdf-dir /data/corpus --limit 200 --bbox-tolerance 2
+
+For each backend:
+
+- first_page: docs/s of find_all_textboxes_glyphs (1st page, grouped into blocks), what the server runs;
+- all_pages: pages/s of iter_pages on the whole documents;
+- blocks: each block of the reference is looked up by its text in the blocks of the backend:
+  matched (bbox within the tolerance), moved (same text, bbox beyond it), missing (no block with this
+  text), extra (blocks of the backend not used); fontinfo of the matched text, with and without the color;
+- images: placements found, and the ones whose image_stream_hash equals the reference one.
+
+Exits with status 1 when a backend fails on a document the reference extracts.
+"""
+import os, sys
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import argparse
+import json
+import platform
+import statistics
+import tempfile
+import time
+from collections import defaultdict
+from pathlib import Path
+
+from bench.corpus import generate_corpus
+from src.utils.pdf2xml import find_all_textboxes_glyphs, image_stream_hash
+from src.utils.pdf_backends import DEFAULT_PDF_BACKEND, available_backends, get_backend
+
+
+def _block_text(block):
+    return "\n".join("".join(line[1]) for line in block[1])
+
+
+def _block_fonts(block, color=True):
+    fonts = {fontinfo for line in block[1] for fontinfo in line[2]}
+    return fonts if color else {fontinfo.split("$#color=")[0] for fontinfo in fonts}
+
+
+def _bbox_delta(a, b):
+    return max(abs(u - v) for u, v in zip(a, b))
+
+
+def compare_blocks(reference, other, tolerance):
+    """ Block level differences of a document
+
+    Args:
+    ---
+        reference, other (list): blocks of find_all_textboxes_glyphs [(bbox, line_list)]
+        tolerance (float): max difference of a bbox coordinate, in points, for a block to be matched
+
+    Returns:
+    ---
+        dict: counts (see the module docstring) and max_bbox_delta of the matched blocks
+    """
+    by_text = defaultdict(list)
+    for block in other:
+        by_text[_block_text(block)].append(block)
+    stats = {"reference": len(reference), "blocks": len(other), "matched": 0, "moved": 0, "missing": 0, "extra": 0,
+             "same_fontinfo": 0, "same_font_and_size": 0, "max_bbox_delta": 0.0}
+    for block in reference:
+        candidates = by_text.get(_block_text(block))
+        if not candidates:
+            stats["missing"] += 1
+            continue
+        # same text twice in a page (headers, labels): the nearest one
+        found = min(candidates, key=lambda c: _bbox_delta(block[0], c[0]))
+        candidates.remove(found)
+        delta = _bbox_delta(block[0], found[0])
+        if delta <= tolerance:
+            stats["matched"] += 1
+            stats["max_bbox_delta"] = max(stats["max_bbox_delta"], round(delta, 3))
+        else:
+            stats["moved"] += 1
+        stats["same_fontinfo"] += _block_fonts(block) == _block_fonts(found)
+        stats["same_font_and_size"] += _block_fonts(block, False) == _block_fonts(found, False)
+    stats["extra"] = sum(len(blocks) for blocks in by_text.values())
+    return stats
+
+
+def extract(backend, paths):
+    """ 1st page blocks and image hashes of each document, None for the ones the backend fails on"""
+    results = []
+    for path in paths:
+        try:
+            blocks, images, _ = find_all_textboxes_glyphs(path, backend)
+            results.append((blocks, [image_stream_hash(img.stream) for img in images]))
+        except Exception as e:
+            results.append(None)
+            print(f"{backend}: {Path(path).name}: {type(e).__name__}: {e}", file=sys.stderr)
+    return results
+
+
+def _time(func, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def _all_pages(backend, paths):
+    pages = 0
+    for path in paths:
+        try:
+            for _ in get_backend(backend).iter_pages(path):
+                pages += 1
+        except Exception:
+            pass
+    return pages
+
+
+def run(paths, backends, repeat=3, tolerance=2.0):
+    reference = extract(DEFAULT_PDF_BACKEND, paths)
+    report = {}
+    for name in backends:
+        results = reference if name == DEFAULT_PDF_BACKEND else extract(name, paths)
+        first_page = _time(lambda: extract(name, paths), repeat)
+        pages = _all_pages(name, paths)
+        all_pages = _time(lambda: _all_pages(name, paths), repeat)
+        entry = {"first_page": {"seconds": first_page, "docs_per_second": len(paths) / first_page},
+                 "all_pages": {"seconds": all_pages, "pages": pages, "pages_per_second": pages / all_pages},
+                 "failed": [Path(p).name for p, ref, res in zip(paths, reference, results) if ref and res is None]}
+        blocks = defaultdict(float)
+        images = {"reference": 0, "images": 0, "same_hash": 0}
+        for ref, res in zip(reference, results):
+            if ref is None or res is None:
+                continue
+            for key, value in compare_blocks(ref[0], res[0], tolerance).items():
+                blocks[key] = max(blocks[key], value) if key == "max_bbox_delta" else blocks[key] + value
+            images["reference"] += len(ref[1])
+            images["images"] += len(res[1])
+            images["same_hash"] += sum(min(ref[1].count(h), res[1].count(h)) for h in set(ref[1]))
+        entry["blocks"] = {k: (v if k == "max_bbox_delta" else int(v)) for k, v in blocks.items()}
+        entry["images"] = images
+        report[name] = entry
+    ref_speed = report[DEFAULT_PDF_BACKEND]["first_page"]["docs_per_second"] if DEFAULT_PDF_BACKEND in report else None
+    for entry in report.values():
+        if ref_speed:
+            entry["first_page"]["speedup"] = entry["first_page"]["docs_per_second"] / ref_speed
+    return report
+
+
+def print_report(report):
+    print(f"{'backend':10} {'docs/s':>8} {'speedup':>8} {'pages/s':>8} {'matched':>8} {'moved':>6} {'missing':>8} "
+          f"{'extra':>6} {'font=':>6} {'img=':>6}")
+    for name, entry in report.items():
+        b, i = entry["blocks"], entry["images"]
+        print(f"{name:10} {entry['first_page']['docs_per_second']:8.1f} {entry['first_page'].get('speedup', 1):7.2f}x "
+              f"{entry['all_pages']['pages_per_second']:8.1f} {b['matched']:>4}/{b['reference']:<3} {b['moved']:6} "
+              f"{b['missing']:8} {b['extra']:6} {b['same_fontinfo']:6} {i['same_hash']:>3}/{i['reference']:<2}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Throughput and block level differences of the pdf backends")
+    parser.add_argument("--pdf-dir", help="folder of pdf, a synthetic corpus is generated if not given")
+    parser.add_argument("--docs", type=int, default=20, help="size of the synthetic corpus")
+    parser.add_argument("--limit", type=int, help="max number of pdf taken from --pdf-dir")
+    parser.add_argument("--backends", nargs="+", help="default: the installed ones")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--bbox-tolerance", type=float, default=2.0, help="points")
+    parser.add_argument("--output", help="write the results as json")
+    args = parser.parse_args()
+
+    backends = args.backends or available_backends()
+    if DEFAULT_PDF_BACKEND not in backends:
+        backends.insert(0, DEFAULT_PDF_BACKEND)
+    with tempfile.TemporaryDirectory(prefix="ccm_backends_") as tmp:
+        if args.pdf_dir:
+            paths = sorted(p.as_posix() for p in Path(args.pdf_dir).glob("*.pdf"))[:args.limit]
+        else:
+            paths = [p.as_posix() for p, _ in generate_corpus(tmp, args.docs)]
+        report = run(paths, backends, args.repeat, args.bbox_tolerance)
+
+    print_report(report)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"platform": platform.platform(), "python": platform.python_version(), "docs": len(paths),
+                       "bbox_tolerance": args.bbox_tolerance, "backends": report}, f, indent=2)
+    if any(entry["failed"] for entry in report.values()):
+        sys.exit(1)
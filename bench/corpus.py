@@ -0,0 +1,251 @@
+""" Synthetic PDF corpus generator (offline, no PDF library needed).
+
+Documents look like the notices we migrate: a fixed header/footer boilerplate, an address block,
+a date line, and variable body text laid out in one or more columns. Each document can also have
+text inside a Form XObject (pdfminer <figure> text) and raster images (Flate or DCT encoded).
+
+    python bench/corpus.py /tmp/corpus --docs 50 --seed 1
+"""
+import os, sys
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import argparse
+import json
+import random
+import zlib
+from io import BytesIO
+from pathlib import Path
+
+
+PAGE_W, PAGE_H = 595, 842  # A4 in points
+MARGIN = 50
+
+WORDS = ("contrat assurance habitation montant echeance prelevement client reference dossier "
+         "garantie franchise sinistre declaration avenant cotisation annuelle mensuelle resiliation "
+         "adresse courrier service gestion conseiller agence banque compte releve operation solde "
+         "credit debit frais taux periode conditions generales particulieres article").split()
+CITIES = [("75015", "PARIS"), ("69003", "LYON"), ("13001", "MARSEILLE"), ("31000", "TOULOUSE"), ("59000", "LILLE")]
+MONTHS = ["janvier", "fevrier", "mars", "avril", "mai", "juin", "juillet", "aout", "septembre", "octobre", "novembre", "decembre"]
+
+# corpus profiles, each document of a corpus uses one of them (round robin)
+DEFAULT_PROFILES = [
+    {"name": "simple", "pages": 1, "columns": 1, "glyphs": 1500, "figure_text": False, "images": 0, "boilerplate": True},
+    {"name": "two_columns", "pages": 1, "columns": 2, "glyphs": 3000, "figure_text": False, "images": 1, "boilerplate": True},
+    {"name": "figure_text", "pages": 1, "columns": 1, "glyphs": 2000, "figure_text": True, "images": 1, "boilerplate": True},
+    {"name": "dense_multi_page", "pages": 4, "columns": 3, "glyphs": 6000, "figure_text": True, "images": 2, "boilerplate": True},
+    {"name": "scan_like", "pages": 2, "columns": 1, "glyphs": 300, "figure_text": False, "images": 3, "boilerplate": False},
+]
+
+
+def _pdf_string(text):
+    """ PDF literal string (WinAnsi / latin-1 bytes)"""
+    raw = text.encode("latin-1", "replace")
+    return b"(" + raw.replace(b"\\", b"\\\\").replace(b"(", b"\\(").replace(b")", b"\\)") + b")"
+
+
+def _text_op(x, y, size, text, font=b"/F1", color=None):
+    ops = b""
+    if color:
+        ops += ("%.3f %.3f %.3f rg " % color).encode()
+    else:
+        ops += b"0 g "
+    ops += b"BT " + font + b" %d Tf %.2f %.2f Td " % (size, x, y) + _pdf_string(text) + b" Tj ET\n"
+    return ops
+
+
+def _random_sentence(rnd, n_chars):
+    words = []
+    length = 0
+    while length < n_chars:
+        w = rnd.choice(WORDS)
+        words.append(w)
+        length += len(w) + 1
+    return " ".join(words)[:n_chars]
+
+
+def _image_xobject(rnd, width, height, encoding):
+    """ Return (dict_bytes, data) of an RGB image XObject"""
+    pixels = bytes(rnd.getrandbits(8) for _ in range(3)) * (width * height)
+    if encoding == "dct":
+        from PIL import Image
+        buf = BytesIO()
+        Image.frombytes("RGB", (width, height), pixels).save(buf, format="JPEG", quality=80)
+        data = buf.getvalue()
+        filter_ = b"/DCTDecode"
+    else:
+        data = zlib.compress(pixels)
+        filter_ = b"/FlateDecode"
+    head = (b"<< /Type /XObject /Subtype /Image /Width %d /Height %d /ColorSpace /DeviceRGB "
+            b"/BitsPerComponent 8 /Filter %s /Length %d >>" % (width, height, filter_, len(data)))
+    return head, data
+
+
+class _PDFWriter:
+    """ Collect objects and serialize a PDF file with a valid xref table"""
+
+    def __init__(self):
+        self.objects = []  # bytes of each object body, objid = index + 1
+
+    def reserve(self):
+        self.objects.append(None)
+        return len(self.objects)
+
+    def set(self, objid, body):
+        self.objects[objid - 1] = body
+
+    def add(self, body):
+        objid = self.reserve()
+        self.set(objid, body)
+        return objid
+
+    def add_stream(self, head_without_length, data):
+        """ head_without_length: dict content (without << >>)"""
+        return self.add(b"<< " + head_without_length + b" /Length %d >>\nstream\n" % len(data) + data + b"\nendstream")
+
+    def tobytes(self, root_id):
+        out = BytesIO()
+        out.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        offsets = []
+        for i, body in enumerate(self.objects, 1):
+            offsets.append(out.tell())
+            out.write(b"%d 0 obj\n" % i + body + b"\nendobj\n")
+        xref = out.tell()
+        out.write(b"xref\n0 %d\n0000000000 65535 f \n" % (len(self.objects) + 1))
+        for off in offsets:
+            out.write(b"%010d 00000 n \n" % off)
+        out.write(b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(self.objects) + 1, root_id, xref))
+        return out.getvalue()
+
+
+def make_pdf(profile, seed=0, docno=0):
+    """ Build one synthetic PDF.
+
+    Args:
+    ---
+        profile (dict): pages, columns, glyphs (per page, approx.), figure_text (bool), images (per doc),
+            boilerplate (bool: fixed header/footer/address/date blocks)
+        seed (int): random seed of the corpus
+        docno (int): document number, drives the variable parts
+
+    Returns:
+    ---
+        bytes: pdf content
+    """
+    rnd = random.Random(f"{seed}-{docno}")
+    w = _PDFWriter()
+    catalog_id = w.reserve()
+    pages_id = w.reserve()
+    font_id = w.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    bold_id = w.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica-Bold /Encoding /WinAnsiEncoding >>")
+
+    n_pages = profile.get("pages", 1)
+    columns = max(1, profile.get("columns", 1))
+    n_glyphs = profile.get("glyphs", 1000)
+    n_images = profile.get("images", 0)
+    size = 9
+    line_h = size * 1.4
+    cp, city = CITIES[docno % len(CITIES)]
+    page_ids = []
+    for pageno in range(1, n_pages + 1):
+        content = b""
+        xobjects = b""
+        top = PAGE_H - MARGIN
+        if profile.get("boilerplate", True):
+            # fixed header (identical in every document)
+            content += _text_op(MARGIN, top, 14, "COMPAGNIE GENERALE DES ASSURANCES", font=b"/F2", color=(0.075, 0.424, 0.741))
+            content += _text_op(MARGIN, top - 16, 8, "Service clients - 12 avenue des Champs, 75008 PARIS")
+            if pageno == 1:
+                # address block (variable), date line (variable), reference (variable)
+                x_addr = PAGE_W / 2 + 20
+                content += _text_op(x_addr, top - 80, 10, f"M. CLIENT {docno:05d}")
+                content += _text_op(x_addr, top - 93, 10, f"{rnd.randint(1, 200)} RUE DE LA REPUBLIQUE")
+                content += _text_op(x_addr, top - 106, 10, f"{cp} {city}")
+                content += _text_op(MARGIN, top - 140, 10, f"Le {rnd.randint(1, 28)} {rnd.choice(MONTHS)} 2021, reference {rnd.randint(10**7, 10**8)}")
+            # footer
+            content += _text_op(MARGIN, MARGIN - 20, 7, "CGA - SA au capital de 1 000 000 euros - RCS Paris 123 456 789")
+            content += _text_op(PAGE_W - MARGIN - 40, MARGIN - 20, 8, f"Page {pageno} / {n_pages}")
+            top -= 170
+
+        # body text, in columns
+        col_w = (PAGE_W - 2 * MARGIN - (columns - 1) * 20) / columns
+        chars_per_line = max(10, int(col_w / (size * 0.5)))
+        n_lines = max(1, n_glyphs // chars_per_line)
+        lines_per_col = max(1, int((top - MARGIN - 20) / line_h))
+        for i in range(n_lines):
+            col = (i // lines_per_col) % columns
+            row = i % lines_per_col
+            if i and row == 0 and col == 0:
+                break  # page full
+            y = top - row * line_h
+            if row % 8 == 7:
+                continue  # paragraph gap
+            x = MARGIN + col * (col_w + 20)
+            content += _text_op(x, y, size, _random_sentence(rnd, chars_per_line))
+
+        # text inside a form xobject => <figure> in pdfminer xml
+        if profile.get("figure_text") and pageno == 1:
+            form = b""
+            for j in range(6):
+                form += _text_op(10, 80 - j * 12, 8, f"Encadre {j} : " + _random_sentence(rnd, 40))
+            form_id = w.add_stream(b"/Type /XObject /Subtype /Form /BBox [0 0 300 100] "
+                                   b"/Resources << /Font << /F1 %d 0 R >> >>" % font_id, form)
+            xobjects += b"/Fm1 %d 0 R " % form_id
+            content += b"q 1 0 0 1 %d %d cm /Fm1 Do Q\n" % (MARGIN, MARGIN + 40)
+
+        # images, spread over the pages (logo on every first page is identical across documents)
+        for k in range(n_images):
+            if k % n_pages != pageno - 1:
+                continue
+            fixed = k == 0 and profile.get("boilerplate", True)
+            img_rnd = random.Random("logo") if fixed else rnd
+            iw, ih = (60, 30) if fixed else (rnd.randint(40, 200), rnd.randint(40, 200))
+            head, data = _image_xobject(img_rnd, iw, ih, "dct" if k % 2 else "flate")
+            img_id = w.add(head + b"\nstream\n" + data + b"\nendstream")
+            xobjects += b"/Im%d %d 0 R " % (k, img_id)
+            x, y = (PAGE_W - MARGIN - iw, PAGE_H - MARGIN - ih) if fixed else (rnd.randint(MARGIN, 300), rnd.randint(MARGIN, 500))
+            content += b"q %d 0 0 %d %d %d cm /Im%d Do Q\n" % (iw, ih, x, y, k)
+
+        content_id = w.add_stream(b"", content)
+        resources = b"<< /Font << /F1 %d 0 R /F2 %d 0 R >> /XObject << %s>> >>" % (font_id, bold_id, xobjects)
+        page_ids.append(w.add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources %s /Contents %d 0 R >>"
+                              % (pages_id, PAGE_W, PAGE_H, resources, content_id)))
+
+    kids = b" ".join(b"%d 0 R" % pid for pid in page_ids)
+    w.set(pages_id, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(page_ids)))
+    w.set(catalog_id, b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    return w.tobytes(catalog_id)
+
+
+def generate_corpus(output_dir, n_docs=20, seed=0, profiles=None):
+    """ Write n_docs synthetic pdf in output_dir (round robin over profiles)
+
+    Returns:
+    ---
+        list: [(path, profile)]
+    """
+    profiles = profiles or DEFAULT_PROFILES
+    out_dir = Path(output_dir)
+    out_dir.mkdir(parents=True, exist_ok=True)
+    written = []
+    for docno in range(n_docs):
+        profile = profiles[docno % len(profiles)]
+        path = out_dir / f"doc_{profile['name']}_{docno:05d}.pdf"
+        path.write_bytes(make_pdf(profile, seed=seed, docno=docno))
+        written.append((path, profile))
+    return written
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate a synthetic PDF corpus")
+    parser.add_argument("output_dir")
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--profiles", help="json file with a list of profiles (see DEFAULT_PROFILES)")
+    args = parser.parse_args()
+    profiles = json.loads(Path(args.profiles).read_text()) if args.profiles else None
+    for path, profile in generate_corpus(args.output_dir, args.docs, args.seed, profiles):
+        print(path)
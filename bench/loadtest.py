@@ -0,0 +1,274 @@
+""" Local load generator for the pdf2xml service.
+
+Starts the server in a subprocess for each serving configuration, replays a folder of PDF
+(or a synthetic corpus) at a fixed concurrency (closed loop) or a fixed request rate (open loop),
+and reports latency percentiles, throughput, error rate and server RSS over time.
+
+    python bench/loadtest.py --configs threaded,processes=4 --concurrency 8 --duration 30
+    python bench/loadtest.py --pdf-dir data/sample --rate 5 --duration 60 --output load.json
+
+A configuration is a comma separated item:
+    threaded        werkzeug, one thread per request
+    single          werkzeug, one request at a time
+    processes=N     werkzeug, N forked processes
+    gunicorn=WxT    gunicorn with W workers and T threads (if gunicorn is installed)
+"""
+import os, sys
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import argparse
+import itertools
+import json
+import socket
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from bench.corpus import generate_corpus
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_command(config, port):
+    """ Command line starting the server for a configuration name"""
+    if config.startswith("gunicorn"):
+        workers, _, threads = config.partition("=")[2].partition("x")
+        return ["gunicorn", "--chdir", PROJECT_DIR, "-b", f"127.0.0.1:{port}", "-w", workers or "2",
+                "--threads", threads or "1", "src.server_app:flask_app()"]
+    cmd = [sys.executable, os.path.join(PROJECT_DIR, "src", "server_app.py"), "--host", "127.0.0.1",
+           "--port", str(port), "--no-debug"]
+    if config == "single":
+        cmd.append("--single-thread")
+    elif config.startswith("processes="):
+        cmd += ["--processes", config.split("=")[1]]
+    elif config != "threaded":
+        raise ValueError(f"unknown configuration {config}")
+    return cmd
+
+
+def process_tree_rss(pid):
+    """ RSS in bytes of a process and its children (linux /proc), None if not available"""
+    try:
+        children = {}
+        for entry in os.scandir("/proc"):
+            if entry.name.isdigit():
+                try:
+                    with open(f"/proc/{entry.name}/stat") as f:
+                        ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+                    children.setdefault(ppid, []).append(int(entry.name))
+                except (OSError, ValueError, IndexError):
+                    continue
+        total = 0
+        todo = [pid]
+        while todo:
+            p = todo.pop()
+            todo.extend(children.get(p, []))
+            try:
+                with open(f"/proc/{p}/status") as f:
+                    for line in f:
+                        if line.startswith("VmRSS:"):
+                            total += int(line.split()[1]) * 1024
+            except OSError:
+                continue
+        return total
+    except OSError:
+        return None
+
+
+def _multipart(filename, data, fields):
+    boundary = uuid.uuid4().hex
+    parts = []
+    for name, value in fields.items():
+        parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    parts.append(f'--{boundary}\r\nContent-Disposition: form-data; name="pdf_file"; filename="{filename}"\r\n'
+                 f'Content-Type: application/pdf\r\n\r\n'.encode() + data + b"\r\n")
+    parts.append(f"--{boundary}--\r\n".encode())
+    return b"".join(parts), f"multipart/form-data; boundary={boundary}"
+
+
+def _post(url, body, content_type, timeout):
+    req = urllib.request.Request(url, data=body, headers={"Content-Type": content_type}, method="POST")
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            resp.read()
+            return resp.status
+    except urllib.error.HTTPError as e:
+        return e.code
+    except Exception:
+        return None
+
+
+def percentile(sorted_values, p):
+    if not sorted_values:
+        return None
+    k = (len(sorted_values) - 1) * p / 100
+    f = int(k)
+    c = min(f + 1, len(sorted_values) - 1)
+    return sorted_values[f] + (sorted_values[c] - sorted_values[f]) * (k - f)
+
+
+def run_load(url, payloads, duration, concurrency=None, rate=None, timeout=300):
+    """ Replay payloads against url for `duration` seconds
+
+    Closed loop (concurrency): N clients each sending their next request as soon as the previous one returns.
+    Open loop (rate): requests are scheduled at a fixed rate whatever the response time, latency is measured
+    from the scheduled time (no coordinated omission).
+
+    Returns:
+    ---
+        list: [(start_offset, latency_seconds, status)]
+    """
+    records = []
+    lock = threading.Lock()
+    cycle = itertools.cycle(payloads)
+    cycle_lock = threading.Lock()
+    t0 = time.perf_counter()
+    deadline = t0 + duration
+
+    def next_payload():
+        with cycle_lock:
+            return next(cycle)
+
+    def send(scheduled):
+        body, content_type = next_payload()
+        status = _post(url, body, content_type, timeout)
+        end = time.perf_counter()
+        with lock:
+            records.append((scheduled - t0, end - scheduled, status))
+
+    if rate:
+        interval = 1.0 / rate
+        with ThreadPoolExecutor(max_workers=max(4, int(rate * 30))) as pool:
+            for i in itertools.count():
+                scheduled = t0 + i * interval
+                if scheduled >= deadline:
+                    break
+                time.sleep(max(0.0, scheduled - time.perf_counter()))
+                pool.submit(send, scheduled)
+    else:
+        def client():
+            while time.perf_counter() < deadline:
+                send(time.perf_counter())
+        threads = [threading.Thread(target=client) for _ in range(concurrency or 1)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    return records
+
+
+def summarize(records, wall_seconds):
+    latencies = sorted(lat for _, lat, status in records if status == 200)
+    errors = sum(1 for _, _, status in records if status != 200)
+    return {
+        "requests": len(records),
+        "ok": len(latencies),
+        "error_rate": errors / len(records) if records else None,
+        "throughput_rps": len(latencies) / wall_seconds if wall_seconds else None,
+        "latency_p50": percentile(latencies, 50),
+        "latency_p95": percentile(latencies, 95),
+        "latency_p99": percentile(latencies, 99),
+        "latency_max": latencies[-1] if latencies else None,
+    }
+
+
+def run_config(config, payloads, args):
+    port = _free_port()
+    base_url = f"http://127.0.0.1:{port}"
+    proc = subprocess.Popen(server_command(config, port), cwd=PROJECT_DIR,
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        # --- wait for the server
+        start = time.perf_counter()
+        while True:
+            try:
+                urllib.request.urlopen(base_url + "/", timeout=1).read()
+                break
+            except Exception:
+                if proc.poll() is not None or time.perf_counter() - start > 60:
+                    raise RuntimeError(f"server did not start for configuration {config}")
+                time.sleep(0.1)
+        startup_seconds = time.perf_counter() - start
+
+        # --- sample RSS in background
+        rss_samples = []
+        stop = threading.Event()
+
+        def sample_rss():
+            while not stop.is_set():
+                rss_samples.append((round(time.perf_counter() - load_start, 2), process_tree_rss(proc.pid)))
+                stop.wait(args.rss_interval)
+
+        load_start = time.perf_counter()
+        sampler = threading.Thread(target=sample_rss, daemon=True)
+        sampler.start()
+        records = run_load(base_url + "/pdf2xml", payloads, args.duration, args.concurrency, args.rate, args.timeout)
+        wall = time.perf_counter() - load_start
+        stop.set()
+        sampler.join()
+    finally:
+        proc.terminate()
+        try:
+            proc.wait(10)
+        except subprocess.TimeoutExpired:
+            proc.kill()
+
+    summary = summarize(records, wall)
+    rss_values = [rss for _, rss in rss_samples if rss is not None]
+    summary.update({
+        "config": config,
+        "startup_seconds": startup_seconds,
+        "rss_peak_bytes": max(rss_values) if rss_values else None,
+        "rss_over_time": rss_samples,
+    })
+    return summary
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load test pdf2xml under several serving configurations")
+    parser.add_argument("--pdf-dir", help="folder of pdf to replay (default: synthetic corpus)")
+    parser.add_argument("--docs", type=int, default=20, help="size of the synthetic corpus")
+    parser.add_argument("--configs", default="single,threaded,processes=4")
+    parser.add_argument("--concurrency", type=int, default=4, help="closed loop clients (ignored with --rate)")
+    parser.add_argument("--rate", type=float, help="open loop requests per second")
+    parser.add_argument("--duration", type=float, default=20, help="seconds of load per configuration")
+    parser.add_argument("--timeout", type=float, default=300, help="client timeout per request")
+    parser.add_argument("--params", default="", help="extra form fields, e.g. 'artifacts=blocks&format=json'")
+    parser.add_argument("--rss-interval", type=float, default=0.5)
+    parser.add_argument("--output", default="loadtest_results.json")
+    args = parser.parse_args()
+    fields = dict(p.split("=", 1) for p in args.params.split("&") if p)
+
+    with tempfile.TemporaryDirectory(prefix="ccm_load_") as tmp:
+        paths = sorted(Path(args.pdf_dir).glob("*.pdf")) if args.pdf_dir else [p for p, _ in generate_corpus(tmp, args.docs)]
+        payloads = [_multipart(p.name, p.read_bytes(), fields) for p in paths]
+
+    results = {"load": {"concurrency": None if args.rate else args.concurrency, "rate": args.rate,
+                        "duration": args.duration, "documents": len(payloads), "params": fields},
+               "configs": []}
+    print(f"{'config':18} {'req':>6} {'rps':>7} {'err%':>6} {'p50':>7} {'p95':>7} {'p99':>7} {'rss MB':>8}")
+    for config in args.configs.split(","):
+        summary = run_config(config, payloads, args)
+        results["configs"].append(summary)
+        fmt = lambda v: f"{v:7.3f}" if v is not None else f"{'-':>7}"
+        rss = summary["rss_peak_bytes"] / 1e6 if summary["rss_peak_bytes"] else 0
+        print(f"{config:18} {summary['requests']:6d} {fmt(summary['throughput_rps'])} "
+              f"{100 * (summary['error_rate'] or 0):6.1f} {fmt(summary['latency_p50'])} {fmt(summary['latency_p95'])} "
+              f"{fmt(summary['latency_p99'])} {rss:8.1f}")
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.output}")
@@ -0,0 +1,177 @@
+""" Benchmark suite: per-stage microbenchmarks and end-to-end runs on a synthetic corpus.
+
+Results are written as JSON so that two runs can be compared:
+
+    python bench/run_bench.py --docs 20 --output before.json
+    (change code)
+    python bench/run_bench.py --docs 20 --output after.json --compare before.json
+"""
+import os, sys
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import argparse
+import json
+import platform
+import shutil
+import statistics
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+from bench.corpus import generate_corpus
+
+
+def timeit(func, repeat=3):
+    """ Run func() `repeat` times
+
+    Returns:
+    ---
+        dict: min/median/mean seconds of one run
+    """
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return {"min": min(times), "median": statistics.median(times), "mean": statistics.mean(times), "repeat": repeat}
+
+
+def _prepare_inputs(pdf_paths):
+    """ Pre-compute the input of each stage for every document, so stages are timed in isolation"""
+    from src.utils.pdf2xml import find_all_textboxes_B, find_all_textnodes, pdf_to_xml_tree
+
+    docs = []
+    for path in pdf_paths:
+        root = pdf_to_xml_tree(path.as_posix())
+        blocks = find_all_textboxes_B(root)
+        texts = ["\n".join("".join(line[1]) for line in linelist) for _, linelist in blocks]
+        docs.append({"path": path, "root": root, "chars": find_all_textnodes(root), "blocks": blocks, "texts": texts})
+    return docs
+
+
+def run_microbenchmarks(pdf_paths, repeat=3, only=None):
+    from src.strategies import contruct_block_html, extract_first_page
+    from src.utils import construct_lines_columns, grouping_text
+    from src.utils.address_util import find_codepostal
+    from src.utils.date_util import get_dates_in_text
+    from src.utils.pdf2xml import find_all_textboxes_B
+
+    docs = _prepare_inputs(pdf_paths)
+    stages = {
+        "construct_lines_columns": lambda: [construct_lines_columns(d["chars"]) for d in docs],
+        "grouping_text": lambda: [grouping_text(d["chars"]) for d in docs],
+        "find_all_textboxes_B": lambda: [find_all_textboxes_B(d["root"]) for d in docs],
+        "contruct_block_html": lambda: [contruct_block_html(linelist) for d in docs for _, linelist in d["blocks"]],
+        "find_codepostal": lambda: [find_codepostal(t) for d in docs for t in d["texts"]],
+        "get_dates_in_text": lambda: [get_dates_in_text(t.lower()) for d in docs for t in d["texts"]],
+        # pdf -> blocks + images of the 1st page, layout analysis vs raw glyph fast path
+        "extract_first_page_layout": lambda: [extract_first_page(d["path"].as_posix(), "layout") for d in docs],
+        "extract_first_page_glyphs": lambda: [extract_first_page(d["path"].as_posix(), "glyphs") for d in docs],
+    }
+    results = {}
+    for name, func in stages.items():
+        if only and name not in only:
+            continue
+        res = timeit(func, repeat)
+        res["per_doc_median"] = res["median"] / len(docs)
+        results[name] = res
+    return results
+
+
+def run_end_to_end(pdf_paths, repeat=3, only=None):
+    import io
+    from src.server_app import flask_app
+    from src.strategies import main_ignore, oth_main
+
+    results = {}
+    if not only or "pdf2xml" in only:
+        client = flask_app().test_client()
+        payloads = [(p.name, p.read_bytes()) for p in pdf_paths]
+
+        def post_all():
+            for name, data in payloads:
+                r = client.post("/pdf2xml", data={"pdf_file": (io.BytesIO(data), name)}, content_type="multipart/form-data")
+                assert r.status_code == 200, r.status_code
+
+        res = timeit(post_all, repeat)
+        res["per_doc_median"] = res["median"] / len(pdf_paths)
+        results["pdf2xml"] = res
+
+    for name, main_func in (("oth_main", oth_main), ("main_ignore", main_ignore)):
+        if only and name not in only:
+            continue
+        with tempfile.TemporaryDirectory(prefix="ccm_bench_") as tmp:
+            in_dir, out_dir = Path(tmp) / "in", Path(tmp) / "out"
+            in_dir.mkdir()
+            out_dir.mkdir()
+            for p in pdf_paths:
+                shutil.copy(p, in_dir / p.name)
+            res = timeit(lambda: main_func(in_dir.as_posix(), out_dir.as_posix(), export_org_xml=False), repeat)
+        res["per_doc_median"] = res["median"] / len(pdf_paths)
+        results[name] = res
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_DIR, stderr=subprocess.DEVNULL).decode().strip()
+    except Exception:
+        return None
+
+
+def compare(current, baseline):
+    """ Print median ratio current/baseline for each benchmark present in both"""
+    print(f"{'benchmark':35} {'baseline':>12} {'current':>12} {'ratio':>8}")
+    for section in ("micro", "end_to_end"):
+        for name, res in current.get(section, {}).items():
+            base = baseline.get(section, {}).get(name)
+            if not base:
+                continue
+            ratio = res["median"] / base["median"] if base["median"] else float("nan")
+            print(f"{section+'.'+name:35} {base['median']:12.4f} {res['median']:12.4f} {ratio:8.2f}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the benchmark suite and write results as json")
+    parser.add_argument("--corpus-dir", help="existing folder of pdf (default: generate a synthetic corpus)")
+    parser.add_argument("--docs", type=int, default=20, help="size of the synthetic corpus")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--only", help="comma separated benchmark names")
+    parser.add_argument("--skip-end-to-end", action="store_true")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--compare", help="previous results json to compare with")
+    args = parser.parse_args()
+    only = set(args.only.split(",")) if args.only else None
+
+    with tempfile.TemporaryDirectory(prefix="ccm_corpus_") as tmp:
+        if args.corpus_dir:
+            pdf_paths = sorted(Path(args.corpus_dir).glob("*.pdf"))
+        else:
+            pdf_paths = [p for p, _ in generate_corpus(tmp, args.docs, args.seed)]
+
+        results = {
+            "meta": {
+                "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                "commit": _git_commit(),
+                "python": platform.python_version(),
+                "platform": platform.platform(),
+                "corpus": args.corpus_dir or {"synthetic_docs": args.docs, "seed": args.seed},
+                "documents": len(pdf_paths),
+            },
+            "micro": run_microbenchmarks(pdf_paths, args.repeat, only),
+        }
+        if not args.skip_end_to_end:
+            results["end_to_end"] = run_end_to_end(pdf_paths, args.repeat, only)
+
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"results written to {args.output}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
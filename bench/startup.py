@@ -0,0 +1,143 @@
+""" Startup budget of the pdf2xml server: cold import time and time to first request.
+
+Each run starts a fresh interpreter, so nothing is served from an already imported module:
+
+- import: `import src.server_app` + flask_app(), and the modules / data loaded by it;
+- ready: server process started -> first successful GET / (what a readiness probe sees);
+- first_pdf2xml: server process started -> first /pdf2xml response (a synthetic one page pdf).
+
+    python bench/startup.py --repeat 5 --output startup.json
+
+Exits with status 1 when a median exceeds its budget or when a module that must stay lazy (numpy, tqdm,
+the postal code dictionary, ...) is loaded at import, so it can gate a build.
+"""
+import os, sys
+
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import argparse
+import json
+import statistics
+import subprocess
+import tempfile
+import time
+import urllib.error
+import urllib.request
+from pathlib import Path
+
+from bench.corpus import generate_corpus
+from bench.loadtest import _free_port, _multipart, _post, server_command
+
+
+# loaded on first use only, never on the startup path of the server
+LAZY_MODULES = ["numpy", "tqdm", "msgpack", "zstandard"]
+
+_IMPORT_PROBE = """
+import json, sys, time
+sys.path.insert(1, {project_dir!r})
+start = time.perf_counter()
+import src.server_app
+src.server_app.flask_app()
+seconds = time.perf_counter() - start
+address_util = vars(sys.modules.get("src.utils.address_util", object))
+print(json.dumps({{"seconds": seconds, "modules": sorted(sys.modules),
+                  "postal_codes_loaded": "CP_VILLE_DICT" in address_util or bool(address_util.get("_cp_ville_dict"))}}))
+"""
+
+
+def measure_import():
+    """ Import of the server in a fresh interpreter
+
+    Returns:
+    ---
+        dict: seconds, lazy modules found loaded
+    """
+    out = subprocess.run([sys.executable, "-c", _IMPORT_PROBE.format(project_dir=PROJECT_DIR)], check=True,
+                         stdout=subprocess.PIPE, cwd=PROJECT_DIR).stdout
+    probe = json.loads(out.decode().strip().splitlines()[-1])
+    loaded = [m for m in LAZY_MODULES if m in probe["modules"]]
+    if probe["postal_codes_loaded"]:
+        loaded.append("address_util.CP_VILLE_DICT")
+    return {"seconds": probe["seconds"], "eager": loaded}
+
+
+def _get(url, timeout):
+    try:
+        with urllib.request.urlopen(url, timeout=timeout) as resp:
+            resp.read()
+            return resp.status
+    except (urllib.error.URLError, OSError):
+        return None
+
+
+def measure_first_request(payload, timeout=60):
+    """ Start the server and time its first responses
+
+    Returns:
+    ---
+        dict: ready (first GET / ok) and first_pdf2xml seconds since the process was started
+    """
+    port = _free_port()
+    url = f"http://127.0.0.1:{port}"
+    start = time.perf_counter()
+    proc = subprocess.Popen(server_command("threaded", port), stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while _get(url + "/", 1) != 200:
+            if proc.poll() is not None:
+                raise RuntimeError(f"server exited with code {proc.returncode}")
+            if time.perf_counter() - start > timeout:
+                raise RuntimeError(f"server not ready after {timeout}s")
+            time.sleep(0.005)
+        ready = time.perf_counter() - start
+        status = _post(url + "/pdf2xml", payload[0], payload[1], timeout)
+        if status != 200:
+            raise RuntimeError(f"/pdf2xml answered {status}")
+        return {"ready": ready, "first_pdf2xml": time.perf_counter() - start}
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def run(repeat, payload):
+    runs = []
+    for _ in range(repeat):
+        run_ = measure_import()
+        run_.update(measure_first_request(payload))
+        runs.append(run_)
+    summary = {name: statistics.median(r[name] for r in runs) for name in ("seconds", "ready", "first_pdf2xml")}
+    summary["import"] = summary.pop("seconds")
+    summary["eager"] = sorted({m for r in runs for m in r["eager"]})
+    return summary, runs
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Measure the cold start of the server against a budget")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--import-budget", type=float, default=1.0, help="seconds, median import + flask_app()")
+    parser.add_argument("--ready-budget", type=float, default=2.0, help="seconds, median start -> first GET /")
+    parser.add_argument("--first-request-budget", type=float, default=3.0,
+                        help="seconds, median start -> first /pdf2xml response")
+    parser.add_argument("--output", help="write the results as json")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory(prefix="ccm_startup_") as tmp:
+        pdf_path = generate_corpus(tmp, 1)[0][0]
+        payload = _multipart(Path(pdf_path).name, Path(pdf_path).read_bytes(), {})
+
+    summary, runs = run(args.repeat, payload)
+    budgets = {"import": args.import_budget, "ready": args.ready_budget, "first_pdf2xml": args.first_request_budget}
+    failures = [f"{name} {summary[name]:.3f}s > {budget:.3f}s" for name, budget in budgets.items()
+                if summary[name] > budget]
+    failures += [f"{m} loaded at import" for m in summary["eager"]]
+
+    for name, budget in budgets.items():
+        print(f"{name:14} {summary[name]:7.3f}s  (budget {budget:.3f}s)")
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump({"summary": summary, "budgets": budgets, "runs": runs}, f, indent=2)
+    if failures:
+        print("startup budget exceeded: " + "; ".join(failures))
+        sys.exit(1)
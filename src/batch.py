@@ -0,0 +1,361 @@
+""" Batch driver for corpus processing (main_ignore / oth_main), with checkpoint / resume and machine
+readable progress.
+
+main_ignore aggregates the 1st pages into agg_struct.xml / template.json. oth_main writes the per document
+outputs and headers_footers.json: the repeating headers / footers of all the pages of each document,
+detected by the worker of the document (under --timeout / --memory-limit), and of the corpus (see
+src/header_footer.py).
+
+    python src/batch.py <input_dir> <output_dir> --workers 4
+    python src/batch.py <input_dir> <output_dir> --outputs structure,template --cache-dir /scratch/raw_xml
+    python src/batch.py <input_dir> <output_dir> --from-raw-xml --cache-dir /scratch/raw_xml   (rerun heuristics only)
+
+Each processed document is appended to <work_dir>/checkpoint.jsonl (its blocks and image hashes, or its
+error) as soon as it is done. Running the same command again skips the documents of the checkpoint, so an
+interrupted run resumes where it stopped; the aggregate structure is computed from the checkpoint.
+
+Progress is written as json lines (stdout by default, see --progress-file):
+    {"event": "start", "total": 1000, "done": 250, "todo": 750, ...}
+    {"event": "document", "docid": "...", "status": "ok"|"error", "seconds": 0.21, "done": 251, "total": 1000,
+     "blocks": 42}
+    {"event": "end", "ok": 998, "errors": 2, "seconds": 812.4, "outputs": {...}}
+"""
+import os, sys
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import argparse
+import json
+import signal
+import time
+import traceback
+from concurrent.futures import FIRST_COMPLETED, wait
+from pathlib import Path
+
+from src.header_footer import HeaderFooterDetector
+from src.strategies import RAW_XML_COMPRESSIONS, StoredImage, analyse_corpus_index, check_raw_xml_compression, \
+                        document_pages, extract_document, index_document, list_documents, new_corpus_index
+from src.template import save_template
+from src.utils.image_writer import IMAGE_WRITER
+from src.utils.worker_pool import DocumentMemoryError, DocumentTimeout, WorkerPool, is_memory_error
+
+
+CHECKPOINT_VERSION = 3  # 2: image hashes from the encoded stream, 3: encoded stream cut to its /Length
+OUTPUTS = {"structure", "template", "blocks_xml", "raw_xml", "images", "headers_footers"}
+DEFAULT_OUTPUTS = "structure,template,blocks_xml,raw_xml,images,headers_footers"
+MODES = {"main_ignore", "oth_main"}
+FSYNC_EVERY = 50  # documents between two fsync of the checkpoint
+
+
+def _document_record(docid, txt_blocks, img_blocks, page_dim, seconds):
+    """ json-able checkpoint record of a document: everything index_document needs"""
+    return {"docid": docid, "status": "ok", "seconds": round(seconds, 4), "page_dim": list(page_dim),
+            "txt_blocks": txt_blocks, "img_blocks": [list(img) for img in img_blocks]}
+
+
+def _index_record(index, record):
+    img_blocks = [StoredImage(tuple(bbox), w, h, hash_) for bbox, w, h, hash_ in record["img_blocks"]]
+    index_document(index, record["docid"], record["txt_blocks"], img_blocks, tuple(record["page_dim"]))
+
+
+def read_checkpoint(path):
+    """ Records of a checkpoint file
+
+    Returns:
+    ---
+        tuple: options of the run that wrote it (or None), {docid: record}. A truncated last line (crash while
+            writing) is ignored.
+
+    Raises:
+    ---
+        ValueError: the checkpoint was written with another CHECKPOINT_VERSION
+    """
+    options, records = None, {}
+    if not Path(path).exists():
+        return options, records
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                continue  # partially written line
+            if "checkpoint" in record:
+                if record["checkpoint"] != CHECKPOINT_VERSION:
+                    raise ValueError(f"checkpoint {path} has version {record['checkpoint']}, not {CHECKPOINT_VERSION}: "
+                                     f"use restart=True (--restart) to start over")
+                options = record["options"]
+            else:
+                records[record["docid"]] = record
+    return options, records
+
+
+def _truncate_partial_line(path):
+    """ Cut a checkpoint after its last newline: a line a crash left unfinished would be joined to the next
+    appended record, and both would be lost"""
+    with open(path, "rb+") as f:
+        end = f.seek(0, os.SEEK_END)
+        pos = end
+        while pos > 0:
+            step = min(4096, pos)
+            f.seek(pos - step)
+            chunk = f.read(step)
+            newline = chunk.rfind(b"\n")
+            if newline >= 0:
+                pos = pos - step + newline + 1
+                break
+            pos -= step
+        if pos < end:
+            f.truncate(pos)
+
+
+def _process_document(args):
+    """ Worker: extract one document (and detect the headers / footers of its pages if headers_footers), errors
+    are returned as records (allocation failures are raised, see utils.worker_pool.is_memory_error)"""
+    docid, path, output_dir, kwargs, headers_footers = args
+    start = time.perf_counter()
+    try:
+        txt_blocks, img_blocks, page_dim = extract_document(docid, path, output_dir, **kwargs)
+        IMAGE_WRITER.flush()  # a document of the checkpoint has its images on disk
+        hf = None
+        if headers_footers:
+            pages = document_pages(docid, path, kwargs["export_org_xml"], kwargs["extraction"], kwargs["from_raw_xml"],
+                                   kwargs["raw_xml_compression"], kwargs["raw_xml_dir"])
+            hf = HeaderFooterDetector().summarise_document(pages)
+        record = _document_record(docid, txt_blocks, img_blocks, page_dim, time.perf_counter() - start)
+        if hf is not None:
+            record["headers_footers"], record["hf_fingerprints"] = hf
+        return record
+    except Exception as e:
+        if is_memory_error(e):
+            raise  # the worker pool replaces the worker and records the document as "memory"
+        return {"docid": docid, "status": "error", "seconds": round(time.perf_counter() - start, 4),
+                "error": f"{type(e).__name__}: {e}", "traceback": traceback.format_exc(limit=5)}
+
+
+def _failure_record(docid, error):
+    """ Record of a document its worker could not process (time / memory limit, crash)"""
+    status = "timeout" if isinstance(error, DocumentTimeout) else "memory" if isinstance(error, DocumentMemoryError) else "error"
+    return {"docid": docid, "status": status, "seconds": round(getattr(error, "seconds", None) or 0, 4),
+            "error": f"{type(error).__name__}: {error}"}
+
+
+def _imap_bounded(pool, func, iterable, window):
+    """ pool.map with at most `window` pending tasks, in completion order
+
+    Yield
+    ---
+        tuple: item, its done future
+    """
+    pending = {}
+    try:
+        for item in iterable:
+            pending[pool.submit(func, item)] = item
+            if len(pending) >= window:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    yield pending.pop(fut), fut
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for fut in done:
+                yield pending.pop(fut), fut
+    finally:
+        for fut in pending:  # interrupted: do not start the queued documents
+            fut.cancel()
+
+
+def run_batch(input_dir, output_dir, mode="main_ignore", workers=1, outputs=DEFAULT_OUTPUTS, cache_dir=None,
+              work_dir=None, extraction="layout", from_raw_xml=False, raw_xml_compression=None, pretty_print=False,
+              retry_errors=False, restart=False, progress=None, decode_images=False, doc_timeout=None,
+              doc_memory_limit=None, max_docs_per_worker=None):
+    """ Process a corpus with checkpointing
+
+    Args:
+    ---
+        input_dir (str): folder of pdf
+        output_dir (str): folder for images, aggregate structure and template
+        mode (str, optional): "main_ignore" (aggregate structure) or "oth_main" (per document outputs and
+            headers_footers.json)
+        workers (int, optional): extraction processes. Defaults to 1 (in process).
+        outputs (str or set, optional): among structure, template, blocks_xml, raw_xml, images, headers_footers
+        cache_dir (str, optional): folder of raw xml / image manifests (written, or read with from_raw_xml).
+            Defaults to the input folder
+        work_dir (str, optional): folder of the checkpoint. Defaults to output_dir/.ccm_batch
+        extraction, from_raw_xml, raw_xml_compression, pretty_print: see strategies.index_corpus
+        retry_errors (bool, optional): process again the documents that failed (error, timeout, memory) in a
+            previous run. Failed documents are recorded and otherwise never retried.
+        restart (bool, optional): ignore (and overwrite) an existing checkpoint
+        progress (callable, optional): progress(event_dict), called for each event
+        decode_images (bool, optional): see strategies.store_images
+        doc_timeout (float, optional): seconds a document may take, see utils.worker_pool
+        doc_memory_limit (int, optional): bytes a document may allocate, see utils.worker_pool
+        max_docs_per_worker (int, optional): documents processed by a worker process before it is replaced
+
+    With workers > 1 or a limit, documents are processed by a utils.worker_pool.WorkerPool, else in process.
+
+    Returns:
+    ---
+        dict: the "end" event
+    """
+    if isinstance(outputs, str):
+        outputs = {o for o in outputs.split(",") if o}
+    unknown = set(outputs) - OUTPUTS
+    if unknown or mode not in MODES:
+        raise ValueError(f"unknown outputs {sorted(unknown)} or mode {mode}")
+    check_raw_xml_compression(raw_xml_compression)
+    progress = progress or (lambda event: None)
+    start = time.perf_counter()
+    output_dir = Path(output_dir)
+    output_dir.mkdir(parents=True, exist_ok=True)
+    work_dir = Path(work_dir or output_dir / ".ccm_batch")
+    work_dir.mkdir(parents=True, exist_ok=True)
+    if cache_dir:
+        Path(cache_dir).mkdir(parents=True, exist_ok=True)
+    checkpoint_path = work_dir / "checkpoint.jsonl"
+
+    # options that change the per document results, a checkpoint can only be resumed with the same ones
+    headers_footers = mode == "oth_main" and "headers_footers" in outputs
+    options = {"input_dir": str(Path(input_dir).resolve()), "extraction": extraction, "from_raw_xml": from_raw_xml,
+               "headers_footers": headers_footers}
+    prev_options, records = (None, {}) if restart else read_checkpoint(checkpoint_path)
+    if records and prev_options != options:
+        raise ValueError(f"checkpoint {checkpoint_path} was written with {prev_options}, not {options}: "
+                         f"use restart=True (--restart) to start over")
+    if retry_errors:
+        records = {docid: r for docid, r in records.items() if r["status"] == "ok"}
+
+    documents = list_documents(input_dir, from_raw_xml, cache_dir)
+    todo = [(docid, path) for docid, path in documents if docid not in records]
+    progress({"event": "start", "total": len(documents), "done": len(documents) - len(todo), "todo": len(todo),
+              "checkpoint": checkpoint_path.as_posix(), "workers": workers})
+
+    doc_kwargs = {"export_org_xml": "raw_xml" in outputs, "pretty_print": pretty_print, "extraction": extraction,
+                  "from_raw_xml": from_raw_xml, "raw_xml_compression": raw_xml_compression, "raw_xml_dir": cache_dir,
+                  "export_blocks": "blocks_xml" in outputs, "decode_images": decode_images}
+    images_dir = output_dir.as_posix() if "images" in outputs else None
+    jobs = ((docid, path, images_dir, doc_kwargs, headers_footers) for docid, path in todo)
+    done = len(documents) - len(todo)
+    if records and not restart:
+        _truncate_partial_line(checkpoint_path)
+    with open(checkpoint_path, "w" if restart or not records else "a", encoding="utf-8") as ckpt:
+        if restart or not records:
+            ckpt.write(json.dumps({"checkpoint": CHECKPOINT_VERSION, "options": options}) + "\n")
+        if workers > 1 or doc_timeout or doc_memory_limit:
+            pool = WorkerPool(workers, doc_timeout, doc_memory_limit, max_docs_per_worker)
+            futures = _imap_bounded(pool, _process_document, jobs, workers * 4)
+            results = (fut.result() if fut.exception() is None else _failure_record(job[0], fut.exception())
+                       for job, fut in futures)
+        else:
+            pool = None
+            results = map(_process_document, jobs)
+        completed = False
+        try:
+            for n, record in enumerate(results, 1):
+                ckpt.write(json.dumps(record, ensure_ascii=False) + "\n")
+                ckpt.flush()
+                if n % FSYNC_EVERY == 0:
+                    os.fsync(ckpt.fileno())
+                records[record["docid"]] = record
+                done += 1
+                event = {"event": "document", "docid": record["docid"], "status": record["status"],
+                         "seconds": record["seconds"], "done": done, "total": len(documents)}
+                if record["status"] == "ok":
+                    event["blocks"] = len(record["txt_blocks"]) + len(record["img_blocks"])
+                else:
+                    event["error"] = record["error"]
+                progress(event)
+            completed = True
+        finally:
+            if pool is not None:
+                futures.close()
+                pool.shutdown(wait=completed)  # interrupted: kill the running documents
+            ckpt.flush()
+            os.fsync(ckpt.fileno())
+
+    # --- aggregate, from the checkpoint (documents of this run and of the previous ones)
+    ok = [records[docid] for docid, _ in documents if docid in records and records[docid]["status"] == "ok"]
+    written = {}
+    if mode == "main_ignore" and ok and outputs & {"structure", "template"}:
+        index = new_corpus_index()
+        for record in ok:
+            _index_record(index, record)
+        out_xml_str, template = analyse_corpus_index(index)
+        if "structure" in outputs:
+            written["structure"] = (output_dir / "agg_struct.xml").as_posix()
+            with open(written["structure"], "wb") as f:
+                f.write(out_xml_str)
+        if "template" in outputs:
+            written["template"] = (output_dir / "template.json").as_posix()
+            save_template(template, written["template"])
+    if headers_footers and ok:
+        # corpus summary in docid order, whatever the order the documents were processed in
+        detector = HeaderFooterDetector()
+        for record in ok:
+            detector.add_fingerprints(record["hf_fingerprints"])
+        written["headers_footers"] = (output_dir / "headers_footers.json").as_posix()
+        with open(written["headers_footers"], "w") as f:
+            json.dump({"documents": {r["docid"]: r["headers_footers"] for r in ok}, "corpus": detector.result()}, f,
+                      ensure_ascii=False, indent=1)
+    end = {"event": "end", "total": len(documents), "ok": len(ok),
+           "errors": sum(1 for r in records.values() if r["status"] != "ok"),
+           "timeouts": sum(1 for r in records.values() if r["status"] == "timeout"),
+           "memory": sum(1 for r in records.values() if r["status"] == "memory"),
+           "seconds": round(time.perf_counter() - start, 3), "outputs": written}
+    progress(end)
+    return end
+
+
+def _interrupt(signum, frame):
+    raise KeyboardInterrupt()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Corpus processing with checkpoint / resume")
+    parser.add_argument("input_dir", help="folder of pdf")
+    parser.add_argument("output_dir", help="folder for images, agg_struct.xml and template.json")
+    parser.add_argument("--mode", default="main_ignore", choices=sorted(MODES))
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--outputs", default=DEFAULT_OUTPUTS, help=f"comma separated, among {','.join(sorted(OUTPUTS))}")
+    parser.add_argument("--cache-dir", help="folder of raw xml and image manifests (default: next to the pdf)")
+    parser.add_argument("--work-dir", help="folder of the checkpoint (default: <output_dir>/.ccm_batch)")
+    parser.add_argument("--extraction", default="layout", choices=["layout", "glyphs"])
+    parser.add_argument("--from-raw-xml", action="store_true", help="rebuild blocks from the raw xml of --cache-dir")
+    parser.add_argument("--raw-xml-compression", choices=RAW_XML_COMPRESSIONS)
+    parser.add_argument("--pretty", action="store_true", help="indent exported xml")
+    parser.add_argument("--decode-images", action="store_true",
+                        help="write decoded samples (.raw) of non jpeg images instead of their encoded stream (.bin)")
+    parser.add_argument("--retry-errors", action="store_true", help="process again the documents that failed")
+    parser.add_argument("--timeout", type=float, help="seconds a document may take, it is then killed and recorded")
+    parser.add_argument("--memory-limit", type=int, help="MB a document may allocate, it is then killed and recorded")
+    parser.add_argument("--max-docs-per-worker", type=int, default=200,
+                        help="documents processed by a worker process before it is replaced")
+    parser.add_argument("--restart", action="store_true", help="ignore the existing checkpoint")
+    parser.add_argument("--progress-file", help="write json progress lines there instead of stdout")
+    args = parser.parse_args(argv)
+
+    progress_out = open(args.progress_file, "a", buffering=1) if args.progress_file else sys.stdout
+
+    def progress(event):
+        event["ts"] = round(time.time(), 3)
+        progress_out.write(json.dumps(event) + "\n")
+        progress_out.flush()
+
+    # preemption (SIGTERM): stop like on ctrl-c, the checkpoint is flushed and the workers are shut down
+    signal.signal(signal.SIGTERM, _interrupt)
+    try:
+        end = run_batch(args.input_dir, args.output_dir, args.mode, args.workers, args.outputs, args.cache_dir,
+                        args.work_dir, args.extraction, args.from_raw_xml, args.raw_xml_compression, args.pretty,
+                        args.retry_errors, args.restart, progress, args.decode_images, args.timeout,
+                        args.memory_limit * 2**20 if args.memory_limit else None, args.max_docs_per_worker)
+    except KeyboardInterrupt:
+        progress({"event": "interrupted"})
+        return 130
+    finally:
+        if progress_out is not sys.stdout:
+            progress_out.close()
+    return 0 if end["errors"] == 0 else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,277 @@
+""" Corpus jobs of the server: the aggregate structure (main_ignore) of an uploaded or referenced corpus,
+computed in the background by src.batch.run_batch, with progress a client can follow.
+
+    jobs = jobs_from_env()
+    job = jobs.submit(input_dir)          # returns at once, the job is queued
+    for snapshot in job.snapshots(0.5):   # {"status", "done", "total", "errors", "blocks", "eta_seconds", ...}
+        ...
+    job.output("structure")               # agg_struct.xml once the job is done
+
+run_batch calls the job for each document only to update a few counters (no I/O, no formatting): clients
+read snapshots of these counters at their own pace, so progress costs the processing loop nothing however
+many clients follow it. Documents are extracted by worker processes (see utils/worker_pool.py).
+"""
+import os, sys
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from src.batch import run_batch
+from src.utils.metrics import Counter, REGISTRY
+
+
+JOB_DIR_ENV = "CCM_JOB_DIR"  # inputs and outputs of the jobs, default <tmp>/ccm_jobs
+CORPUS_DIR_ENV = "CCM_CORPUS_DIR"  # folder of server side corpora, referenced by name
+CORPUS_WORKERS_ENV = "CCM_CORPUS_WORKERS"  # worker processes of a job
+CORPUS_JOBS_ENV = "CCM_CORPUS_JOBS"  # jobs running at the same time, the others are queued
+JOB_TTL_ENV = "CCM_JOB_TTL"  # seconds a finished job and its files are kept
+MAX_CORPUS_MB_ENV = "CCM_MAX_CORPUS_MB"  # uncompressed size of an uploaded corpus zip
+DEFAULT_CORPUS_WORKERS = 2
+DEFAULT_CORPUS_JOBS = 1
+DEFAULT_JOB_TTL = 3600
+DEFAULT_MAX_CORPUS_MB = 2048
+JOB_OUTPUTS = {"structure": "application/xml", "template": "application/json"}  # name -> mimetype
+
+CORPUS_JOBS = REGISTRY.register(Counter(
+    "ccm_corpus_jobs_total", "Corpus jobs, by final status.", ["status"]))
+
+
+def extract_corpus_zip(zip_file, dest_dir, max_bytes):
+    """ Extract the pdf of a zip (any folder level) flat into dest_dir
+
+    Args:
+    ---
+        zip_file (str or file-like)
+        dest_dir (str or Path)
+        max_bytes (int): limit of the uncompressed size of the pdf
+
+    Returns:
+    ---
+        int: number of pdf extracted
+
+    Raises:
+    ---
+        ValueError: not a zip, or its pdf are larger than max_bytes
+    """
+    import zipfile
+    dest_dir = Path(dest_dir)
+    try:
+        archive = zipfile.ZipFile(zip_file)
+    except zipfile.BadZipFile as e:
+        raise ValueError(f"not a zip file: {e}")
+    with archive:
+        members = [m for m in archive.infolist()
+                   if not m.is_dir() and m.filename.lower().endswith(".pdf") and not Path(m.filename).name.startswith(".")]
+        if sum(m.file_size for m in members) > max_bytes:
+            raise ValueError(f"the pdf of the zip are larger than {max_bytes} bytes")
+        names = set()
+        for member in members:
+            # only the base name is kept: no path from the archive is ever used on disk
+            name = Path(member.filename).name
+            stem, n = name[:-4], 1
+            while name.lower() in names:
+                name = f"{stem}_{n}.pdf"
+                n += 1
+            names.add(name.lower())
+            with archive.open(member) as src, open(dest_dir / name, "wb") as dst:
+                shutil.copyfileobj(src, dst, 2**20)
+    return len(names)
+
+
+class CorpusJob:
+    """ One run_batch (main_ignore, outputs structure and template) and its progress"""
+
+    def __init__(self, job_id, input_dir, job_dir, batch_kwargs):
+        self.id = job_id
+        self.input_dir = Path(input_dir)
+        self.job_dir = Path(job_dir)
+        self.output_dir = self.job_dir / "output"
+        self.batch_kwargs = batch_kwargs
+        self.status = "queued"  # queued, running, done, failed
+        self.error = None
+        self.total = None
+        self.done = 0
+        self.errors = 0
+        self.blocks = 0
+        self.outputs = {}
+        self.finished_at = None
+        self.finished = threading.Event()
+        self._lock = threading.Lock()
+        self._version = 0  # incremented on each change
+        self._run_start = None
+        self._done_at_start = 0
+
+    def _on_event(self, event):
+        """ run_batch progress callback, on the processing loop: only counters"""
+        with self._lock:
+            if event["event"] == "start":
+                self.total = event["total"]
+                self.done = self._done_at_start = event["done"]
+                self._run_start = time.perf_counter()
+            elif event["event"] == "document":
+                self.done = event["done"]
+                self.blocks += event.get("blocks", 0)
+                if event["status"] != "ok":
+                    self.errors += 1
+            elif event["event"] == "end":
+                self.outputs = event["outputs"]
+            self._version += 1
+
+    def run(self):
+        with self._lock:
+            self.status = "running"
+            self._version += 1
+        try:
+            run_batch(self.input_dir.as_posix(), self.output_dir.as_posix(), "main_ignore",
+                      outputs={"structure", "template"}, work_dir=(self.job_dir / "work").as_posix(),
+                      progress=self._on_event, **self.batch_kwargs)
+            status, error = "done", None
+        except Exception as e:
+            status, error = "failed", f"{type(e).__name__}: {e}"
+        with self._lock:
+            self.status, self.error = status, error
+            self.finished_at = time.time()
+            self._version += 1
+        CORPUS_JOBS.inc(status=status)
+        self.finished.set()
+
+    def snapshot(self):
+        """ Progress of the job
+
+        Returns:
+        ---
+            dict: id, status, total, done, errors, blocks (indexed so far), docs_per_second, eta_seconds,
+                outputs (names available once done), error (if failed)
+        """
+        with self._lock:
+            snap = {"id": self.id, "status": self.status, "total": self.total, "done": self.done,
+                    "errors": self.errors, "blocks": self.blocks, "docs_per_second": None, "eta_seconds": None,
+                    "outputs": sorted(name for name in JOB_OUTPUTS if name in self.outputs)}
+            if self.error:
+                snap["error"] = self.error
+            processed = self.done - self._done_at_start
+            if self.status == "running" and self._run_start is not None and processed > 0:
+                rate = processed / (time.perf_counter() - self._run_start)
+                snap["docs_per_second"] = round(rate, 3)
+                snap["eta_seconds"] = round((self.total - self.done) / rate, 1)
+        return snap
+
+    def snapshots(self, interval=0.5):
+        """ Yield a snapshot now, then every `interval` seconds if it changed, the last one when the job is finished"""
+        last_version = None
+        while True:
+            finished = self.finished.wait(interval) if last_version is not None else self.finished.is_set()
+            with self._lock:
+                version = self._version
+            if version != last_version:
+                last_version = version
+                yield self.snapshot()
+            if finished:
+                return
+
+    def output(self, name):
+        """ Path of an output ("structure" or "template") of a finished job, None if it was not produced"""
+        path = self.outputs.get(name)
+        return Path(path) if path and self.status == "done" else None
+
+
+class CorpusJobs:
+    """ Jobs of a server: started in the background, `max_running` at a time, removed `ttl` seconds after
+    they finished (with their files)
+    """
+
+    def __init__(self, job_dir=None, max_running=DEFAULT_CORPUS_JOBS, ttl=DEFAULT_JOB_TTL, batch_kwargs=None):
+        self.job_dir = Path(job_dir or Path(tempfile.gettempdir()) / "ccm_jobs")
+        self.ttl = ttl
+        self.batch_kwargs = batch_kwargs or {}
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_running, thread_name_prefix="ccm-corpus-job")
+
+    def new_job_dir(self):
+        """ Folder for a new job (its uploaded input goes to <dir>/input)
+
+        Returns:
+        ---
+            tuple: job id, folder
+        """
+        job_id = uuid.uuid4().hex
+        job_dir = self.job_dir / job_id
+        (job_dir / "input").mkdir(parents=True)
+        return job_id, job_dir
+
+    def submit(self, input_dir, job_id=None, job_dir=None, **batch_kwargs):
+        """ Queue a job on a folder of pdf
+
+        Args:
+        ---
+            input_dir (str or Path): folder of pdf (uploaded in job_dir/input, or server side)
+            job_id, job_dir: from new_job_dir, created if not given
+            batch_kwargs: extraction, doc_timeout...: see batch.run_batch, override the ones of the manager
+
+        Returns:
+        ---
+            CorpusJob
+        """
+        self._purge()
+        if job_id is None:
+            job_id, job_dir = self.new_job_dir()
+        job = CorpusJob(job_id, input_dir, job_dir, dict(self.batch_kwargs, **batch_kwargs))
+        with self._lock:
+            self._jobs[job_id] = job
+        self._executor.submit(job.run)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def _purge(self):
+        now = time.time()
+        with self._lock:
+            expired = [job for job in self._jobs.values()
+                       if job.finished_at is not None and now - job.finished_at > self.ttl]
+            for job in expired:
+                del self._jobs[job.id]
+        for job in expired:
+            shutil.rmtree(job.job_dir, ignore_errors=True)
+
+
+def jobs_from_env(**batch_kwargs):
+    """ CorpusJobs configured by the CCM_JOB_* / CCM_CORPUS_* environment
+
+    Args:
+    ---
+        batch_kwargs: default run_batch arguments of the jobs (doc_timeout, doc_memory_limit...)
+    """
+    batch_kwargs.setdefault("workers", int(os.environ.get(CORPUS_WORKERS_ENV, DEFAULT_CORPUS_WORKERS)))
+    return CorpusJobs(os.environ.get(JOB_DIR_ENV), int(os.environ.get(CORPUS_JOBS_ENV, DEFAULT_CORPUS_JOBS)),
+                      float(os.environ.get(JOB_TTL_ENV, DEFAULT_JOB_TTL)), batch_kwargs)
+
+
+def corpus_path(name):
+    """ Folder of a server side corpus: <CCM_CORPUS_DIR>/<name>
+
+    Raises:
+    ---
+        FileNotFoundError: CCM_CORPUS_DIR is not set or has no such folder
+        ValueError: name is not a plain folder name
+    """
+    corpus_dir = os.environ.get(CORPUS_DIR_ENV)
+    if not corpus_dir:
+        raise FileNotFoundError(f"{CORPUS_DIR_ENV} is not set")
+    if not name or name != Path(name).name or name.startswith("."):
+        raise ValueError(f"invalid corpus name {name!r}")
+    path = Path(corpus_dir) / name
+    if not path.is_dir():
+        raise FileNotFoundError(f"corpus {name!r} not found")
+    return path
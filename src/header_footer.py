@@ -0,0 +1,187 @@
+""" Headers and footers of multi-page documents, detected page by page with bounded memory.
+
+Pages are read one at a time (see strategies.iter_document_pages): only the blocks of the top and bottom
+bands of a page are kept, as fingerprints "zone:text hash:x:distance to the edge" (text normalised as
+utils/minhash.normalize_text: "Page 3 / 12" and "Page 4 / 12" have the same fingerprint, positions
+quantized). Fingerprints are counted in Misra-Gries summaries of a fixed number of counters, so a
+document of 10 000 pages costs the same memory as a document of 10 pages:
+
+- in a document, a fingerprint found on at least min_page_ratio of its pages (2 pages at least) is a
+  repeating header / footer;
+- in a corpus, a fingerprint kept by the summaries of at least min_doc_ratio of the documents is a
+  header / footer shared by the documents (single page documents included).
+
+    detector = HeaderFooterDetector()
+    for docid, path in documents:
+        doc = detector.add_document(iter_document_pages(path))   # {"pages", "header", "footer"}
+    corpus = detector.result()                                           # {"documents", "header", "footer"}
+
+Documents can be processed elsewhere (batch workers): summarise_document there, add_fingerprints of each
+document here, in a fixed order.
+"""
+import os, sys
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import math
+
+from src.utils import sha256_hash_str
+from src.utils.minhash import normalize_text
+
+
+HEADER_BAND = 0.12  # fraction of the page height, at the top (header) and at the bottom (footer)
+POSITION_QUANTUM = 4  # points
+MIN_PAGE_RATIO = 0.5
+MIN_DOC_RATIO = 0.5
+MAX_CANDIDATES = 64  # counters of a summary
+
+
+def block_fingerprint(bbox, text, page_dim, band=HEADER_BAND, quantum=POSITION_QUANTUM):
+    """ Fingerprint of a block of the top or bottom band of its page
+
+    Args:
+    ---
+        bbox (tuple): (x0, y0, x1, y1), y=0 at the bottom of the page
+        text (str): text of the block
+        page_dim (tuple): (pageW, pageH)
+        band (float, optional): height of the bands, as a fraction of the page height
+        quantum (float, optional): position step, in points
+
+    Returns:
+    ---
+        str: "header|footer:hash:x:distance", None for a block outside the bands or without text
+    """
+    _, pageH = page_dim
+    x0, y0, _, y1 = bbox
+    if y0 >= pageH * (1 - band):
+        zone, distance = "header", pageH - y1  # from the top: pages of different heights
+    elif y1 <= pageH * band:
+        zone, distance = "footer", y0
+    else:
+        return None
+    key = normalize_text(text)
+    if not key:
+        return None
+    return f"{zone}:{sha256_hash_str(key)[:16]}:{round(x0 / quantum)}:{round(distance / quantum)}"
+
+
+class HeavyHitters:
+    """ Misra-Gries summary: at most `capacity` counters, every key seen more than n / (capacity + 1) times
+    out of n is kept, a count is under-estimated by at most n / (capacity + 1). Each key keeps the sample
+    given when its counter was created.
+    """
+
+    def __init__(self, capacity=MAX_CANDIDATES):
+        self.capacity = capacity
+        self.n = 0
+        self.counts = {}
+        self.samples = {}
+
+    def add(self, key, sample=None):
+        self.n += 1
+        if key in self.counts:
+            self.counts[key] += 1
+        elif len(self.counts) < self.capacity:
+            self.counts[key] = 1
+            self.samples[key] = sample
+        else:
+            for k in list(self.counts):
+                self.counts[k] -= 1
+                if not self.counts[k]:
+                    del self.counts[k]
+                    del self.samples[k]
+
+    def frequent(self, min_count):
+        """ [(key, count, sample)] of the keys counted at least min_count times, most frequent first"""
+        return sorted(((k, c, self.samples[k]) for k, c in self.counts.items() if c >= min_count),
+                      key=lambda item: (-item[1], item[0]))
+
+
+def _by_zone(frequent, count_name):
+    out = {"header": [], "footer": []}
+    for key, count, (text, bbox) in frequent:
+        out[key.split(":", 1)[0]].append({"text": text, "bbox": bbox, count_name: count})
+    return out
+
+
+class HeaderFooterDetector:
+    """ Repeating header / footer blocks of the pages of each document, and of the documents of a corpus
+
+    Args:
+    ---
+        band, quantum: see block_fingerprint
+        min_page_ratio (float, optional): fraction of the pages of a document a header / footer is found on
+        min_doc_ratio (float, optional): fraction of the documents a corpus header / footer is found in
+        capacity (int, optional): counters of the summary of a document (the corpus has 4 times more)
+    """
+
+    def __init__(self, band=HEADER_BAND, quantum=POSITION_QUANTUM, min_page_ratio=MIN_PAGE_RATIO,
+                 min_doc_ratio=MIN_DOC_RATIO, capacity=MAX_CANDIDATES):
+        self.band = band
+        self.quantum = quantum
+        self.min_page_ratio = min_page_ratio
+        self.min_doc_ratio = min_doc_ratio
+        self.capacity = capacity
+        self.documents = HeavyHitters(capacity * 4)  # fingerprint -> documents
+        self.n_documents = 0
+
+    def add_document(self, pages):
+        """ Detect the headers / footers of a document and add it to the corpus, see summarise_document
+
+        Returns:
+        ---
+            dict: {"pages": n, "header": [{"text", "bbox", "pages"}], "footer": [...]}
+        """
+        result, fingerprints = self.summarise_document(pages)
+        self.add_fingerprints(fingerprints)
+        return result
+
+    def summarise_document(self, pages):
+        """ Detect the headers / footers of a document, pages are consumed one by one. The corpus is unchanged.
+
+        Args:
+        ---
+            pages (iterable): (page_dim, txt_blocks [(bbox, line_list)]) of each page, see
+                strategies.iter_document_pages
+
+        Returns:
+        ---
+            tuple: {"pages": n, "header": [{"text", "bbox", "pages"}], "footer": [...]} (text and bbox of the
+                first page the block was found on), {fingerprint: [text, bbox]} kept by the summary of the
+                document (json-able, for add_fingerprints)
+        """
+        summary = HeavyHitters(self.capacity)
+        n_pages = 0
+        for page_dim, txt_blocks in pages:
+            n_pages += 1
+            seen = set()  # a fingerprint counts once per page
+            for b_bbox, linelist in txt_blocks:
+                text = "\n".join("".join(line[1]) for line in linelist)
+                fingerprint = block_fingerprint(b_bbox, text, page_dim, self.band, self.quantum)
+                if fingerprint is not None and fingerprint not in seen:
+                    seen.add(fingerprint)
+                    summary.add(fingerprint, [text, ",".join(str(v) for v in b_bbox)])
+        min_pages = max(2, math.ceil(self.min_page_ratio * n_pages))
+        result = _by_zone(summary.frequent(min_pages), "pages")
+        result["pages"] = n_pages
+        return result, {fingerprint: summary.samples[fingerprint] for fingerprint in summary.counts}
+
+    def add_fingerprints(self, fingerprints):
+        """ Add a document to the corpus, from the fingerprints of summarise_document"""
+        self.n_documents += 1
+        for fingerprint, sample in fingerprints.items():
+            self.documents.add(fingerprint, sample)
+
+    def result(self):
+        """ Headers / footers shared by the documents added so far
+
+        Returns:
+        ---
+            dict: {"documents": n, "header": [{"text", "bbox", "documents"}], "footer": [...]}
+        """
+        min_docs = max(2, math.ceil(self.min_doc_ratio * self.n_documents))
+        result = _by_zone(self.documents.frequent(min_docs), "documents")
+        result["documents"] = self.n_documents
+        return result
@@ -3,17 +3,19 @@
 from __future__ import print_function
 from __future__ import division
 
-from flask import Flask, jsonify, request, send_file
+from flask import Flask, Request, Response, current_app, g, jsonify, request, send_file
+from contextlib import nullcontext
 from pathlib import Path
-from lxml import etree 
 
 import sys
 import os
 import time
+import uuid
 import tempfile
-import traceback
 import io
+import json
 import shutil
+import threading
 import zipfile
 
 this_dir = os.path.dirname(os.path.abspath(__file__))
@@ -21,17 +23,200 @@ project_dir = '/'.join(this_dir.split('/')[:-1])
 if project_dir not in sys.path:
     sys.path.insert(1, project_dir)
 
-from src.utils.pdf2xml import find_all_images_in_document, find_all_textboxes_B, pdf_to_xml_tree
-from src.strategies import export_to_my_xml
+from src.utils.pdf2xml import find_all_images_in_document, find_all_textboxes_B, find_all_textboxes_glyphs, \
+                        pdf_to_xml_tree, write_raw_xml
+from src.utils.pdf2xml import count_glyphs
+from src.utils.metrics import CONTENT_TYPE, DOCUMENT_GLYPHS, DOCUMENT_PAGES, OUTPUT_BYTES, REGISTRY, REQUEST_SECONDS, \
+                        REQUESTS_IN_FLIGHT, REQUESTS_TOTAL, stage_timer
+from src.utils.response_cache import cache_from_env, cache_key
+from src.utils.pdf_backends import DEFAULT_PDF_BACKEND, PDF_BACKEND_ENV
+from src.corpus_jobs import DEFAULT_MAX_CORPUS_MB, JOB_OUTPUTS, MAX_CORPUS_MB_ENV, corpus_path, extract_corpus_zip, \
+                        jobs_from_env
+from src.utils.uploads import DEFAULT_UPLOAD_MAX_MB, DEFAULT_UPLOAD_SPOOL_MB, UPLOAD_MAX_MB_ENV, UPLOAD_SPOOL_MB_ENV, \
+                        SpooledUpload
+from src.utils.profiling import PROFILE_DIR_ENV, PROFILE_HEADER, DocumentProfile, is_profiling_requested
+from src.strategies import export_to_my_json, export_to_my_msgpack, export_to_my_xml
+from src.template import TEMPLATE_VERSION, load_template, match_pdf, template_path
+from src.utils.worker_pool import PRELOAD, DocumentMemoryError, DocumentTimeout, WorkerError, WorkerPool
 
 
 HEADERS = {'Content-type': 'application/json', 'Accept': 'text/plain'}
+ARTIFACTS = {"both", "blocks", "raw"}
+EXTRACTIONS = {"layout", "glyphs"}
+BLOCKS_EXPORTERS = {"xml": export_to_my_xml, "json": export_to_my_json, "msgpack": export_to_my_msgpack}
+COMPRESSIONS = {"stored": zipfile.ZIP_STORED, "deflate": zipfile.ZIP_DEFLATED}
+TEMPLATE_DIR_ENV = "CCM_TEMPLATE_DIR"  # folder of compiled templates (<name>.json) for /match
+# per document limits: when a timeout or a memory limit is set, documents are processed in worker processes
+DOC_TIMEOUT_ENV = "CCM_DOC_TIMEOUT"  # seconds
+DOC_MEMORY_ENV = "CCM_DOC_MEMORY_MB"
+DOC_WORKERS_ENV = "CCM_DOC_WORKERS"  # number of worker processes, default 2
+WORKER_MAX_DOCS_ENV = "CCM_WORKER_MAX_DOCS"  # documents before a worker is replaced, default 200
+PROGRESS_INTERVAL_ENV = "CCM_PROGRESS_INTERVAL"  # seconds between two progress events of /corpus/<id>/events
 
+_templates = {}  # path -> (mtime, template), templates are loaded once and reloaded when the file changes
+_templates_lock = threading.Lock()
 
+_document_pool = None
+_document_pool_lock = threading.Lock()
+
+
+
+
+def _save_profile(profile:DocumentProfile, zip_data:io.BytesIO):
+    """ Write profile to CCM_PROFILE_DIR if configured, else append it to the response zip"""
+    profile_dir = os.environ.get(PROFILE_DIR_ENV)
+    if profile_dir:
+        profile.write(profile_dir)
+    else:
+        with zipfile.ZipFile(zip_data, mode='a') as z:
+            z.writestr("profile/"+profile.name+".prof", profile.prof_bytes())
+            z.writestr("profile/"+profile.name+".timings.json", profile.timings_bytes())
+
+
+def _get_template(name):
+    """ Compiled template <name> from CCM_TEMPLATE_DIR (cached)"""
+    template_dir = os.environ.get(TEMPLATE_DIR_ENV)
+    if not template_dir:
+        raise FileNotFoundError(f"{TEMPLATE_DIR_ENV} is not set")
+    path = template_path(template_dir, name)
+    mtime = path.stat().st_mtime
+    with _templates_lock:
+        cached = _templates.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+    template = load_template(path)
+    with _templates_lock:
+        _templates[path] = (mtime, template)
+    return template
+
+
+def _get_document_pool():
+    """ WorkerPool configured from the CCM_DOC_* environment, None if no limit is set"""
+    global _document_pool
+    timeout = os.environ.get(DOC_TIMEOUT_ENV)
+    memory_mb = os.environ.get(DOC_MEMORY_ENV)
+    if not timeout and not memory_mb:
+        return None
+    with _document_pool_lock:
+        if _document_pool is None:
+            _document_pool = WorkerPool(int(os.environ.get(DOC_WORKERS_ENV, 2)), float(timeout) if timeout else None,
+                                        int(memory_mb) * 2**20 if memory_mb else None,
+                                        int(os.environ.get(WORKER_MAX_DOCS_ENV, 200)),
+                                        preload=PRELOAD + ["src.server_app"])
+    return _document_pool
+
+
+def _run_document(func, *args):
+    """ func(*args) in a worker process if per document limits are configured, else in this thread"""
+    pool = _get_document_pool()
+    if pool is None:
+        return func(*args)
+    return pool.run(func, *args)
+
+
+def _pdf2xml_zip(pdf_path, pdf_stem, extraction, artifacts, blocks_format, compression, compresslevel, pretty_print,
+                 profile_name=None):
+    """ Outputs of /pdf2xml for one pdf
+
+    Returns:
+    ---
+        tuple: zip (bytes), document stats {"pages", "glyphs"}
+    """
+    profile = DocumentProfile(profile_name) if profile_name else None
+    # --- outputs are streamed straight into the zip entries
+    # the "zip" stage includes the stages streamed into it
+    data = io.BytesIO()
+    doc_stats = {}
+    with stage_timer("zip"), \
+        zipfile.ZipFile(data, mode='w', compression=COMPRESSIONS[compression], compresslevel=compresslevel) as z, \
+        (profile if profile is not None else nullcontext()):
+        if extraction == "glyphs":
+            txt_blocks, img_blocks, _ = find_all_textboxes_glyphs(pdf_path)
+            doc_stats = {"pages": 1, "glyphs": sum(len(line[1]) for _, linelist in txt_blocks for line in linelist)}
+        elif artifacts in ("both", "raw"):
+            # --- save pdfminer_xml, only the 1st page is kept in memory for blocks
+            with z.open(pdf_stem+".raw.xml", mode="w") as raw_file:
+                root = write_raw_xml(pdf_path, raw_file, pretty_print=pretty_print, stats=doc_stats)
+        else:
+            root = pdf_to_xml_tree(pdf_path, maxpages=1)
+            doc_stats = {"pages": len(root), "glyphs": count_glyphs(root)}
+
+        if artifacts in ("both", "blocks"):
+            # --- save my xml
+            if extraction == "layout":
+                txt_blocks = find_all_textboxes_B(root)  # list of (bbox, [ (linebbox,linetxt) ])
+                img_blocks = find_all_images_in_document(pdf_path,first_page=True)  # [ LTImage ]
+                if img_blocks:
+                    img_blocks = img_blocks[0]  #
+            with z.open(pdf_stem+".blocks."+blocks_format, mode="w") as blocks_file:
+                if blocks_format == "xml":
+                    export_to_my_xml(txt_blocks, img_blocks, blocks_file, pretty_print=pretty_print)
+                else:
+                    BLOCKS_EXPORTERS[blocks_format](txt_blocks, img_blocks, blocks_file)
+    if profile is not None:
+        _save_profile(profile, data)
+    return data.getvalue(), doc_stats
+
+
+def _limit_error_response(e):
+    """ Response of a document its worker could not process"""
+    if isinstance(e, (DocumentTimeout, DocumentMemoryError)):
+        return jsonify({'error': 'document limit exceeded','desc':str(e)}), 422
+    return jsonify({'error': 'document processing failed','desc':str(e)}), 500
+
+
+class UploadRequest(Request):
+    """ Uploaded files are SpooledUpload: hashed as they stream in, spilled to disk above UPLOAD_SPOOL_BYTES"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return SpooledUpload(current_app.config["UPLOAD_SPOOL_BYTES"])
 
 
 def flask_app():
     app_ = Flask(__name__)
+    app_.request_class = UploadRequest
+    app_.config["UPLOAD_SPOOL_BYTES"] = int(float(os.environ.get(UPLOAD_SPOOL_MB_ENV, DEFAULT_UPLOAD_SPOOL_MB)) * 2**20)
+    # larger bodies are refused with 413 from their Content-Length, before being read (0 = no limit)
+    max_upload_mb = float(os.environ.get(UPLOAD_MAX_MB_ENV, DEFAULT_UPLOAD_MAX_MB))
+    app_.config["MAX_CONTENT_LENGTH"] = int(max_upload_mb * 2**20) if max_upload_mb > 0 else None
+    response_cache = cache_from_env()  # /pdf2xml results by upload hash, see utils/response_cache.py
+    doc_timeout, doc_memory_mb = os.environ.get(DOC_TIMEOUT_ENV), os.environ.get(DOC_MEMORY_ENV)
+    corpus_jobs = jobs_from_env(doc_timeout=float(doc_timeout) if doc_timeout else None,
+                                doc_memory_limit=int(doc_memory_mb) * 2**20 if doc_memory_mb else None,
+                                max_docs_per_worker=int(os.environ.get(WORKER_MAX_DOCS_ENV, 200)))
+
+    def _endpoint_label():
+        # route pattern rather than raw path, to keep label cardinality bounded
+        return request.url_rule.rule if request.url_rule is not None else "unmatched"
+
+    @app_.before_request
+    def start_request_metrics():
+        g.request_start = time.perf_counter()
+        g.endpoint_label = _endpoint_label()
+        REQUESTS_IN_FLIGHT.inc(endpoint=g.endpoint_label)
+
+    @app_.after_request
+    def observe_request_metrics(response):
+        if "request_start" in g:
+            status = str(response.status_code)
+            REQUESTS_TOTAL.inc(endpoint=g.endpoint_label, status=status)
+            REQUEST_SECONDS.observe(time.perf_counter() - g.request_start, endpoint=g.endpoint_label, status=status)
+        return response
+
+    @app_.teardown_request
+    def end_request_metrics(exc):
+        if "request_start" in g:
+            REQUESTS_IN_FLIGHT.dec(endpoint=g.endpoint_label)
+
+    @app_.errorhandler(413)
+    def upload_too_large(e):
+        return jsonify({'error': 'upload too large',
+                        'desc': f'request body is limited to {current_app.config["MAX_CONTENT_LENGTH"]} bytes'}), 413
+
+    @app_.route('/metrics', methods=['GET'])
+    def metrics():
+        """ Prometheus text exposition of process metrics"""
+        return Response(REGISTRY.render(), content_type=CONTENT_TYPE)
 
     @app_.route('/', methods=['GET'])
     def server_is_up():
@@ -42,78 +227,262 @@ def flask_app():
     @app_.route('/pdf2xml', methods=['POST'])
     def export_xml_from_pdf():
         """ 
+        Params
+        ------
+            pdf_file: the pdf
+            profile (optional): profiling token (or X-CCM-Profile header), see utils/profiling.py
+            extraction (optional): "layout" (default, pdfminer layout analysis) or "glyphs" (fast path, blocks only)
+            artifacts (optional): "both" (default), "blocks" or "raw"
+            format (optional): format of blocks output, "xml" (default), "json" or "msgpack"
+            compression (optional): "stored" (default) or "deflate"
+            compresslevel (optional): deflate level, 0-9
+            pretty (optional): "true" to indent xml outputs, compact by default
+
         Returns
         -------
-            zip
+            zip, with a weak ETag (hash of the upload and options, If-None-Match gives 304) and X-Cache
+            (HIT, DISK, COALESCED or MISS) when the response cache is enabled. Profiled requests are not cached.
+            413 if the request body is larger than CCM_MAX_UPLOAD_MB.
         """
         # to_predict = request.json
         if not 'pdf_file' in request.files:
             return jsonify({'error': 'no PDF file','desc':'PDF file must be provided with \'pdf_file\' parameter'}), 400
 
+        extraction = request.values.get("extraction", "layout").lower()
+        if extraction not in EXTRACTIONS:
+            return jsonify({'error': 'bad parameter','desc':f'extraction must be one of {sorted(EXTRACTIONS)}'}), 400
+        # raw pdfminer xml only exists with layout analysis
+        artifacts = request.values.get("artifacts", "both" if extraction == "layout" else "blocks").lower()
+        if extraction == "glyphs" and artifacts != "blocks":
+            return jsonify({'error': 'bad parameter','desc':'extraction=glyphs only produces artifacts=blocks'}), 400
+        blocks_format = request.values.get("format", "xml").lower()
+        compression = request.values.get("compression", "stored").lower()
+        compresslevel = request.values.get("compresslevel")
+        pretty_print = request.values.get("pretty", "false").lower() in ("1", "true", "yes")
+        if artifacts not in ARTIFACTS:
+            return jsonify({'error': 'bad parameter','desc':f'artifacts must be one of {sorted(ARTIFACTS)}'}), 400
+        if blocks_format not in BLOCKS_EXPORTERS:
+            return jsonify({'error': 'bad parameter','desc':f'format must be one of {sorted(BLOCKS_EXPORTERS)}'}), 400
+        if compression not in COMPRESSIONS:
+            return jsonify({'error': 'bad parameter','desc':f'compression must be one of {sorted(COMPRESSIONS)}'}), 400
+        if compresslevel is not None:
+            if not compresslevel.isdigit() or int(compresslevel) > 9:
+                return jsonify({'error': 'bad parameter','desc':'compresslevel must be an integer between 0 and 9'}), 400
+            compresslevel = int(compresslevel)
+
+        profile_name = None
+        if is_profiling_requested(request.headers.get(PROFILE_HEADER) or request.args.get("profile")):
+            profile_name = Path(request.files['pdf_file'].filename or "document").stem + "_" + uuid.uuid4().hex[:8]
+
         pdf_file = request.files.get('pdf_file')
-        pdf_data = pdf_file.read()
-        if not pdf_data:
+        upload:SpooledUpload = pdf_file.stream
+        if not upload.size:
             return jsonify({'error': 'no PDF file','desc':'PDF file is empty'}), 400
 
-        pdf_name_org = pdf_file.filename
-        timestamp = str(int(time.time()))
-        pdf_name = timestamp+"_"+pdf_name_org
-        tmpdir = Path(tempfile.gettempdir()) / ("ccm_" + timestamp)
-        if not tmpdir.exists():
-            tmpdir.mkdir(parents=True, exist_ok=True)
-        output_dir = tmpdir / "output"
-        if not output_dir.exists():
-            output_dir.mkdir(parents=True, exist_ok=True)
-        
-        # -- save pdf to disk
-        pdf_path:Path = tmpdir / pdf_name
-        with pdf_path.open("wb") as f:
-            f.write(pdf_data)
-        
-        # --- save pdfminer_xml
-        root = pdf_to_xml_tree(pdf_path.as_posix())
-        pdfminer_xml_path = output_dir / (pdf_name_org[:-4]+".raw.xml")
-        doc = etree.ElementTree(root)
-        etree.indent(doc, space="    ")
-        with open(pdfminer_xml_path, 'wb') as outFile:
-            doc.write(outFile, xml_declaration=True, encoding='utf-8',pretty_print=True)
-
-        # --- save my xml
-        my_xml_path = output_dir / (pdf_name_org[:-4]+".blocks.xml")
-        txt_blocks = find_all_textboxes_B(root)  # list of (bbox, [ (linebbox,linetxt) ])
-        img_blocks = find_all_images_in_document(pdf_path.as_posix(),first_page=True)  # [ LTImage ]
-        if img_blocks:
-            img_blocks = img_blocks[0]  #
-        export_to_my_xml(txt_blocks, img_blocks, my_xml_path)
-
-        # --- zip output folder
-        data = io.BytesIO()
-        with zipfile.ZipFile(data, mode='w') as z:
-
-            z.write(my_xml_path,my_xml_path.name)
-            z.write(pdfminer_xml_path,pdfminer_xml_path.name)
-        data.seek(0)
-
-        # --- delete temp dir
-        try:
-            shutil.rmtree(tmpdir.as_posix())
-        except:
-            traceback.print_exc()
+        pdf_stem = Path(pdf_file.filename or "document.pdf").stem
 
+        def compute():
+            # each request works in its own unique directory, removed on exit,
+            # so concurrent requests never share files
+            with tempfile.TemporaryDirectory(prefix="ccm_") as tmpdir:
+                # -- pdf on disk: the spooled upload itself, or written from memory
+                pdf_path = upload.save_pdf(tmpdir)
+                zip_bytes, doc_stats = _run_document(_pdf2xml_zip, pdf_path, pdf_stem, extraction, artifacts,
+                                                     blocks_format, compression, compresslevel, pretty_print, profile_name)
+            DOCUMENT_PAGES.observe(doc_stats.get("pages", 0))
+            DOCUMENT_GLYPHS.observe(doc_stats.get("glyphs", 0))
+            return zip_bytes
+
+        key = None
+        if response_cache is not None and profile_name is None:
+            options = {"stem": pdf_stem, "extraction": extraction, "artifacts": artifacts, "format": blocks_format,
+                       "compression": compression, "compresslevel": compresslevel, "pretty": pretty_print}
+            if extraction == "glyphs":
+                options["backend"] = os.environ.get(PDF_BACKEND_ENV) or DEFAULT_PDF_BACKEND
+            key = cache_key(upload.hexdigest(), options)
+            if request.if_none_match.contains_weak(key):
+                not_modified = Response(status=304)
+                not_modified.set_etag(key, weak=True)
+                return not_modified
+        try:
+            if key is not None:
+                zip_bytes, cache_status = response_cache.get_or_compute(key, compute)
+            else:
+                zip_bytes = compute()
+        except WorkerError as e:
+            return _limit_error_response(e)
 
-        return send_file(
-            data,
+        OUTPUT_BYTES.observe(len(zip_bytes), endpoint=g.endpoint_label)
+        response = send_file(
+            io.BytesIO(zip_bytes),
             mimetype='application/zip',
             as_attachment=True,
             download_name='results.zip'
         )
+        if key is not None:
+            response.set_etag(key, weak=True)
+            response.headers["X-Cache"] = cache_status.upper()
+        return response
+
+    @app_.route('/match', methods=['POST'])
+    def match_pdf_to_template():
+        """ Classify the blocks of one pdf (1st page) against a compiled corpus template, see src/template.py
+
+        Params
+        ------
+            pdf_file: the pdf
+            template: name of a template in CCM_TEMPLATE_DIR, or
+            template_file: uploaded template json
+            extraction (optional): "layout" (default) or "glyphs"
+
+        Returns
+        -------
+            json: {"blocks": [..], "missing": [..], "universal_found", "universal_expected", "score"}
+        """
+        if not 'pdf_file' in request.files:
+            return jsonify({'error': 'no PDF file','desc':'PDF file must be provided with \'pdf_file\' parameter'}), 400
+        extraction = request.values.get("extraction", "layout").lower()
+        if extraction not in EXTRACTIONS:
+            return jsonify({'error': 'bad parameter','desc':f'extraction must be one of {sorted(EXTRACTIONS)}'}), 400
+        if 'template_file' in request.files:
+            try:
+                template = json.load(request.files['template_file'])
+            except ValueError:
+                return jsonify({'error': 'bad parameter','desc':'template_file is not valid json'}), 400
+            if not isinstance(template, dict) or template.get("version") != TEMPLATE_VERSION:
+                return jsonify({'error': 'bad parameter','desc':f'template_file must be a version {TEMPLATE_VERSION} template'}), 400
+        elif request.values.get("template"):
+            try:
+                template = _get_template(request.values["template"])
+            except ValueError as e:
+                return jsonify({'error': 'bad parameter','desc':str(e)}), 400
+            except FileNotFoundError:
+                return jsonify({'error': 'unknown template','desc':f'template {request.values["template"]!r} not found'}), 404
+        else:
+            return jsonify({'error': 'no template','desc':'provide \'template\' (name) or \'template_file\''}), 400
+
+        with tempfile.TemporaryDirectory(prefix="ccm_") as workdir:
+            pdf_path = request.files['pdf_file'].stream.save_pdf(workdir)
+            try:
+                with stage_timer("match"):
+                    result = _run_document(match_pdf, template, pdf_path, extraction)
+            except WorkerError as e:
+                return _limit_error_response(e)
+        return jsonify(result)
+
+    @app_.route('/corpus', methods=['POST'])
+    def start_corpus_job():
+        """ Compute the aggregate structure of a corpus in the background, see src/corpus_jobs.py
+
+        Params
+        ------
+            corpus_zip: zip of the pdf, or
+            pdf_file: the pdf (repeated), or
+            corpus: name of a folder of CCM_CORPUS_DIR
+            extraction (optional): "layout" (default) or "glyphs"
+
+        Returns
+        -------
+            202, json: {"id", "status", "events" (server-sent events url), "structure", "template" (urls of the outputs)}
+        """
+        extraction = request.values.get("extraction", "layout").lower()
+        if extraction not in EXTRACTIONS:
+            return jsonify({'error': 'bad parameter','desc':f'extraction must be one of {sorted(EXTRACTIONS)}'}), 400
+        if request.values.get("corpus"):
+            try:
+                job = corpus_jobs.submit(corpus_path(request.values["corpus"]), extraction=extraction)
+            except ValueError as e:
+                return jsonify({'error': 'bad parameter','desc':str(e)}), 400
+            except FileNotFoundError as e:
+                return jsonify({'error': 'unknown corpus','desc':str(e)}), 404
+        else:
+            if 'corpus_zip' not in request.files and 'pdf_file' not in request.files:
+                return jsonify({'error': 'no corpus','desc':'provide \'corpus_zip\', \'pdf_file\' (repeated) or \'corpus\''}), 400
+            job_id, job_dir = corpus_jobs.new_job_dir()
+            input_dir = job_dir / "input"
+            try:
+                if 'corpus_zip' in request.files:
+                    max_bytes = int(float(os.environ.get(MAX_CORPUS_MB_ENV, DEFAULT_MAX_CORPUS_MB)) * 2**20)
+                    n_docs = extract_corpus_zip(request.files['corpus_zip'].stream, input_dir, max_bytes)
+                else:
+                    names = set()
+                    for pdf_file in request.files.getlist('pdf_file'):
+                        name = Path(pdf_file.filename or "").name
+                        if name.lower().endswith(".pdf") and not name.startswith(".") and name not in names:
+                            pdf_file.save((input_dir / name).as_posix())
+                            names.add(name)
+                    n_docs = len(names)
+                if not n_docs:
+                    raise ValueError("the corpus has no pdf")
+            except ValueError as e:
+                shutil.rmtree(job_dir, ignore_errors=True)
+                return jsonify({'error': 'bad parameter','desc':str(e)}), 400
+            job = corpus_jobs.submit(input_dir, job_id, job_dir, extraction=extraction)
+        urls = {"events": f"/corpus/{job.id}/events", "structure": f"/corpus/{job.id}/structure",
+                "template": f"/corpus/{job.id}/template"}
+        return jsonify(dict(job.snapshot(), **urls)), 202
+
+    def _unknown_job(job_id):
+        return jsonify({'error': 'unknown job','desc':f'no corpus job {job_id!r} (finished jobs expire)'}), 404
+
+    @app_.route('/corpus/<job_id>', methods=['GET'])
+    def corpus_job_status(job_id):
+        """ Progress of a corpus job: {"status", "total", "done", "errors", "blocks", "docs_per_second", "eta_seconds"}"""
+        job = corpus_jobs.get(job_id)
+        if job is None:
+            return _unknown_job(job_id)
+        return jsonify(job.snapshot())
+
+    @app_.route('/corpus/<job_id>/events', methods=['GET'])
+    def corpus_job_events(job_id):
+        """ Server-sent events: a "progress" event (job status json) at most every CCM_PROGRESS_INTERVAL seconds
+        while it changes, then an "end" event when the job is done or failed
+        """
+        job = corpus_jobs.get(job_id)
+        if job is None:
+            return _unknown_job(job_id)
+        interval = float(os.environ.get(PROGRESS_INTERVAL_ENV, 0.5))
+
+        def stream():
+            for snapshot in job.snapshots(interval):
+                name = "end" if snapshot["status"] in ("done", "failed") else "progress"
+                yield f"event: {name}\ndata: {json.dumps(snapshot)}\n\n"
+
+        # no buffering by a reverse proxy, events must reach the client as they are sent
+        return Response(stream(), mimetype="text/event-stream",
+                        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+    @app_.route('/corpus/<job_id>/<output>', methods=['GET'])
+    def corpus_job_output(job_id, output):
+        """ Output of a finished job: "structure" (agg_struct.xml) or "template" (template.json)"""
+        job = corpus_jobs.get(job_id)
+        if job is None:
+            return _unknown_job(job_id)
+        if output not in JOB_OUTPUTS:
+            return jsonify({'error': 'bad parameter','desc':f'output must be one of {sorted(JOB_OUTPUTS)}'}), 404
+        if not job.finished.is_set():
+            return jsonify(dict(job.snapshot(), error='job not finished')), 409
+        path = job.output(output)
+        if path is None:
+            return jsonify(dict(job.snapshot(), error=f'no {output} (failed job, or no document could be processed)')), 404
+        return send_file(path.as_posix(), mimetype=JOB_OUTPUTS[output])
 
 
     return app_
 
 
 if __name__ == '__main__':
+    import argparse
+    parser = argparse.ArgumentParser(description="pdf2xml server (werkzeug)")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--processes", type=int, default=1, help="serve with N forked processes instead of threads")
+    parser.add_argument("--single-thread", action="store_true", help="handle one request at a time")
+    parser.add_argument("--no-debug", action="store_true")
+    args = parser.parse_args()
     # print(sys.path)
     app = flask_app()
-    app.run(debug=True, host='0.0.0.0')
+    # requests are re-entrant (no shared state, one workspace per request)
+    threaded = args.processes == 1 and not args.single_thread
+    app.run(debug=not args.no_debug, host=args.host, port=args.port, threaded=threaded, processes=args.processes)
     print("Server started. Listening....")
@@ -0,0 +1,157 @@
+""" Map/reduce processing of a corpus split over several machines.
+
+Documents are assigned to shards by a stable hash of their docid (strategies.shard_of), each shard is
+indexed independently into a self-contained partial index file, partial indexes are merged (in any
+order, possibly hierarchically) and the merged index gives the aggregate structure and template.
+
+    # map, on any machine, for each shard i of n
+    python src/sharding.py map <input_dir> <output_dir> --shard i --shards n --out partial_i.json.gz
+    # reduce: merge partial (or already merged) indexes
+    python src/sharding.py merge partial_*.json.gz --out merged.json.gz
+    # aggregate structure xml and template of a merged index
+    python src/sharding.py analyse merged.json.gz --xml agg_struct.xml --template template.json
+    # the whole workflow on one machine, one process per shard standing in for a node
+    python src/sharding.py local <input_dir> <output_dir> --shards 4 --processes 4
+"""
+import os, sys
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from src.strategies import analyse_partial_index, index_corpus, load_partial_index, merge_partial_indexes, \
+                        partial_index_from_corpus_index, save_partial_index
+from src.template import save_template
+
+
+def run_shard(input_dir, output_dir, shard, n_shards, partial_path, **index_kwargs):
+    """ Map step: index the documents of one shard and write its partial index
+
+    Args:
+    ---
+        input_dir (str): folder of pdf (the whole corpus, only the documents of the shard are read)
+        output_dir (str): folder for images
+        shard (int): shard number, 0 <= shard < n_shards
+        n_shards (int)
+        partial_path (str): partial index file (json, gzip if it ends with .gz)
+        index_kwargs: other parameters of strategies.index_corpus
+
+    Returns:
+    ---
+        str: partial_path
+    """
+    if not 0 <= shard < n_shards:
+        raise ValueError(f"shard must be in [0, {n_shards})")
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    index = index_corpus(input_dir, output_dir, shard=(shard, n_shards), **index_kwargs)
+    save_partial_index(partial_index_from_corpus_index(index, label=f"{shard}/{n_shards}"), partial_path)
+    return partial_path
+
+
+def merge_partials(partials):
+    """ Reduce step: merge partial indexes pairwise, as a balanced tree (same result as any other order)"""
+    partials = list(partials)
+    if not partials:
+        raise ValueError("nothing to merge")
+    while len(partials) > 1:
+        merged = [merge_partial_indexes(a, b) for a, b in zip(partials[::2], partials[1::2])]
+        if len(partials) % 2:
+            merged.append(partials[-1])
+        partials = merged
+    return partials[0]
+
+
+def merge_partial_files(paths, out_path=None):
+    """ Merge partial index files, write the result to out_path if given
+
+    Returns:
+    ---
+        dict: merged partial index
+    """
+    merged = merge_partials(load_partial_index(p) for p in paths)
+    if out_path:
+        save_partial_index(merged, out_path)
+    return merged
+
+
+def _run_shard_star(args):
+    input_dir, output_dir, shard, n_shards, partial_path, index_kwargs = args
+    return run_shard(input_dir, output_dir, shard, n_shards, partial_path, **index_kwargs)
+
+
+def run_local(input_dir, output_dir, n_shards, processes=None, work_dir=None, **index_kwargs):
+    """ Whole map/reduce workflow on one machine, each shard in its own process
+
+    Args:
+    ---
+        input_dir (str): folder of pdf
+        output_dir (str): folder for images
+        n_shards (int): number of shards
+        processes (int, optional): worker processes. Defaults to n_shards.
+        work_dir (str, optional): where partial indexes are written. Defaults to output_dir/partials
+
+    Returns:
+    ---
+        tuple: aggregate structure xml (bytes), compiled template (dict)
+    """
+    work_dir = Path(work_dir or Path(output_dir) / "partials")
+    work_dir.mkdir(parents=True, exist_ok=True)
+    jobs = [(input_dir, output_dir, i, n_shards, (work_dir / f"partial_{i}_of_{n_shards}.json.gz").as_posix(), index_kwargs)
+            for i in range(n_shards)]
+    # never forked from this process: its background threads (image writer...) may hold locks
+    method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+    with ProcessPoolExecutor(max_workers=processes or n_shards, mp_context=multiprocessing.get_context(method)) as pool:
+        paths = list(pool.map(_run_shard_star, jobs))
+    merged = merge_partial_files(paths, work_dir / "merged.json.gz")
+    return analyse_partial_index(merged)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Sharded corpus processing (map / merge / analyse)")
+    sub = parser.add_subparsers(dest="command", required=True)
+    p_map = sub.add_parser("map", help="index one shard into a partial index")
+    p_map.add_argument("input_dir")
+    p_map.add_argument("output_dir")
+    p_map.add_argument("--shard", type=int, required=True)
+    p_map.add_argument("--shards", type=int, required=True)
+    p_map.add_argument("--out", required=True, help="partial index file (.json or .json.gz)")
+    p_map.add_argument("--extraction", default="layout", choices=["layout", "glyphs"])
+    p_map.add_argument("--no-raw-xml", action="store_true", help="do not export the pdfminer xml")
+    p_merge = sub.add_parser("merge", help="merge partial indexes")
+    p_merge.add_argument("partials", nargs="+")
+    p_merge.add_argument("--out", required=True)
+    p_analyse = sub.add_parser("analyse", help="aggregate structure of a (merged) partial index")
+    p_analyse.add_argument("partials", nargs="+", help="merged here if several")
+    p_analyse.add_argument("--xml", required=True)
+    p_analyse.add_argument("--template")
+    p_local = sub.add_parser("local", help="map, merge and analyse on this machine")
+    p_local.add_argument("input_dir")
+    p_local.add_argument("output_dir")
+    p_local.add_argument("--shards", type=int, default=4)
+    p_local.add_argument("--processes", type=int)
+    p_local.add_argument("--extraction", default="layout", choices=["layout", "glyphs"])
+    p_local.add_argument("--no-raw-xml", action="store_true")
+    args = parser.parse_args()
+
+    if args.command == "map":
+        run_shard(args.input_dir, args.output_dir, args.shard, args.shards, args.out,
+                  extraction=args.extraction, export_org_xml=not args.no_raw_xml)
+    elif args.command == "merge":
+        merge_partial_files(args.partials, args.out)
+    else:
+        if args.command == "analyse":
+            out_xml_str, template = analyse_partial_index(merge_partial_files(args.partials))
+            xml_path, template_path = args.xml, args.template
+        else:
+            out_xml_str, template = run_local(args.input_dir, args.output_dir, args.shards, args.processes,
+                                              extraction=args.extraction, export_org_xml=not args.no_raw_xml)
+            xml_path, template_path = Path(args.output_dir) / "agg_struct.xml", Path(args.output_dir) / "template.json"
+        with open(xml_path, "wb") as f:
+            f.write(out_xml_str)
+        if template_path:
+            save_template(template, template_path)
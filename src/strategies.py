@@ -4,55 +4,106 @@ PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
 if PROJECT_DIR not in sys.path:
     sys.path.insert(1, PROJECT_DIR)
 
+import json
+from collections import namedtuple
 from pathlib import Path
 from lxml import etree 
 from typing import List, Tuple
-from tqdm import tqdm
 # from PIL import Image 
 
-from src.utils import detect_range, is_same_location, sha256_hash_str, sha256_hash_byte
+from src.utils import detect_range, grouping_text, sha256_hash_str
+from src.utils.image_writer import IMAGE_WRITER
+from src.utils.metrics import timed
+from src.utils.minhash import minhash_signature, near_duplicate_families, threshold_from_env
+from src.utils.profiling import DocumentProfile
 from src.utils.date_util import get_dates_in_text
 from src.utils.address_util import find_codepostal
 from src.utils.pdf2xml import find_all_images_in_document, get_page_dimension, pdf_to_xml_tree,find_all_textboxes_B, \
-                        find_all_images_in_xml
+                        find_all_textboxes_glyphs, image_file_data, image_file_extension, \
+                        image_stream_hash, iter_raw_xml_pages, iter_xml_pages, raw_xml_to_tree, write_raw_xml, \
+                        xmlfile_write_element
 
 
-def save_to_file(root_node, out_path):
+def save_to_file(root_node, out_path, pretty_print=True):
     # Make a new document tree
     doc = etree.ElementTree(root_node)
-    etree.indent(doc, space="    ")
+    if pretty_print:
+        etree.indent(doc, space="    ")
     # outstr = etree.tostring(doc)
     # Save to XML file
     with open(out_path, 'wb') as outFile:
-        doc.write(outFile, xml_declaration=True, encoding='utf-8',pretty_print=True)
+        doc.write(outFile, xml_declaration=True, encoding='utf-8',pretty_print=pretty_print)
+
 
+@timed("export_to_my_xml")
+def export_to_my_xml(txt_blocks, img_blocks, out_path, pretty_print=False): 
+    """ Stream blocks xml to `out_path` (path or binary file-like), one <textblock> at a time.
 
-def export_to_my_xml(txt_blocks, img_blocks, out_path): 
+    Args:
+    ---
+        txt_blocks (list): output of find_all_textboxes_B, [(bbox, line_list)]
+        img_blocks (list): [LTImage] (anything with a `bbox`)
+        out_path (str or file-like)
+        pretty_print (bool, optional): indent output. Defaults to False.
+    """
     # txt_blocks = find_all_textboxes_B(root)  # list of (bbox, [ (linebbox,linetxt) ])
     # img_blocks = find_all_images_in_xml(root)  # [ LTImage]
-    page_node = etree.Element('page')
-    txtblock_node = etree.SubElement(page_node,"textblocks")
-    for b_bbox, linelist in txt_blocks:
-        bbox_str = ",".join([str(i) for i in b_bbox])
-        blocknode = etree.SubElement(txtblock_node,"textblock", bbox=bbox_str)
-        for tag in contruct_block_html(linelist):
-            if tag["type"] == "br":
-                br_node = etree.SubElement(blocknode,"br")
-            else:  # type = span
-                span_node = etree.SubElement(blocknode,"span", fontFamily=tag["fontFamily"], size=tag["size"], 
-                                        color=tag["color"], bbox=tag["bbox"])
-                span_node.text = tag["text"]
-        # for lbbox,linetxt,fontinfo in linelist:
-        #     bbox_str = ",".join([str(i) for i in lbbox])
-        #     linenode = etree.SubElement(blocknode,"textline",bbox=bbox_str)
-        #     linenode.text = linetxt
-    imgs_node = etree.SubElement(page_node,"images")
-    
-    for img in img_blocks:
-        bbox_str = ",".join([str(i) for i in img.bbox])
-        imgnode = etree.SubElement(imgs_node,"image", bbox=bbox_str)
+    with etree.xmlfile(out_path, encoding="utf-8") as xf:
+        xf.write_declaration()
+        with xf.element("page"):
+            if pretty_print:
+                xf.write("\n    ")
+            with xf.element("textblocks"):
+                for b_bbox, linelist in txt_blocks:
+                    bbox_str = ",".join([str(i) for i in b_bbox])
+                    blocknode = etree.Element("textblock", bbox=bbox_str)
+                    for tag in contruct_block_html(linelist):
+                        if tag["type"] == "br":
+                            br_node = etree.SubElement(blocknode,"br")
+                        else:  # type = span
+                            span_node = etree.SubElement(blocknode,"span", fontFamily=tag["fontFamily"], size=tag["size"], 
+                                                    color=tag["color"], bbox=tag["bbox"])
+                            span_node.text = tag["text"]
+                    xmlfile_write_element(xf, blocknode, level=2, pretty_print=pretty_print)
+                if pretty_print and txt_blocks:
+                    xf.write("\n    ")
+            if pretty_print:
+                xf.write("\n    ")
+            with xf.element("images"):
+                for img in img_blocks:
+                    bbox_str = ",".join([str(i) for i in img.bbox])
+                    imgnode = etree.Element("image", bbox=bbox_str)
+                    xmlfile_write_element(xf, imgnode, level=2, pretty_print=pretty_print)
+                if pretty_print and img_blocks:
+                    xf.write("\n    ")
+            if pretty_print:
+                xf.write("\n")
+
+
+def blocks_to_dict(txt_blocks, img_blocks):
+    """ Same content as export_to_my_xml, as plain python structures (for json/msgpack)
+
+    Returns:
+    ---
+        dict: {"textblocks": [{"bbox": [x0,y0,x1,y1], "content": contruct_block_html(..)}], "images": [{"bbox": [..]}]}
+    """
+    return {
+        "textblocks": [{"bbox": list(b_bbox), "content": contruct_block_html(linelist)} for b_bbox, linelist in txt_blocks],
+        "images": [{"bbox": list(img.bbox)} for img in img_blocks],
+    }
+
+
+@timed("export_to_my_json")
+def export_to_my_json(txt_blocks, img_blocks, out_file):
+    """ Write compact json of blocks_to_dict() into a binary file-like"""
+    out_file.write(json.dumps(blocks_to_dict(txt_blocks, img_blocks), ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
 
-    save_to_file(page_node, out_path)
+@timed("export_to_my_msgpack")
+def export_to_my_msgpack(txt_blocks, img_blocks, out_file):
+    """ Write MessagePack of blocks_to_dict() into a binary file-like. Needs the `msgpack` package."""
+    import msgpack
+    out_file.write(msgpack.packb(blocks_to_dict(txt_blocks, img_blocks), use_bin_type=True))
 
 
 def contruct_block_html(line_list:List[Tuple]):
@@ -97,6 +148,184 @@ def contruct_block_html(line_list:List[Tuple]):
     return html_content
 
 
+def extract_first_page(path_str, extraction="layout", raw_xml_path=None, pretty_print=False):
+    """ Text blocks, images and dimension of the 1st page of a pdf
+
+    Args:
+    ---
+        path_str (str): pdf path
+        extraction (str, optional): "layout" (pdfminer layout analysis + find_all_textboxes_B) or
+            "glyphs" (fast path, raw glyphs of the CCM_PDF_BACKEND backend grouped by grouping_text, see
+            utils/pdf_backends.py). Defaults to "layout".
+        raw_xml_path (str, optional): if given (layout only), pdfminer xml of all pages is streamed there
+        pretty_print (bool, optional): indent the raw xml
+
+    Returns:
+    ---
+        tuple: txt_blocks [(bbox, line_list)], img_blocks [LTImage], (pageW, pageH)
+    """
+    if extraction == "glyphs":
+        return find_all_textboxes_glyphs(path_str)
+    if extraction != "layout":
+        raise ValueError(f"unknown extraction mode {extraction}, either layout or glyphs")
+    # --- save pdfminer_xml (streamed page by page), only 1st page is kept for blocks
+    if raw_xml_path:
+        root = write_raw_xml(path_str, raw_xml_path, pretty_print=pretty_print)
+    else:
+        root = pdf_to_xml_tree(path_str, maxpages=1)
+    txt_blocks = find_all_textboxes_B(root)  # list of (bbox, [ (linebbox,linetxt) ])
+    img_blocks = find_all_images_in_document(path_str,first_page=True)  # [ LTImage ]
+    if img_blocks:
+        img_blocks = img_blocks[0]  #
+    return txt_blocks, img_blocks, get_page_dimension(root)
+
+
+def iter_document_pages(path_str, extraction="layout", from_raw_xml=False):
+    """ Text blocks of every page of a document, one page at a time: only the page being yielded is in memory
+
+    Args:
+    ---
+        path_str (str): pdf path, or raw xml written by a previous run with from_raw_xml
+        extraction (str, optional): "layout" or "glyphs", see extract_first_page
+        from_raw_xml (bool, optional): read the pages of a raw xml instead of parsing the pdf
+
+    Yield
+    ---
+        tuple: (pageW, pageH), txt_blocks [(bbox, line_list)]
+    """
+    if from_raw_xml or extraction == "layout":
+        pages = iter_raw_xml_pages(path_str) if from_raw_xml else iter_xml_pages(path_str, caching=False)
+        for page in pages:
+            root = etree.Element("pages")
+            root.append(page)
+            yield get_page_dimension(root), find_all_textboxes_B(root)
+    elif extraction == "glyphs":
+        from src.utils.pdf_backends import get_backend
+        for page_dim, chars, _ in get_backend().iter_pages(path_str):
+            yield page_dim, grouping_text(chars)
+    else:
+        raise ValueError(f"unknown extraction mode {extraction}, either layout or glyphs")
+
+
+def document_pages(docid, path, export_org_xml=True, extraction="layout", from_raw_xml=False, raw_xml_compression=None,
+                   raw_xml_dir=None):
+    """ iter_document_pages of a document processed by extract_document (same arguments): read from the raw
+    xml it wrote when there is one, instead of parsing the pdf again"""
+    path = Path(path)
+    if not from_raw_xml and export_org_xml and extraction == "layout":
+        raw_xml = Path(raw_xml_dir or path.parent) / raw_xml_name(docid, raw_xml_compression)
+        if raw_xml.exists():
+            return iter_document_pages(raw_xml.as_posix(), from_raw_xml=True)
+    return iter_document_pages(path.as_posix(), extraction, from_raw_xml)
+
+
+# image of a document once hashed and saved as <hash><ext>, has a `bbox` like LTImage
+StoredImage = namedtuple("StoredImage", ["bbox", "width", "height", "hash"])
+
+RAW_XML_SUFFIXES = (".raw.xml", ".raw.xml.gz", ".raw.xml.zst")
+RAW_XML_COMPRESSIONS = ("gz", "zst")
+IMAGE_MANIFEST_VERSION = 2  # 1 (unversioned list): image hashes before the encoded stream was cut to its /Length
+
+
+def check_raw_xml_compression(compression):
+    """ Raise ValueError if compression is not None, "gz" or "zst" """
+    if compression is not None and compression not in RAW_XML_COMPRESSIONS:
+        raise ValueError(f"unknown raw xml compression {compression!r}, one of {list(RAW_XML_COMPRESSIONS)}")
+
+
+def raw_xml_name(docid, compression=None):
+    """ <docid>.raw.xml[.gz|.zst], file name of the raw xml exported with this compression"""
+    check_raw_xml_compression(compression)
+    return f"{docid}.raw.xml{'.' + compression if compression else ''}"
+
+
+def store_images(img_blocks, output_dir, decode=False):
+    """ Hash each image stream and write it as output_dir/<hash><ext> (once per hash)
+
+    Images are hashed from their encoded stream and jpeg / jpeg2000 streams are written unchanged
+    (.jpg / .jp2): nothing is decompressed unless decode is True, see pdf2xml.image_file_extension.
+    Files are written in the background by image_writer.IMAGE_WRITER: call IMAGE_WRITER.flush() before
+    relying on them.
+
+    Args:
+    ---
+        img_blocks (list): [LTImage]
+        output_dir (str): folder for images, None to only hash them
+        decode (bool, optional): write the decoded samples (.raw) of images that are not jpeg / jpeg2000,
+            instead of their encoded stream (.bin). Defaults to False.
+
+    Returns:
+    ---
+        list: [StoredImage]
+    """
+    stored = []
+    for img in img_blocks:
+        hash_ = image_stream_hash(img.stream)
+        if output_dir is not None:
+            outpath = Path(output_dir) / f"{hash_}{image_file_extension(img.stream, decode)}"
+            IMAGE_WRITER.write(outpath, lambda stream=img.stream: image_file_data(stream, decode))
+        stored.append(StoredImage(tuple(img.bbox), img.width, img.height, hash_))
+    return stored
+
+
+def save_image_manifest(images, path):
+    """ Write [StoredImage] as json, read back by load_image_manifest when reprocessing raw xml"""
+    with open(path, "w") as f:
+        json.dump({"version": IMAGE_MANIFEST_VERSION, "images": [list(img) for img in images]}, f)
+
+
+def load_image_manifest(path):
+    """ [StoredImage] saved by save_image_manifest
+
+    Raises:
+    ---
+        FileNotFoundError: no manifest, the images of the document are unknown
+        ValueError: manifest of another IMAGE_MANIFEST_VERSION, its hashes differ from the ones of this version
+    """
+    if not Path(path).exists():
+        raise FileNotFoundError(f"no image manifest {path}: the raw xml was written without it (older run?), "
+                                f"index the pdf instead")
+    with open(path) as f:
+        manifest = json.load(f)
+    version = manifest.get("version") if isinstance(manifest, dict) else 1
+    if version != IMAGE_MANIFEST_VERSION:
+        raise ValueError(f"image manifest {path} has version {version}, not {IMAGE_MANIFEST_VERSION}: "
+                         f"index the pdf again")
+    return [StoredImage(tuple(bbox), w, h, hash_) for bbox, w, h, hash_ in manifest["images"]]
+
+
+def find_raw_xml_files(input_dir):
+    """ Raw xml written by a previous run (plain, .gz or .zst), one per document
+
+    Returns:
+    ---
+        list: [(docid, path)], sorted by docid
+    """
+    found = {}
+    for suffix in RAW_XML_SUFFIXES:
+        for path in Path(input_dir).glob("*" + suffix):
+            found.setdefault(path.name[:-len(suffix)], path)
+    return sorted(found.items())
+
+
+def extract_first_page_from_raw_xml(raw_xml_path):
+    """ Same as extract_first_page, from a raw xml written by a previous run instead of the pdf.
+
+    Only the 1st page is parsed (iterparse). Images come from the <docid>.images.json manifest written
+    next to the raw xml by the previous run, see load_image_manifest (FileNotFoundError if it is missing).
+
+    Returns:
+    ---
+        tuple: txt_blocks [(bbox, line_list)], img_blocks [StoredImage], (pageW, pageH)
+    """
+    raw_xml_path = Path(raw_xml_path)
+    root = raw_xml_to_tree(raw_xml_path, maxpages=1)
+    txt_blocks = find_all_textboxes_B(root)
+    docid = raw_xml_path.name.split(".raw.xml")[0]
+    img_blocks = load_image_manifest(raw_xml_path.with_name(docid + ".images.json"))
+    return txt_blocks, img_blocks, get_page_dimension(root)
+
+
 def text_end_with_postal_pattern(text):
     """Check if there is a codepostal_city at the end of the text"""
     list_cp_found = find_codepostal(text)
@@ -127,279 +356,390 @@ def get_position_key(bbox):
     return f"{x0}_{y1}"
 
 
-def oth_main(input_dir:str, output_dir:str, export_org_xml=True):
-    """ TBD
+def oth_main(input_dir:str, output_dir:str, export_org_xml=True, pretty_print=False, profile_docids=None, profile_dir=None,
+             extraction="layout", from_raw_xml=False, raw_xml_compression=None):
+    """ Index the 1st page of every document, and detect the headers / footers of all their pages
+    (see src/header_footer.py), written to output_dir/headers_footers.json:
+
+        {"documents": {docid: {"pages", "header": [{"text", "bbox", "pages"}], "footer": [...]}},
+         "corpus": {"documents", "header": [{"text", "bbox", "documents"}], "footer": [...]}}
+
+    Pages are read one at a time, from the raw xml written while indexing when there is one.
 
     Args:
     ---
-        input_dir (str):  ...
-        output_dir (str):  ...
+        input_dir (str): folder of pdf
+        output_dir (str): folder for images and headers_footers.json
         export_org_xml (bool, optional): Defaults to True.
+        pretty_print (bool, optional): indent exported xml files. Defaults to False.
+        profile_docids (set or "all", optional): documents to profile (cProfile, memory peak, stage timings)
+        profile_dir (str, optional): where profiles are written. Defaults to output_dir/profiles
+        extraction (str, optional): "layout" or "glyphs" (fast path, no raw xml export), see extract_first_page
+        from_raw_xml (bool, optional): rebuild blocks from the <docid>.raw.xml[.gz|.zst] (and .images.json) written
+            by a previous run in the input folder, without parsing the pdf again. Defaults to False.
+        raw_xml_compression (str, optional): None, "gz" or "zst", compression of the exported raw xml
+
+    Returns:
+    ---
+        dict: corpus index, see new_corpus_index
     """
-    in_dir = Path(input_dir)
-
-    # dictionnaries
-    inverse_index = {}  # block_hash -> {docid: [bbox_str]}
-    inverse_index_img = {}  # img_hash -> {docid: [bbox_str]}
-    collection_dict = {}  # docid -> {page_dim: (W,H), bbox_str : blocktext}
-    collection_dict_img = {}   # {docid -> {bbox_str -> (width, height, bytehash)}}
-    position_hash_dict = {}  # {"x0_y0" -> [hash_ids]}    used with get_position_key()
-
-    """ For each PDF in input dir """
-    for path in tqdm(in_dir.glob("*.pdf")):
-        docid = path.stem
-        # print("DOCUMENT ::", docid)
-        path_str = path.as_posix()
-        root = pdf_to_xml_tree(path_str)
-        # --- save pdfminer_xml
-        if export_org_xml:
-            out_path = path_str[:-4]+".raw.xml"
-            doc = etree.ElementTree(root)
-            etree.indent(doc, space="    ")
-            with open(out_path, 'wb') as outFile:
-                doc.write(outFile, xml_declaration=True, encoding='utf-8',pretty_print=True)
-             
-        txt_blocks = find_all_textboxes_B(root)  # list of (bbox, [ (linebbox,linetxt) ])
-        img_blocks = find_all_images_in_document(path_str,first_page=True)  # [ LTImage ]
-        if img_blocks:
-            img_blocks = img_blocks[0]  #
-
-
-        collection_dict_img[docid] = {}  
-        
-        # --- browse each image block in this document
-        for img in img_blocks:
-            bbox_str = ",".join([str(i) for i in img.bbox])
-            img_stream = img.stream.get_data()
-            hash_ = sha256_hash_byte(img_stream)
-            # img_ext = determine_image_type(img_stream)
-            outpath = Path(output_dir) / f"{hash_}.jpg"
-            if not outpath.exists():
-                with open(outpath,"wb") as f:
-                    f.write(img_stream)
-            collection_dict_img[docid][bbox_str] = (img.width,img.height,hash_)
-            if hash_ in inverse_index_img:
-                docpos_dict = inverse_index_img[hash_]
-                if docid in docpos_dict:
-                    docpos_dict[docid].append(bbox_str)
-                else:
-                    docpos_dict[docid] = [bbox_str]
-            else:
-                inverse_index_img[hash_] = {docid: [bbox_str]}
-
-        pageW,pageH = get_page_dimension(root)
-        collection_dict[docid] = {"page_dim":(int(pageW),int(pageH))}
-        # --- browse each text block
-        for b_bbox, linelist in txt_blocks:
-            bbox_str = ",".join([str(i) for i in b_bbox])
-            box_text = "\n".join("".join(line[1]) for line in linelist)
-            box_text_words = box_text.split()
-            # ----- make collection_dict
-            collection_dict[docid][bbox_str] = contruct_block_html(linelist)
-            # ---------------------------
-            # ----- make inverse_index
-            txt_hash = sha256_hash_str(box_text)
-            if txt_hash in inverse_index:
-                docpos_dict = inverse_index[txt_hash]
-                if docid in docpos_dict:
-                    docpos_dict[docid].append(bbox_str)
-                else:
-                    docpos_dict[docid] = [bbox_str]
-            else:
-                inverse_index[txt_hash] = {docid: [bbox_str]}
-            
-            # ---- make position_hash_dict
-            poskey = get_position_key(b_bbox)
-            if poskey in position_hash_dict:
-                position_hash_dict[poskey].append(txt_hash)
-            else:
-                position_hash_dict[poskey] = [txt_hash]
+    from src.header_footer import HeaderFooterDetector
+
+    index = index_corpus(input_dir, output_dir, export_org_xml, pretty_print, profile_docids, profile_dir, extraction,
+                         from_raw_xml, raw_xml_compression, export_blocks=False)
+
+    # --- headers / footers of all the pages
+    detector = HeaderFooterDetector()
+    documents = {}
+    for docid, path in list_documents(input_dir, from_raw_xml):
+        pages = document_pages(docid, path, export_org_xml, extraction, from_raw_xml, raw_xml_compression)
+        documents[docid] = detector.add_document(pages)
+    Path(output_dir).mkdir(parents=True, exist_ok=True)
+    with open(Path(output_dir) / "headers_footers.json", "w") as f:
+        json.dump({"documents": documents, "corpus": detector.result()}, f, ensure_ascii=False, indent=1)
 
-    corpus_len = len(collection_dict)
-    universal_hashes_ = set()  # hashids that repeat in all doc
-    
     """ TODO: 
-        - une fonction qui va concatener les pages
-        - detection des entetes et pied-de-page
         - identification des blocs variables avec les hashes haut et bas
         - lier les champs dans le fichier JSON aux positions dans les blocs variables
     """
-    
+    return index
 
 
+def new_corpus_index():
+    """ Empty corpus index, filled document by document with index_document() then analysed by analyse_corpus_index()"""
+    return {
+        "inverse_index": {},  # block_hash -> {docid: [bbox_str]}
+        "img_inverse_index": {},  # img_hash -> {docid: [bbox_str]}
+        "collection_dict": {},  # docid -> {page_dim: (W,H), bbox_str : blocktext}
+        "collection_img_dict": {},   # {docid -> {bbox_str -> (width, height, bytehash)}}
+        "position_hash_dict": {},  # {"x0_y0" -> [hash_ids]}    used with get_position_key()
+        # type of box
+        "block_with_page": set(),  # {block_hash} of block with "page" in text
+        "block_with_date": set(),  # {block_hash} of block with some dates in text
+        "block_with_address": set(),  # {block_hash} of block with codepostal_city an the end of text
+        "text_minhash": {},  # block_hash -> minhash signature of its text (None if blank), see utils/minhash.py
+    }
 
 
+def index_document(index, docid, txt_blocks, img_blocks, page_dim):
+    """ Add the blocks of one document to a corpus index
 
-def main_ignore(inputdir:str, output_dir:str, export_org_xml=True):
-    """ Main app
+    Args:
+    ---
+        index (dict): see new_corpus_index
+        docid (str)
+        txt_blocks (list): [(bbox, line_list)], see extract_first_page
+        img_blocks (list): [StoredImage]
+        page_dim (tuple): (pageW, pageH)
     """
-    in_dir = Path(inputdir)
-
-    # dictionnaries
-    inverse_index = {}  # block_hash -> {docid: [bbox_str]}
-    img_inverse_index = {}  # img_hash -> {docid: [bbox_str]}
-    collection_dict = {}  # docid -> {page_dim: (W,H), bbox_str : blocktext}
-    collection_img_dict = {}   # {docid -> {bbox_str -> (width, height, bytehash)}}
-    position_hash_dict = {}  # {"x0_y0" -> [hash_ids]}    used with get_position_key()
-
-    # type of box
-    block_with_page = set()  # {block_hash} of block with "page" in text
-    block_with_date = set()  # {block_hash} of block with some dates in text
-    block_with_address = set()  # {block_hash} of block with codepostal_city an the end of text
-
-
-    for path in tqdm(in_dir.glob("*.pdf")):
-        docid = path.stem
-        # print("DOCUMENT ::", docid)
-        path_str = path.as_posix()
-        root = pdf_to_xml_tree(path_str)
-        # save pdfminer_xml
-        if export_org_xml:
-            out_path = path_str[:-4]+".raw.xml"
-            doc = etree.ElementTree(root)
-            etree.indent(doc, space="    ")
-            with open(out_path, 'wb') as outFile:
-                doc.write(outFile, xml_declaration=True, encoding='utf-8',pretty_print=True)
-             
-        txt_blocks = find_all_textboxes_B(root)  # list of (bbox, [ (linebbox,linetxt) ])
-        img_blocks = find_all_images_in_document(path_str,first_page=True)  # [ LTImage ]
-        if img_blocks:
-            img_blocks = img_blocks[0]  #
-
-        out_path = path_str[:-4]+".blocks.xml"
-        export_to_my_xml(txt_blocks, img_blocks, out_path)
-
-        collection_img_dict[docid] = {}  
-        
-        # --- browse each image block in this document
-        for img in img_blocks:
-            bbox_str = ",".join([str(i) for i in img.bbox])
-            img_stream = img.stream.get_data()
-            hash_ = sha256_hash_byte(img_stream)
-            # img_ext = determine_image_type(img_stream)
-            outpath = Path(output_dir) / f"{hash_}.jpg"
-            if not outpath.exists():
-                with open(outpath,"wb") as f:
-                    f.write(img_stream)
-            collection_img_dict[docid][bbox_str] = (img.width,img.height,hash_)
-            if hash_ in img_inverse_index:
-                docpos_dict = img_inverse_index[hash_]
-                if docid in docpos_dict:
-                    docpos_dict[docid].append(bbox_str)
-                else:
-                    docpos_dict[docid] = [bbox_str]
+    inverse_index = index["inverse_index"]
+    img_inverse_index = index["img_inverse_index"]
+    collection_dict = index["collection_dict"]
+    collection_img_dict = index["collection_img_dict"]
+    position_hash_dict = index["position_hash_dict"]
+    block_with_page = index["block_with_page"]
+    block_with_date = index["block_with_date"]
+    block_with_address = index["block_with_address"]
+    text_minhash = index["text_minhash"]
+    pageW, pageH = page_dim
+
+    collection_img_dict[docid] = {}  
+
+    # --- browse each image block in this document
+    for img in img_blocks:
+        bbox_str = ",".join([str(i) for i in img.bbox])
+        hash_ = img.hash
+        collection_img_dict[docid][bbox_str] = (img.width,img.height,hash_)
+        if hash_ in img_inverse_index:
+            docpos_dict = img_inverse_index[hash_]
+            if docid in docpos_dict:
+                docpos_dict[docid].append(bbox_str)
             else:
-                img_inverse_index[hash_] = {docid: [bbox_str]}
-
-        pageW,pageH = get_page_dimension(root)
-        collection_dict[docid] = {"page_dim":(int(pageW),int(pageH))}
-        # -- browse each text block
-        for b_bbox, linelist in txt_blocks:
-            bbox_str = ",".join([str(i) for i in b_bbox])
-            box_text = "\n".join("".join(line[1]) for line in linelist)
-            box_text_words = box_text.split()
-            # ----- make collection_dict
-            collection_dict[docid][bbox_str] = contruct_block_html(linelist)
-            # ---------------------------
-            # ----- make inverse_index
-            txt_hash = sha256_hash_str(box_text)
-            if txt_hash in inverse_index:
-                docpos_dict = inverse_index[txt_hash]
-                if docid in docpos_dict:
-                    docpos_dict[docid].append(bbox_str)
-                else:
-                    docpos_dict[docid] = [bbox_str]
+                docpos_dict[docid] = [bbox_str]
+        else:
+            img_inverse_index[hash_] = {docid: [bbox_str]}
+
+    collection_dict[docid] = {"page_dim":(int(pageW),int(pageH))}
+    # -- browse each text block
+    for b_bbox, linelist in txt_blocks:
+        bbox_str = ",".join([str(i) for i in b_bbox])
+        box_text = "\n".join("".join(line[1]) for line in linelist)
+        box_text_words = box_text.split()
+        # ----- make collection_dict
+        collection_dict[docid][bbox_str] = contruct_block_html(linelist)
+        # ---------------------------
+        # ----- make inverse_index
+        txt_hash = sha256_hash_str(box_text)
+        if txt_hash in inverse_index:
+            docpos_dict = inverse_index[txt_hash]
+            if docid in docpos_dict:
+                docpos_dict[docid].append(bbox_str)
             else:
-                inverse_index[txt_hash] = {docid: [bbox_str]}
-            
-            # ---- make position_hash_dict
-            poskey = get_position_key(b_bbox)
-            if poskey in position_hash_dict:
-                position_hash_dict[poskey].append(txt_hash)
+                docpos_dict[docid] = [bbox_str]
+        else:
+            inverse_index[txt_hash] = {docid: [bbox_str]}
+            text_minhash[txt_hash] = minhash_signature(box_text)
+
+        # ---- make position_hash_dict
+        poskey = get_position_key(b_bbox)
+        if poskey in position_hash_dict:
+            position_hash_dict[poskey].append(txt_hash)
+        else:
+            position_hash_dict[poskey] = [txt_hash]
+
+        # ---------------------------
+        # --- looking for blocks : "page x"
+        if 1 < len(box_text_words) < 5 and "page" in box_text.lower():
+            block_with_page.add(txt_hash)
+        # --- looking for blocks : "date"
+        elif 3 < len(box_text_words) < 10 and get_dates_in_text(box_text.lower()):
+            block_with_date.add(txt_hash)
+        if text_end_with_postal_pattern(box_text):
+            block_with_address.add(txt_hash)
+            # print("adress found")
+        # --------------------------------------
+
+
+PARTIAL_INDEX_VERSION = 5  # 2: image hashes from the encoded stream, 3: encoded stream cut to its /Length,
+                           # 4: minhash of text blocks, 5: docids of text blocks with a minhash
+
+
+def shard_of(docid, n_shards):
+    """ Stable shard number of a document (sha256 of its docid), same on every machine"""
+    return int(sha256_hash_str(docid)[:16], 16) % n_shards
+
+
+def _bbox_millipoints(bbox_str):
+    """ bbox coordinates as integer thousandths of a point: integer sums are exact, so merges are associative"""
+    return [int(round(float(b) * 1000)) for b in bbox_str.split(",")]
+
+
+def _prune_partial_entry(entry, n_docs):
+    """ Only a block found in every document can be universal: drop the position sums and content of the
+    others (their count is enough for repeated blocks). Address blocks keep their location. A text block
+    with a minhash is kept whole: it may belong to a universal family of near-duplicates (known once merged)."""
+    if entry["docs"] != n_docs and ("minhash" not in entry or "address" in entry["flags"]):
+        entry.pop("sum", None)
+        entry.pop("sumsq", None)
+        entry.pop("content", None)
+        if "address" not in entry["flags"]:
+            entry.pop("first", None)
+    return entry
+
+
+def partial_index_from_corpus_index(index, label=None, near_duplicates=None):
+    """ Self-contained, mergeable summary of a corpus index (see merge_partial_indexes)
+
+    {"version": 1, "labels": [label], "documents": [docid],
+     "text": {hash: entry}, "img": {hash: entry}}
+    entry = {"docs": number of documents with the block, "flags": ["page"|"date"|"address"],
+             "first": [docid, bbox_str] (smallest docid), "content": block html of "first" (text),
+             "sum"/"sumsq": per coordinate sums of the block bbox (in thousandths of a point) over documents,
+             "poskeys": get_position_key of its locations (address blocks only),
+             "minhash": signature of the text (text blocks that are not blank, with near_duplicates),
+             "docids": sorted documents of the block (with "minhash": a family counts distinct documents)}
+
+    near_duplicates (bool): keep the minhash, location and content of every text block, for the families
+    of near-duplicates of analyse_partial_index (larger partial indexes). Defaults to
+    CCM_NEAR_DUPLICATE_THRESHOLD != 0.
+    """
+    documents = sorted(index["collection_dict"])
+    n_docs = len(documents)
+    if near_duplicates is None:
+        near_duplicates = threshold_from_env() is not None
+    flags_of = {}
+    for flag, hashes in (("page", index["block_with_page"]), ("date", index["block_with_date"]),
+                         ("address", index["block_with_address"])):
+        for h in hashes:
+            flags_of.setdefault(h, []).append(flag)
+
+    def summarise(inv, kind):
+        out = {}
+        for h, pos_dict in inv.items():
+            entry = {"docs": len(pos_dict), "flags": sorted(flags_of.get(h, [])) if kind == "text" else []}
+            first_docid = min(pos_dict)
+            entry["first"] = [first_docid, pos_dict[first_docid][0]]
+            bboxes = [_bbox_millipoints(bboxes[0]) for bboxes in pos_dict.values()]  # 1st location in each doc
+            entry["sum"] = [sum(c) for c in zip(*bboxes)]
+            entry["sumsq"] = [sum(v * v for v in c) for c in zip(*bboxes)]
+            if kind == "text":
+                entry["content"] = index["collection_dict"][first_docid][pos_dict[first_docid][0]]
+                if near_duplicates and index["text_minhash"].get(h):
+                    entry["minhash"] = index["text_minhash"][h]
+                    entry["docids"] = sorted(pos_dict)
+            if "address" in entry["flags"]:
+                entry["poskeys"] = sorted({get_position_key(b) for bboxes in pos_dict.values() for b in bboxes})
+            out[h] = _prune_partial_entry(entry, n_docs)
+        return out
+
+    return {"version": PARTIAL_INDEX_VERSION, "labels": [label] if label else [], "documents": documents,
+            "text": summarise(index["inverse_index"], "text"), "img": summarise(index["img_inverse_index"], "img")}
+
+
+def merge_partial_indexes(a, b):
+    """ Merge two partial indexes of disjoint sets of documents. Associative and commutative, so partial
+    indexes can be merged in any order / hierarchically."""
+    common = set(a["documents"]).intersection(b["documents"])
+    if common:
+        raise ValueError(f"partial indexes share {len(common)} documents (e.g. {min(common)}), shards must be disjoint")
+    documents = sorted(a["documents"] + b["documents"])
+    n_docs = len(documents)
+    merged = {"version": PARTIAL_INDEX_VERSION, "labels": sorted(a["labels"] + b["labels"]), "documents": documents}
+    for kind in ("text", "img"):
+        out = {}
+        for h in set(a[kind]).union(b[kind]):
+            ea, eb = a[kind].get(h), b[kind].get(h)
+            if ea is None or eb is None:
+                entry = dict(ea or eb)
             else:
-                position_hash_dict[poskey] = [txt_hash]
-
-            # ---------------------------
-            # --- looking for blocks : "page x"
-            if 1 < len(box_text_words) < 5 and "page" in box_text.lower():
-                block_with_page.add(txt_hash)
-            # --- looking for blocks : "date"
-            elif 3 < len(box_text_words) < 10 and get_dates_in_text(box_text.lower()):
-                block_with_date.add(txt_hash)
-            if text_end_with_postal_pattern(box_text):
-                block_with_address.add(txt_hash)
-                # print("adress found")
-            # --------------------------------------
-            
-    
-    corpus_len = len(collection_dict)
+                entry = {"docs": ea["docs"] + eb["docs"], "flags": sorted(set(ea["flags"]).union(eb["flags"]))}
+                firsts = [e for e in (ea, eb) if "first" in e]
+                if firsts:
+                    first = min(firsts, key=lambda e: e["first"][0])
+                    entry["first"] = first["first"]
+                    if "content" in first:
+                        entry["content"] = first["content"]
+                if "sum" in ea and "sum" in eb:
+                    entry["sum"] = [x + y for x, y in zip(ea["sum"], eb["sum"])]
+                    entry["sumsq"] = [x + y for x, y in zip(ea["sumsq"], eb["sumsq"])]
+                if "poskeys" in ea or "poskeys" in eb:
+                    entry["poskeys"] = sorted(set(ea.get("poskeys", [])).union(eb.get("poskeys", [])))
+                if "minhash" in ea and "minhash" in eb:
+                    entry["minhash"] = ea["minhash"]
+                    entry["docids"] = sorted(ea["docids"] + eb["docids"])
+            out[h] = _prune_partial_entry(entry, n_docs)
+        merged[kind] = out
+    return merged
+
+
+def save_partial_index(partial, path):
+    """ Write a partial index as json, gzip compressed if path ends with .gz"""
+    import gzip
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "wt", encoding="utf-8") as f:
+        json.dump(partial, f, separators=(",", ":"))
+
+
+def load_partial_index(path):
+    import gzip
+    opener = gzip.open if str(path).endswith(".gz") else open
+    with opener(path, "rt", encoding="utf-8") as f:
+        partial = json.load(f)
+    if partial.get("version") != PARTIAL_INDEX_VERSION:
+        raise ValueError(f"unsupported partial index version {partial.get('version')} in {path}")
+    return partial
+
+
+def _same_location(entry):
+    """ is_same_location() of the bbox of a block in every document, from the sums of its coordinates"""
+    n = entry.get("locations", entry["docs"])
+    stds = [max(0, sq * n - s * s) ** 0.5 / n / 1000 for s, sq in zip(entry["sum"], entry["sumsq"])]
+    return sum(stds) / len(stds) < 5  # 5 pixels of derivation on each dimension
+
+
+def merge_near_duplicates(text_index, corpus_len, threshold):
+    """ Text entries of a partial index with each family of near-duplicate blocks (see utils/minhash.py) as
+    one entry, keyed by the smallest hash of the family.
+
+    Blocks already found in every document and address blocks stay apart. A family entry has "docs", the
+    number of distinct documents with one of its blocks, the position sums of its blocks over their
+    "locations" (a document with two blocks of a family counts twice there), the "first" / "content" of its
+    first block, and "variants", its number of distinct texts.
+
+    Args:
+    ---
+        text_index (dict): hash -> entry, see partial_index_from_corpus_index
+        corpus_len (int): number of documents
+        threshold (float): min estimated Jaccard similarity of near-duplicate blocks
+
+    Returns:
+    ---
+        dict: hash -> entry
+    """
+    signatures = {h: e["minhash"] for h, e in text_index.items()
+                  if "minhash" in e and e["docs"] < corpus_len and "address" not in e["flags"]}
+    families = near_duplicate_families(signatures, threshold)
+    if not families:
+        return text_index
+    members = {}
+    for hashid, root in families.items():
+        members.setdefault(root, []).append(hashid)
+    merged = {h: e for h, e in text_index.items() if h not in families}
+    for root, hashes in members.items():
+        entries = [text_index[h] for h in hashes]
+        first = min(entries, key=lambda e: e["first"])
+        merged[root] = {"docs": len(set().union(*(e["docids"] for e in entries))),
+                        "locations": sum(e["docs"] for e in entries),
+                        "flags": sorted({flag for e in entries for flag in e["flags"]}),
+                        "first": first["first"], "content": first["content"],
+                        "sum": [sum(c) for c in zip(*(e["sum"] for e in entries))],
+                        "sumsq": [sum(c) for c in zip(*(e["sumsq"] for e in entries))],
+                        "minhash": text_index[root]["minhash"], "variants": len(hashes)}
+    return merged
+
+
+def analyse_partial_index(partial, near_duplicate_threshold=None):
+    """ Universal / repeated blocks of a (merged) partial index
+
+    Args:
+    ---
+        partial (dict): see partial_index_from_corpus_index
+        near_duplicate_threshold (float, optional): text blocks this similar are counted as one block, see
+            merge_near_duplicates. Defaults to CCM_NEAR_DUPLICATE_THRESHOLD (0.7), 0 = exact text only.
+
+    Returns:
+    ---
+        tuple: aggregate structure xml (bytes), compiled template (dict, see src/template.py)
+    """
+    from src.template import compile_template
+    if near_duplicate_threshold is None:
+        near_duplicate_threshold = threshold_from_env()
+    text_index, img_index = partial["text"], partial["img"]
+    corpus_len = len(partial["documents"])
+    if near_duplicate_threshold:
+        text_index = merge_near_duplicates(text_index, corpus_len, near_duplicate_threshold)
     universal_hashes_ = set()  # hashids that repeat in all doc
     repeated_hashes = set()  # hashids that repeat in more than 1
-    
-
-    # check repeated text blocks
-    for hashid,docs in inverse_index.items():
-        if len(docs)==corpus_len:
-            universal_hashes_.add(hashid)
-        elif len(docs) > 1:
-            repeated_hashes.add(hashid)
-    # repeated images blocks
-    for hashid,docs in img_inverse_index.items():
-        if len(docs)==corpus_len:
-            universal_hashes_.add(hashid)
-        elif len(docs) > 1:
-            repeated_hashes.add(hashid)
-
-    uniques_hashes = [hid for hid in inverse_index if hid not in universal_hashes_ and hid not in repeated_hashes]
-    
+
+    # check repeated text / images blocks
+    for entries in (text_index, img_index):
+        for hashid, entry in entries.items():
+            if entry["docs"] == corpus_len:
+                universal_hashes_.add(hashid)
+            elif entry["docs"] > 1:
+                repeated_hashes.add(hashid)
+
     # --- check if each universal_hash has the same bbox across docs
     universal_hashes_same_position = set()
     for hashid in universal_hashes_:
-        pos_dict = {}
-        if hashid in inverse_index:
-            pos_dict = inverse_index[hashid]
-        else:
-            pos_dict = img_inverse_index[hashid]
-        # supposing that a hashId occurs only 1 time in each doc
-        bbox_list = [b[0] for b in pos_dict.values()]
-        if is_same_location(bbox_list):
+        entry = img_index[hashid] if hashid in img_index else text_index[hashid]
+        if _same_location(entry):
             universal_hashes_same_position.add(hashid)
 
-    # --- using position_hash_dict to get boxes on the "same" location accross docs
-    # -- get first address_box
+    block_with_date = {h for h, e in text_index.items() if "date" in e["flags"]}
+    block_with_page = {h for h, e in text_index.items() if "page" in e["flags"]}
+    block_with_address = {h for h, e in text_index.items() if "address" in e["flags"]}
+    # -- address blocks on the location of a sample address block
     addr_blocks_same_location = set()
     if block_with_address:
-        samplehash = list(block_with_address)[0]
-        bbox_str = list(inverse_index[samplehash].values())[0][0]
-        poskey = get_position_key(bbox_str)
-        same_pos_blocks = position_hash_dict[poskey]
-        addr_blocks_same_location = set(same_pos_blocks).intersection(block_with_address)
-            
-    
-    
+        samplehash = min(block_with_address)
+        poskey = get_position_key(text_index[samplehash]["first"][1])
+        addr_blocks_same_location = {h for h in block_with_address if poskey in text_index[h]["poskeys"]}
+
     # ----------------------------------------------------------
     # make xml
     page_node = etree.Element('page')
     univ_block_node = etree.SubElement(page_node,"universal_blocks")
-    for hashid in universal_hashes_:
-        pos_dict = {}
+    for hashid in sorted(universal_hashes_):
         same_location = hashid in universal_hashes_same_position
-        if hashid in img_inverse_index:
-            type_ = "img"
-            pos_dict = img_inverse_index[hashid]
-        else:
-            pos_dict = inverse_index[hashid]  # {docid: [bbox]}
-        
-        bbox_str_ = list(pos_dict.values())[0][0]
-        bbox_str = bbox_str_
+        entry = img_index[hashid] if hashid in img_index else text_index[hashid]
+        bbox_str = entry["first"][1] if same_location else ""
         type_ = "unk"
         if hashid in block_with_date:
             type_ = "date"
         elif hashid in block_with_page:
             type_ = "pagination"
-        if not same_location:
-            bbox_str = ""
-        if hashid in img_inverse_index:
+        if hashid in img_index:
             type_ = "img"
             blocknode = etree.SubElement(univ_block_node,"image", fixedLocation=str(same_location).lower(), 
                                         type=type_, bbox=bbox_str)
@@ -407,44 +747,194 @@ def main_ignore(inputdir:str, output_dir:str, export_org_xml=True):
         else:
             blocknode = etree.SubElement(univ_block_node,"textblock", fixedLocation=str(same_location).lower(), 
                                         type=type_, bbox=bbox_str)
-            docid = list(pos_dict.keys())[0]
-            for tag in collection_dict[docid][bbox_str_]:
+            if "variants" in entry:  # family of near-duplicate blocks, content of its first block
+                blocknode.set("nearDuplicates", str(entry["variants"]))
+            for tag in entry["content"]:
                 if tag["type"] == "br":
                     br_node = etree.SubElement(blocknode,"br")
                 else:  # type = span
                     span_node = etree.SubElement(blocknode,"span", fontFamily=tag["fontFamily"], size=tag["size"], 
                                             color=tag["color"], bbox=tag["bbox"])
                     span_node.text = tag["text"]
-    
+
     # --
-    if len(addr_blocks_same_location) / corpus_len > 3/4:
+    address_bbox = None
+    if corpus_len and len(addr_blocks_same_location) / corpus_len > 3/4:
         # number of blocks with address and on same location is >= 3/4 of collections
-        samplehash = list(addr_blocks_same_location)[0]
-        bbox_str = list(inverse_index[samplehash].values())[0][0]
+        address_bbox = text_index[min(addr_blocks_same_location)]["first"][1]
         blocknode = etree.SubElement(univ_block_node,"textblock", fixedLocation="true", 
-                    type="address", bbox=bbox_str)
+                    type="address", bbox=address_bbox)
+
+    # compile_template takes {hash: {docid: [bbox_str]}}, the first location is enough
+    first_locations = lambda entries: {h: {entries[h]["first"][0]: [entries[h]["first"][1]]}
+                                       for h in universal_hashes_ if h in entries}
+    families = {h: text_index[h]["minhash"] for h in universal_hashes_ if "variants" in text_index.get(h, {})}
+    template = compile_template(universal_hashes_, universal_hashes_same_position, first_locations(text_index),
+                                first_locations(img_index), block_with_date, block_with_page, address_bbox, corpus_len,
+                                families, near_duplicate_threshold)
 
-    # for bbox, (W,H) in img_blocks:
-    #     bbox_str = ",".join([str(i) for i in bbox])
-    #     imgnode = etree.SubElement(univ_block_node,"image", bbox=bbox_str, width=str(W), height=str(H))
-    # Make a new document tree
     doc = etree.ElementTree(page_node)
     etree.indent(doc, space="    ")
     outstr = etree.tostring(doc)
-    # Save to XML file
-    # with open(out_path, 'wb') as outFile:
-    #     doc.write(outFile, xml_declaration=True, encoding='utf-8',pretty_print=True)
-    #     return 1
-    # pass
+    return outstr, template
+
+
+def analyse_corpus_index(index, near_duplicate_threshold=None):
+    """ Universal / repeated blocks of an indexed corpus, see analyse_partial_index
+
+    Args:
+    ---
+        index (dict): see new_corpus_index
+        near_duplicate_threshold (float, optional): see analyse_partial_index
+
+    Returns:
+    ---
+        tuple: aggregate structure xml (bytes), compiled template (dict, see src/template.py)
+    """
+    if near_duplicate_threshold is None:
+        near_duplicate_threshold = threshold_from_env()
+    partial = partial_index_from_corpus_index(index, near_duplicates=bool(near_duplicate_threshold))
+    return analyse_partial_index(partial, near_duplicate_threshold)
+
+
+def list_documents(input_dir, from_raw_xml=False, raw_xml_dir=None):
+    """ Documents of a corpus folder
+
+    Returns:
+    ---
+        list: [(docid, path)] of the pdf of input_dir, or of the raw xml of raw_xml_dir (default input_dir)
+            with from_raw_xml
+    """
+    if from_raw_xml:
+        return find_raw_xml_files(raw_xml_dir or input_dir)
+    return sorted((path.stem, path) for path in Path(input_dir).glob("*.pdf"))
+
+
+def extract_document(docid, path, output_dir, export_org_xml=True, pretty_print=False, extraction="layout",
+                     from_raw_xml=False, raw_xml_compression=None, raw_xml_dir=None, export_blocks=True, blocks_dir=None,
+                     decode_images=False):
+    """ Blocks of the 1st page of one document, with its images hashed, and its exports
+
+    Args:
+    ---
+        docid (str)
+        path (Path): pdf, or raw xml with from_raw_xml
+        output_dir (str): folder for images, None to only hash them
+        export_org_xml, pretty_print, extraction, from_raw_xml, raw_xml_compression: see index_corpus
+        raw_xml_dir (str, optional): where <docid>.raw.xml and <docid>.images.json are written. Defaults to
+            the folder of the pdf
+        export_blocks (bool, optional): write <docid>.blocks.xml. Defaults to True.
+        blocks_dir (str, optional): where <docid>.blocks.xml is written. Defaults to the folder of the document
+        decode_images (bool, optional): write decoded samples of the images that are not jpeg, see store_images
+
+    Returns:
+    ---
+        tuple: txt_blocks [(bbox, line_list)], img_blocks [StoredImage], (pageW, pageH)
+    """
+    path = Path(path)
+    if from_raw_xml:
+        txt_blocks, img_blocks, page_dim = extract_first_page_from_raw_xml(path)
+    else:
+        raw_xml_path = None
+        if export_org_xml and extraction == "layout":
+            raw_dir = Path(raw_xml_dir or path.parent)
+            raw_xml_path = (raw_dir / raw_xml_name(docid, raw_xml_compression)).as_posix()
+        txt_blocks, img_blocks, page_dim = extract_first_page(path.as_posix(), extraction, raw_xml_path, pretty_print)
+        img_blocks = store_images(img_blocks, output_dir, decode_images)
+        if raw_xml_path:
+            save_image_manifest(img_blocks, raw_dir / f"{docid}.images.json")
+    if export_blocks:
+        out_path = Path(blocks_dir or path.parent) / f"{docid}.blocks.xml"
+        export_to_my_xml(txt_blocks, img_blocks, out_path, pretty_print=pretty_print)
+    return txt_blocks, img_blocks, page_dim
+
+
+def index_corpus(inputdir:str, output_dir:str, export_org_xml=True, pretty_print=False, profile_docids=None, profile_dir=None,
+                 extraction="layout", from_raw_xml=False, raw_xml_compression=None, shard=None, raw_xml_dir=None,
+                 export_blocks=True, blocks_dir=None, decode_images=False):
+    """ Extract and index every document of a folder (the per document part of main_ignore)
+
+    Args:
+    ---
+        inputdir (str): folder of pdf
+        output_dir (str): folder for images
+        export_org_xml (bool, optional): write pdfminer xml next to each pdf. Defaults to True.
+        pretty_print (bool, optional): indent exported xml files. Defaults to False.
+        profile_docids (set or "all", optional): documents to profile (cProfile, memory peak, stage timings)
+        profile_dir (str, optional): where profiles are written. Defaults to output_dir/profiles
+        extraction (str, optional): "layout" or "glyphs" (fast path, no raw xml export), see extract_first_page
+        from_raw_xml (bool, optional): rebuild blocks from the <docid>.raw.xml[.gz|.zst] (and .images.json) written
+            by a previous run in the input folder, without parsing the pdf again. Defaults to False.
+        raw_xml_compression (str, optional): None, "gz" or "zst", compression of the exported raw xml
+        shard (tuple, optional): (i, n) only index the documents of shard i out of n, see shard_of
+        raw_xml_dir, export_blocks, blocks_dir, decode_images: see extract_document
+
+    Returns:
+    ---
+        dict: corpus index, see new_corpus_index
+    """
+    from tqdm import tqdm  # batch only, kept off the import path of the server
+
+    check_raw_xml_compression(raw_xml_compression)
+    in_dir = Path(inputdir)
+
+    index = new_corpus_index()
+
+    sources = list_documents(in_dir, from_raw_xml, raw_xml_dir)
+    if shard is not None:
+        sources = [(docid, path) for docid, path in sources if shard_of(docid, shard[1]) == shard[0]]
+
+    try:
+        for docid, path in tqdm(sources):
+            # print("DOCUMENT ::", docid)
+            profile = None
+            if profile_docids and (profile_docids == "all" or docid in profile_docids):
+                profile = DocumentProfile(docid).start()
+            txt_blocks, img_blocks, page_dim = extract_document(docid, path, output_dir, export_org_xml, pretty_print,
+                                                                extraction, from_raw_xml, raw_xml_compression,
+                                                                raw_xml_dir, export_blocks, blocks_dir, decode_images)
+            index_document(index, docid, txt_blocks, img_blocks, page_dim)
+
+            if profile is not None:
+                profile.stop()
+                profile.write(profile_dir or Path(output_dir) / "profiles")
+    finally:
+        IMAGE_WRITER.flush()  # images are written in the background while the next documents are parsed
+
+    return index
+
+
+def main_ignore(inputdir:str, output_dir:str, export_org_xml=True, pretty_print=False, profile_docids=None, profile_dir=None,
+             extraction="layout", from_raw_xml=False, raw_xml_compression=None, template_path=None):
+    """ Main app
+
+    Args:
+    ---
+        inputdir (str): folder of pdf
+        output_dir (str): folder for images
+        export_org_xml (bool, optional): write pdfminer xml next to each pdf. Defaults to True.
+        pretty_print (bool, optional): indent exported xml files. Defaults to False.
+        profile_docids (set or "all", optional): documents to profile (cProfile, memory peak, stage timings)
+        profile_dir (str, optional): where profiles are written. Defaults to output_dir/profiles
+        extraction (str, optional): "layout" or "glyphs" (fast path, no raw xml export), see extract_first_page
+        from_raw_xml (bool, optional): rebuild blocks from the <docid>.raw.xml[.gz|.zst] (and .images.json) written
+            by a previous run in the input folder, without parsing the pdf again. Defaults to False.
+        raw_xml_compression (str, optional): None, "gz" or "zst", compression of the exported raw xml
+        template_path (str, optional): if given, the structure is also saved there as a compiled template
+            for matching new documents (see src/template.py)
+    """
+    index = index_corpus(inputdir, output_dir, export_org_xml, pretty_print, profile_docids, profile_dir, extraction,
+                         from_raw_xml, raw_xml_compression)
+    outstr, template = analyse_corpus_index(index)
+    if template_path:
+        from src.template import save_template
+        save_template(template, template_path)
     return outstr
 
 
 
 
 if __name__ == "__main__":
-    indir = "/home/jean/myriad/projects/poc/migration_ccm/data/A511"
-    outdir = "/home/jean/myriad/projects/poc/migration_ccm/data/A511_output"
-    out_xml_str = oth_main(indir, outdir)
-    with open(outdir+ "/agg_struct.xml","wb") as f:
-        f.write(out_xml_str)
-    
\ No newline at end of file
+    # corpus processing CLI (checkpoint / resume, workers, outputs), see src/batch.py
+    from src.batch import main
+    sys.exit(main())
@@ -0,0 +1,357 @@
+""" Compiled corpus template: learn the structure of a corpus once (main_ignore), then classify the
+blocks of one new document against it in time proportional to the size of that document.
+
+A template is a json file:
+
+    {"version": 5, "corpus_size": N,
+     "blocks": {hash: {"kind": "text"|"img", "type": "unk"|"date"|"pagination"|"img",
+                       "fixedLocation": bool, "bbox": "x0,y0,x1,y1",
+                       "minhash": [int]}},  # family of near-duplicate text blocks only
+     "positions": {"x0_y1": [hash]},    # fixed location blocks, key from get_position_key()
+     "address": "x0,y0,x1,y1" or null,  # location of the address block, if the corpus has one
+     "near_duplicate_threshold": float or null,  # similarity of a block to a family, see utils/minhash.py
+     "bands": {"band:rows": [hash]}}    # LSH buckets of the families, a block is only compared to its buckets
+"""
+import os, sys
+this_dir = os.path.dirname(os.path.abspath(__file__))
+PROJECT_DIR = '/'.join(this_dir.split('/')[:-1])
+if PROJECT_DIR not in sys.path:
+    sys.path.insert(1, PROJECT_DIR)
+
+import json
+import random
+import time
+from collections import Counter
+from pathlib import Path
+
+from src.utils import is_same_location, sha256_hash_str
+from src.utils.minhash import band_keys, minhash_signature, shingles, similarity
+from src.utils.pdf2xml import image_stream_hash
+from src.utils.pdf_backends import get_backend
+from src.strategies import analyse_corpus_index, extract_first_page, get_position_key, index_document, \
+                        new_corpus_index, store_images
+
+
+TEMPLATE_VERSION = 5  # 2: image hashes from the encoded stream, 3: encoded stream cut to its /Length,
+                      # 4: near-duplicate families, 5: LSH bands of the families
+
+
+def compile_template(universal_hashes, same_position_hashes, inverse_index, img_inverse_index, block_with_date=(),
+                     block_with_page=(), address_bbox=None, corpus_size=0, near_duplicates=None,
+                     near_duplicate_threshold=None):
+    """ Build a template from the indexes computed by main_ignore
+
+    Args:
+    ---
+        universal_hashes (set): hashids found in every document
+        same_position_hashes (set): universal hashids found at the same location in every document
+        inverse_index (dict): block_hash -> {docid: [bbox_str]}
+        img_inverse_index (dict): img_hash -> {docid: [bbox_str]}
+        block_with_date (set, optional): hashids of date blocks
+        block_with_page (set, optional): hashids of pagination blocks
+        address_bbox (str, optional): bbox of the address block at a fixed location
+        corpus_size (int, optional): number of documents the template was learned from
+        near_duplicates (dict, optional): hashid -> minhash of the universal families of near-duplicate blocks
+        near_duplicate_threshold (float, optional): similarity of a block to a family
+
+    Returns:
+    ---
+        dict: template, see module docstring
+    """
+    blocks = {}
+    positions = {}
+    bands = {}
+    for hashid in universal_hashes:
+        is_img = hashid in img_inverse_index
+        pos_dict = img_inverse_index[hashid] if is_img else inverse_index[hashid]
+        bbox_str = list(pos_dict.values())[0][0]
+        type_ = "unk"
+        if is_img:
+            type_ = "img"
+        elif hashid in block_with_date:
+            type_ = "date"
+        elif hashid in block_with_page:
+            type_ = "pagination"
+        fixed = hashid in same_position_hashes
+        blocks[hashid] = {"kind": "img" if is_img else "text", "type": type_, "fixedLocation": fixed, "bbox": bbox_str}
+        if near_duplicates and hashid in near_duplicates:
+            blocks[hashid]["minhash"] = near_duplicates[hashid]
+            for key in _lsh_keys(near_duplicates[hashid]):
+                bands.setdefault(key, []).append(hashid)
+        if fixed:
+            positions.setdefault(get_position_key(bbox_str), []).append(hashid)
+    return {"version": TEMPLATE_VERSION, "corpus_size": corpus_size, "blocks": blocks, "positions": positions,
+            "address": address_bbox, "near_duplicate_threshold": near_duplicate_threshold if near_duplicates else None,
+            "bands": bands}
+
+
+def _lsh_keys(sig):
+    """ band_keys of a signature as json object keys"""
+    return [f"{band}:{'.'.join(str(v) for v in rows)}" for band, rows in band_keys(sig)]
+
+
+def save_template(template, path):
+    with open(path, "w") as f:
+        json.dump(template, f, indent=1)
+
+
+def load_template(path):
+    with open(path) as f:
+        template = json.load(f)
+    if template.get("version") != TEMPLATE_VERSION:
+        raise ValueError(f"unsupported template version {template.get('version')} in {path}")
+    return template
+
+
+def _bbox_str(bbox):
+    return ",".join([str(i) for i in bbox])
+
+
+def _image_hash(img):
+    """ Same hash as main_ignore: StoredImage already has it, LTImage is hashed from its stream"""
+    hash_ = getattr(img, "hash", None)
+    if hash_ is None:
+        hash_ = image_stream_hash(img.stream)
+    return hash_
+
+
+def match_document(template, txt_blocks, img_blocks):
+    """ Classify the blocks of one document against a template
+
+    Each block is "universal" (its hash is a universal block of the corpus, or its text is a near-duplicate
+    of a universal family: "family" is then the hash of the family) or "variable". A variable
+    block found where the template expects a fixed block records the expected hash ("replaces"); a
+    universal block expected at a fixed location but found elsewhere is flagged "moved". Universal
+    blocks of the template that are not in the document are "missing".
+
+    Args:
+    ---
+        template (dict): output of compile_template / load_template
+        txt_blocks (list): [(bbox, line_list)], see extract_first_page
+        img_blocks (list): [LTImage] or [StoredImage]
+
+    Returns:
+    ---
+        dict: {"blocks": [{"kind", "bbox", "hash", "status", "type", ...}], "missing": [{"hash", "kind", "type", "bbox"}],
+               "universal_found": int, "universal_expected": int, "score": float}
+    """
+    expected = template["blocks"]
+    positions = template["positions"]
+    address_key = get_position_key(template["address"]) if template.get("address") else None
+    found = set()
+    blocks = []
+
+    bands = template["bands"]
+    doc_blocks = []
+    for b_bbox, linelist in txt_blocks:
+        text = "\n".join("".join(line[1]) for line in linelist)
+        doc_blocks.append(("text", b_bbox, sha256_hash_str(text), text))
+    doc_blocks += [("img", img.bbox, _image_hash(img), None) for img in img_blocks]
+    for kind, bbox, hash_, text in doc_blocks:
+        bbox_str = _bbox_str(bbox)
+        entry = {"kind": kind, "bbox": bbox_str, "hash": hash_}
+        template_hash = hash_
+        if hash_ not in expected and bands and text:
+            template_hash = _near_duplicate_family(text, expected, bands, template["near_duplicate_threshold"])
+            if template_hash is not None:
+                entry["family"] = template_hash
+        tmpl = expected.get(template_hash)
+        if tmpl is not None:
+            found.add(template_hash)
+            entry.update(status="universal", type=tmpl["type"])
+            if tmpl["fixedLocation"] and not is_same_location([tmpl["bbox"], bbox_str]):
+                entry["moved"] = True
+        else:
+            poskey = get_position_key(bbox)
+            entry.update(status="variable", type="address" if poskey == address_key else ("img" if kind == "img" else "unk"))
+            replaced = [h for h in positions.get(poskey, []) if expected[h]["kind"] == kind]
+            if replaced:
+                entry["replaces"] = replaced[0]
+        blocks.append(entry)
+
+    missing = [{"hash": h, "kind": tmpl["kind"], "type": tmpl["type"], "bbox": tmpl["bbox"]}
+               for h, tmpl in expected.items() if h not in found]
+    return {
+        "blocks": blocks,
+        "missing": missing,
+        "universal_found": len(found),
+        "universal_expected": len(expected),
+        "score": len(found) / len(expected) if expected else 1.0,
+    }
+
+
+def _near_duplicate_family(text, expected, bands, threshold):
+    """ Hash of the family most similar to a text among the families sharing an LSH band with it (a fixed
+    number of lookups, whatever the number of families), None if none reaches threshold"""
+    sig = minhash_signature(text)
+    if sig is None:
+        return None
+    candidates = {h for key in _lsh_keys(sig) for h in bands.get(key, ())}
+    if not candidates:
+        return None
+    score, hashid = max((similarity(sig, expected[h]["minhash"]), h) for h in candidates)
+    return hashid if score >= threshold else None
+
+
+def match_pdf(template, path_str, extraction="layout"):
+    """ Extract the 1st page of a pdf and match it against a template, see match_document"""
+    txt_blocks, img_blocks, _ = extract_first_page(path_str, extraction)
+    return match_document(template, txt_blocks, img_blocks)
+
+
+def template_path(template_dir, name):
+    """ <template_dir>/<name>.json, name restricted to [A-Za-z0-9_.-] (no path traversal)"""
+    if not name or name.startswith(".") or not all(c.isalnum() or c in "_.-" for c in name):
+        raise ValueError(f"invalid template name {name!r}")
+    return Path(template_dir) / f"{name}.json"
+
+
+# ----------------------------------------------------------
+# sample-then-verify template discovery
+
+REGION_TOLERANCE = 5  # points around a fixed block bbox when looking for its glyphs
+
+
+def _signature(text):
+    """ Order and whitespace independent signature of a text: multiset of its non blank characters"""
+    return Counter(c for c in text if not c.isspace())
+
+
+def _in_region(bbox, region):
+    x0, y0, x1, y1 = bbox
+    rx0, ry0, rx1, ry1 = region
+    cx, cy = (x0 + x1) / 2, (y0 + y1) / 2
+    return rx0 - REGION_TOLERANCE <= cx <= rx1 + REGION_TOLERANCE and ry0 - REGION_TOLERANCE <= cy <= ry1 + REGION_TOLERANCE
+
+
+def _verify_candidate(cand, chars, images, page_signature, page_shingles=None):
+    """ Cheap check that a candidate block is in a document, from its raw glyphs and images (no layout analysis)
+
+    A fixed text block must have exactly its characters inside its region, a moving one must be
+    contained in the page text. A fixed family of near-duplicate blocks must be similar to the text of
+    its region. A moving one cannot be delimited without layout analysis: at least `near_duplicate_threshold`
+    of the shingles of its text must be in the page text (a near-duplicate block always is, its similarity
+    is at most this fraction). An image must have the same stream hash (at its location if fixed).
+    """
+    region = tuple(map(float, cand["bbox"].split(","))) if cand["fixedLocation"] else None
+    if "minhash" in cand:
+        if region is None:
+            found = len(cand["shingles"] & page_shingles)
+            return found >= cand["near_duplicate_threshold"] * len(cand["shingles"])
+        sig = minhash_signature("".join(text for bbox, text, _ in chars if _in_region(bbox, region)))
+        return sig is not None and similarity(sig, cand["minhash"]) >= cand["near_duplicate_threshold"]
+    if cand["kind"] == "img":
+        for img in images:
+            if region is not None and not is_same_location([region, img.bbox]):
+                continue
+            if image_stream_hash(img.stream) == cand["hash"]:
+                return True
+        return False
+    if region is not None:
+        return _signature("".join(text for bbox, text, _ in chars if _in_region(bbox, region))) == cand["signature"]
+    return not (cand["signature"] - page_signature)
+
+
+def discover_template(input_dir, sample_size=50, seed=0, verify_limit=None, extraction="layout"):
+    """ Template of a (huge) corpus without running the full analysis on every document.
+
+    1. a random sample of `sample_size` pdf is analysed like main_ignore: the universal blocks of the
+       sample are the candidates (a block universal in the corpus is necessarily universal in the sample);
+    2. candidates are verified on the other documents with the raw glyph path (no layout analysis)
+       restricted to their region. A candidate is dropped at its first failure, verification stops
+       when no candidate is left or after `verify_limit` documents.
+
+    Args:
+    ---
+        input_dir (str): folder of pdf
+        sample_size (int, optional): number of documents fully analysed. Defaults to 50.
+        seed (int, optional): random seed of the sample
+        verify_limit (int, optional): max number of documents used for verification, None = all the others
+        extraction (str, optional): extraction of the sampled documents, see extract_first_page
+
+    Returns:
+    ---
+        dict: template (see compile_template) restricted to the verified blocks, with a "discovery" entry:
+            {"documents", "sample_size", "verified_documents", "coverage", "seconds", "rejected": {hash: docid},
+             "blocks": {hash: {"present_in", "max_missing_rate_95"}}}
+            max_missing_rate_95 is 0 when every document was checked, else the rule of three bound 3/n on
+            the fraction of documents without the block (95% confidence).
+    """
+    from tqdm import tqdm  # offline tool, kept off the import path of the server
+
+    start = time.perf_counter()
+    paths = sorted(Path(input_dir).glob("*.pdf"))
+    rnd = random.Random(seed)
+    sample = rnd.sample(paths, min(sample_size, len(paths)))
+    sample_set = set(sample)
+    rest = [p for p in paths if p not in sample_set]
+    rnd.shuffle(rest)
+    if verify_limit is not None:
+        rest = rest[:verify_limit]
+
+    # --- 1. full analysis of the sample
+    index = new_corpus_index()
+    for path in tqdm(sample, desc="sample"):
+        txt_blocks, img_blocks, page_dim = extract_first_page(path.as_posix(), extraction)
+        index_document(index, path.stem, txt_blocks, store_images(img_blocks, None), page_dim)
+    _, template = analyse_corpus_index(index)
+
+    candidates = {}
+    for hashid, block in template["blocks"].items():
+        cand = dict(block, hash=hashid, near_duplicate_threshold=template["near_duplicate_threshold"])
+        if block["kind"] == "text":
+            docid, bboxes = next(iter(index["inverse_index"][hashid].items()))
+            content = index["collection_dict"][docid][bboxes[0]]
+            cand["signature"] = _signature("".join(tag.get("text", "") for tag in content))
+            if "minhash" in block:
+                cand["shingles"] = shingles("".join(tag.get("text", "") for tag in content))
+        candidates[hashid] = cand
+    present_in = {hashid: len(sample) for hashid in candidates}
+
+    # --- 2. verification, dropping a candidate at its first failure
+    alive = dict(candidates)
+    rejected = {}
+    verified = 0
+    backend = get_backend()
+    for path in tqdm(rest, desc="verify"):
+        if not alive:
+            break
+        pages = backend.iter_pages(path.as_posix(), maxpages=1)
+        _, chars, images = next(pages, (None, [], []))
+        pages.close()
+        page_signature = page_shingles = None
+        if any(c["kind"] == "text" and not c["fixedLocation"] for c in alive.values()):
+            page_signature = _signature("".join(text for _, text, _ in chars))
+        if any("minhash" in c and not c["fixedLocation"] for c in alive.values()):
+            page_shingles = shingles("".join(text for _, text, _ in chars))
+        for hashid, cand in list(alive.items()):
+            if _verify_candidate(cand, chars, images, page_signature, page_shingles):
+                present_in[hashid] += 1
+            else:
+                rejected[hashid] = path.stem
+                del alive[hashid]
+        verified += 1
+
+    all_checked = len(sample) + verified == len(paths)
+    blocks = {h: b for h, b in template["blocks"].items() if h in alive}
+    positions = {}
+    for hashid, block in blocks.items():
+        if block["fixedLocation"]:
+            positions.setdefault(get_position_key(block["bbox"]), []).append(hashid)
+    bands = {}
+    for key, hashes in template["bands"].items():
+        kept = [h for h in hashes if h in blocks]
+        if kept:
+            bands[key] = kept
+    template.update(blocks=blocks, positions=positions, bands=bands, corpus_size=len(paths))
+    template["discovery"] = {
+        "documents": len(paths),
+        "sample_size": len(sample),
+        "verified_documents": verified,
+        "coverage": (len(sample) + verified) / len(paths) if paths else 1.0,
+        "seconds": time.perf_counter() - start,
+        "rejected": rejected,
+        "blocks": {h: {"present_in": present_in[h], "max_missing_rate_95": 0.0 if all_checked else 3 / present_in[h]}
+                   for h in blocks},
+    }
+    return template
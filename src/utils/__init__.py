@@ -10,10 +10,11 @@ from binascii import b2a_hex
 import imghdr
 from typing import List, Tuple
 import hashlib
-import numpy as np
 import itertools
 import unicodedata
 
+from src.utils.metrics import timed
+
 
 
 def remove_accent(txt):
@@ -159,6 +160,7 @@ def construct_lines_columns(character_nodes_list:List):
     return final_list
 
 
+@timed("grouping_text")
 def grouping_text(character_nodes_list:List, line_gap_r=2.5, col_gap_r=3):
     """ Given a list-like of char_node (bbox,str), try to detect different textboxes   
     1. Split blocks by Y -> block_i
@@ -292,6 +294,7 @@ def is_same_location(bbox_list:List):
     #         if len(bbox_) == 4:
     #             bbox = bbox_
     #     (x0,y0,x1,y1) = bbox
+    import numpy as np  # only needed here, kept off the import path of the server
     a = np.std(bbox_list,axis=0)
     return np.mean(a) < 5  # 5 pixels of derivation on each dimension
 
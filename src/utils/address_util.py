@@ -2,6 +2,7 @@ import os
 import sys
 import re
 import pickle
+import threading
 
 this_dir = os.path.dirname(os.path.abspath(__file__))
 PROJECT_DIR = '/'.join(this_dir.split('/')[:-2])
@@ -11,9 +12,9 @@ if PROJECT_DIR not in sys.path:
 from src.utils import remove_accent
 
 
-f = open(PROJECT_DIR + '/src/basedata/codepostal_ville_dict.pkl', 'rb')
-CP_VILLE_DICT = pickle.load(f)  # d[cp] = [(nom_postal,nom_complet)]
-f.close()
+CP_VILLE_PATH = PROJECT_DIR + '/src/basedata/codepostal_ville_dict.pkl'
+_cp_ville_dict = None  # d[cp] = [(nom_postal,nom_complet)], loaded at first use
+_cp_ville_lock = threading.Lock()
 
 RE_CODEPOSTAL = re.compile(r"[ ,](\d{2}[ -]?\d{3}?(?!\d))")
 VILLE_CLEAN_RE = re.compile(r"(\d+|-|'|ste?(?!\w)|sainte?(?!\w))")  # to be improve
@@ -21,6 +22,24 @@ MULTISPACE_RE = re.compile(r"\s+")
 
 
 
+def get_cp_ville_dict():
+    """ Postal code dictionary, unpickled at the first call (not at import: it is the largest data of the project)"""
+    global _cp_ville_dict
+    if _cp_ville_dict is None:
+        with _cp_ville_lock:
+            if _cp_ville_dict is None:
+                with open(CP_VILLE_PATH, 'rb') as f:
+                    _cp_ville_dict = pickle.load(f)
+    return _cp_ville_dict
+
+
+def __getattr__(name):
+    # CP_VILLE_DICT stays available as a module attribute, loaded when it is first accessed
+    if name == "CP_VILLE_DICT":
+        return get_cp_ville_dict()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+
 def _uniform_city_name(txt):
     """
     txt = supp_accent(txt.lower())\n
@@ -41,16 +60,17 @@ def find_codepostal(txt):
         List[Tuple]: [(cp,ville)]
     """
     found = []
+    cp_ville_dict = get_cp_ville_dict()
     txt = txt.replace("\n"," ")
     txt = MULTISPACE_RE.sub(" ",txt)
     matches = RE_CODEPOSTAL.finditer(txt) 
     for match in matches:
         cp = match.group(0).strip()
-        if cp in CP_VILLE_DICT:  
+        if cp in cp_ville_dict:  
             start = match.span()[1]
             tail = txt[start:]
             tail = _uniform_city_name(tail)
-            for ville,nom_complet in CP_VILLE_DICT[cp]:
+            for ville,nom_complet in cp_ville_dict[cp]:
                 if _uniform_city_name(ville) in tail:
                     found.append((cp,nom_complet))
                     break
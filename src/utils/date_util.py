@@ -1,12 +1,13 @@
 # -*- coding: utf-8 -*-
 import re
+from functools import lru_cache
 
 NON_ALPHA_RE = re.compile(r'\W')
 # DATE_ALLSEP_RE = re.compile(r'(0[1-9]|[12][0-9]|3[01])(?:([eè]re?)|e|è)?[\/\-\. ]((0[1-9]|1[012])|(jan(vier)?)|(f[ée]v(rier)?)|(mar(s)?)|(avr(il)?)|(mai)|(jui(n)?)|(jul(liet)?)|(ao[uû]t)|(sep(tembre)?)|(oct(obre)?)|(nov(embre)?)|(d[eé]c(embre)?))[\/\-\. ](?:\d{2}){1,2}')
-DATE_SLASH_RE =  re.compile(r'(?<!\d)(?:0?[1-9]|[12][0-9]|3[01])(?:([eè]re?)|e|è)?\/((0?[1-9]|1[012])|(jan(vier)?)|(f[ée]v(rier)?)|(mar(s)?)|(avr(il)?)|(mai)|(jui(n)?)|(jul(liet)?)|(ao[uû]t)|(sep(tembre)?)|(oct(obre)?)|(nov(embre)?)|(d[eé]c(embre)?))\/(?:(?:20)?\d{2}(?!\d))')
-DATE_HYPHEN_RE = re.compile(r'(?<!\d)(?:0?[1-9]|[12][0-9]|3[01])(?:([eè]re?)|e|è)?\-((0?[1-9]|1[012])|(jan(vier)?)|(f[ée]v(rier)?)|(mar(s)?)|(avr(il)?)|(mai)|(jui(n)?)|(jul(liet)?)|(ao[uû]t)|(sep(tembre)?)|(oct(obre)?)|(nov(embre)?)|(d[eé]c(embre)?))\-(?:(?:20)?\d{2}(?!\d))')
-DATE_POINT_RE =  re.compile(r'(?<!\d)(?:0?[1-9]|[12][0-9]|3[01])(?:([eè]re?)|e|è)?\.((0?[1-9]|1[012])|(jan(vier)?)|(f[ée]v(rier)?)|(mar(s)?)|(avr(il)?)|(mai)|(jui(n)?)|(jul(liet)?)|(ao[uû]t)|(sep(tembre)?)|(oct(obre)?)|(nov(embre)?)|(d[eé]c(embre)?))\.(?:(?:20)?\d{2}(?!\d))')
-DATE_SPACE_RE =  re.compile(r'(?<!\d)(?:0?[1-9]|[12][0-9]|3[01])(?:([eè]re?)|e|è)? ((jan(vier)?)|(f[ée]v(rier)?)|(mar(s)?)|(avr(il)?)|(mai)|(jui(n)?)|(jul(liet)?)|(ao[uû]t)|(sept?(embre)?)|(oct(obre)?)|(nov(embre)?)|(d[eé]c(embre)?))\.? (?:(?:20)?\d{2}(?!\d))')
+DATE_SLASH_PATTERN =  r'(?<!\d)(?:0?[1-9]|[12][0-9]|3[01])(?:([eè]re?)|e|è)?\/((0?[1-9]|1[012])|(jan(vier)?)|(f[ée]v(rier)?)|(mar(s)?)|(avr(il)?)|(mai)|(jui(n)?)|(jul(liet)?)|(ao[uû]t)|(sep(tembre)?)|(oct(obre)?)|(nov(embre)?)|(d[eé]c(embre)?))\/(?:(?:20)?\d{2}(?!\d))'
+DATE_HYPHEN_PATTERN = r'(?<!\d)(?:0?[1-9]|[12][0-9]|3[01])(?:([eè]re?)|e|è)?\-((0?[1-9]|1[012])|(jan(vier)?)|(f[ée]v(rier)?)|(mar(s)?)|(avr(il)?)|(mai)|(jui(n)?)|(jul(liet)?)|(ao[uû]t)|(sep(tembre)?)|(oct(obre)?)|(nov(embre)?)|(d[eé]c(embre)?))\-(?:(?:20)?\d{2}(?!\d))'
+DATE_POINT_PATTERN =  r'(?<!\d)(?:0?[1-9]|[12][0-9]|3[01])(?:([eè]re?)|e|è)?\.((0?[1-9]|1[012])|(jan(vier)?)|(f[ée]v(rier)?)|(mar(s)?)|(avr(il)?)|(mai)|(jui(n)?)|(jul(liet)?)|(ao[uû]t)|(sep(tembre)?)|(oct(obre)?)|(nov(embre)?)|(d[eé]c(embre)?))\.(?:(?:20)?\d{2}(?!\d))'
+DATE_SPACE_PATTERN =  r'(?<!\d)(?:0?[1-9]|[12][0-9]|3[01])(?:([eè]re?)|e|è)? ((jan(vier)?)|(f[ée]v(rier)?)|(mar(s)?)|(avr(il)?)|(mai)|(jui(n)?)|(jul(liet)?)|(ao[uû]t)|(sept?(embre)?)|(oct(obre)?)|(nov(embre)?)|(d[eé]c(embre)?))\.? (?:(?:20)?\d{2}(?!\d))'
 ER_RE = re.compile(r"[eérè]")
 
 
@@ -59,6 +60,12 @@ def uniform_date(date_string):
         return None
 
 
+@lru_cache(maxsize=None)
+def _date_regexes():
+    """ The date regexes, compiled at the first search rather than at import"""
+    return [re.compile(p) for p in (DATE_SLASH_PATTERN, DATE_SPACE_PATTERN, DATE_HYPHEN_PATTERN, DATE_POINT_PATTERN)]
+
+
 def get_dates_in_text(text):
     """Given a text, find all date patterns
     
@@ -72,7 +79,7 @@ def get_dates_in_text(text):
         - orginal_date: date_form as found in text
         - nice_form_date: orginal_date convert to format dd/MM/YYYY
     """
-    regexes = [DATE_SLASH_RE,DATE_SPACE_RE,DATE_HYPHEN_RE,DATE_POINT_RE]
+    regexes = _date_regexes()
     out = []
     for regex in regexes:
         result = regex.finditer(text)
@@ -0,0 +1,138 @@
+""" Process-wide background writer of image files.
+
+Writing each image synchronously in the document loop (one stat to know if <hash><ext> exists, then
+one write) serializes the pipeline behind file system latency, which is high on network file
+systems. Here:
+
+- the names already written in a folder are kept in memory, the folder is listed once when it is
+  first used instead of one stat per image;
+- new files are written by a bounded pool of threads (at most `max_pending` images in memory), as
+  a temporary file renamed into place, so a crash never leaves a truncated image behind.
+
+Writes are asynchronous: call flush() before relying on the files (end of a corpus, document
+recorded in a checkpoint). flush() raises the first write error.
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.metrics import Counter, REGISTRY
+
+
+IMAGE_WRITERS_ENV = "CCM_IMAGE_WRITERS"
+DEFAULT_IMAGE_WRITERS = 4
+DEFAULT_MAX_PENDING = 64
+
+IMAGE_WRITES = REGISTRY.register(Counter(
+    "ccm_image_writes_total", "Images given to the image writer.", ["result"]))
+
+
+class ImageWriter:
+    """ Write files once per name with a bounded pool of threads, 0 threads = write in the caller"""
+
+    def __init__(self, max_workers=DEFAULT_IMAGE_WRITERS, max_pending=DEFAULT_MAX_PENDING):
+        self.max_workers = max_workers
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._lock = threading.Lock()
+        self._seen = {}  # folder -> set of file names present or being written
+        self._pending = set()
+        self._errors = []
+        self._pool = None
+
+    def _names(self, folder):
+        """ Names of a folder, listed at its first use (caller holds the lock)"""
+        names = self._seen.get(folder)
+        if names is None:
+            names = {n for n in os.listdir(folder) if not n.startswith(".")} if os.path.isdir(folder) else set()
+            self._seen[folder] = names
+        return names
+
+    def write(self, path, data):
+        """ Write data to path unless this file was already written (or found) in its folder
+
+        Args:
+        ---
+            path (str or Path)
+            data (bytes or callable): file content, a callable is only called (in the caller thread) when the
+                file has to be written
+
+        Returns:
+        ---
+            bool: True if a write was scheduled
+        """
+        folder, name = os.path.split(os.path.normpath(os.fspath(path)))
+        with self._lock:
+            names = self._names(folder)
+            if name in names:
+                IMAGE_WRITES.inc(result="seen")
+                return False
+            names.add(name)
+        IMAGE_WRITES.inc(result="written")
+        if callable(data):
+            try:
+                data = data()
+            except Exception:
+                with self._lock:
+                    names.discard(name)
+                raise
+        if self.max_workers <= 0:
+            self._write(folder, name, data)
+            return True
+        self._slots.acquire()  # back pressure: at most max_pending images waiting to be written
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(self.max_workers, thread_name_prefix="ccm-image-writer")
+            future = self._pool.submit(self._write, folder, name, data)
+            self._pending.add(future)
+        future.add_done_callback(self._done)
+        return True
+
+    def _write(self, folder, name, data):
+        tmp_path = os.path.join(folder, f".{name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, os.path.join(folder, name))
+        except Exception:
+            with self._lock:
+                self._seen.get(folder, set()).discard(name)  # let a later call try again
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _done(self, future):
+        with self._lock:
+            self._pending.discard(future)
+            if future.exception() is not None:
+                self._errors.append(future.exception())
+        self._slots.release()
+
+    def flush(self):
+        """ Wait for the scheduled writes
+
+        Raises:
+        ---
+            OSError: first error of the writes since the last flush
+        """
+        while True:
+            with self._lock:
+                pending = list(self._pending)
+            if not pending:
+                break
+            for future in pending:
+                future.exception()  # waits
+        with self._lock:
+            errors, self._errors = self._errors, []
+        if errors:
+            raise errors[0]
+
+    def forget(self, folder=None):
+        """ Drop the names known for a folder (all folders if None), e.g. after files were deleted"""
+        with self._lock:
+            if folder is None:
+                self._seen.clear()
+            else:
+                self._seen.pop(os.path.normpath(os.fspath(folder)), None)
+
+
+IMAGE_WRITER = ImageWriter(int(os.environ.get(IMAGE_WRITERS_ENV, DEFAULT_IMAGE_WRITERS)))
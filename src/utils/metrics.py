@@ -0,0 +1,181 @@
+""" Minimal in-process metrics (counters, gauges, histograms) rendered in Prometheus text format.
+
+Metrics are process-wide and thread-safe. Each worker process exposes its own values.
+"""
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 50000, 100000)
+BYTES_BUCKETS = (1e3, 1e4, 1e5, 1e6, 5e6, 1e7, 5e7, 1e8)
+
+
+def _format_labels(labelnames, labelvalues, extra=None):
+    pairs = list(zip(labelnames, labelvalues))
+    if extra:
+        pairs.append(extra)
+    if not pairs:
+        return ""
+    escaped = [(k, str(v).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')) for k, v in pairs]
+    return "{" + ",".join(f'{k}="{v}"' for k, v in escaped) + "}"
+
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class _Metric:
+    type_ = ""
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values = {}  # {labelvalues: value}
+        self._lock = threading.Lock()
+
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, given {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _samples(self):
+        """ yield (suffix, labelvalues, extra_label, value)"""
+        for key, value in self._values.items():
+            yield "", key, None, value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.type_}"]
+        with self._lock:
+            for suffix, key, extra, value in self._samples():
+                lines.append(f"{self.name}{suffix}{_format_labels(self.labelnames, key, extra)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    type_ = "counter"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(_Metric):
+    type_ = "gauge"
+
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def dec(self, amount=1, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+
+class Histogram(_Metric):
+    type_ = "histogram"
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [[0] * len(self.buckets), 0.0, 0]  # [bucket counts, sum, count]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[0][i] += 1
+                    break
+            state[1] += value
+            state[2] += 1
+
+    def _samples(self):
+        for key, (counts, sum_, count) in self._values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", key, ("le", _format_value(bound)), cumulative
+            yield "_sum", key, None, sum_
+            yield "_count", key, None, count
+
+
+class Registry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        """ Prometheus text exposition format (version 0.0.4)"""
+        return "\n".join(metric.render() for metric in self._metrics) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    "ccm_stage_duration_seconds", "Duration of pipeline stages.", ["stage"]))
+REQUEST_SECONDS = REGISTRY.register(Histogram(
+    "ccm_request_duration_seconds", "Duration of HTTP requests.", ["endpoint", "status"]))
+REQUESTS_TOTAL = REGISTRY.register(Counter(
+    "ccm_requests_total", "Number of HTTP requests.", ["endpoint", "status"]))
+REQUESTS_IN_FLIGHT = REGISTRY.register(Gauge(
+    "ccm_requests_in_flight", "Number of HTTP requests being processed.", ["endpoint"]))
+DOCUMENT_PAGES = REGISTRY.register(Histogram(
+    "ccm_document_pages", "Number of pages parsed per document.", buckets=COUNT_BUCKETS))
+DOCUMENT_GLYPHS = REGISTRY.register(Histogram(
+    "ccm_document_glyphs", "Number of glyphs (<text> nodes) per parsed document.", buckets=COUNT_BUCKETS))
+OUTPUT_BYTES = REGISTRY.register(Histogram(
+    "ccm_output_bytes", "Size of the response body in bytes.", ["endpoint"], buckets=BYTES_BUCKETS))
+
+
+# per request/document callback(stage, seconds), set by an active profile (see profiling.py)
+STAGE_LISTENER = ContextVar("ccm_stage_listener", default=None)
+
+
+def observe_stage(stage, duration):
+    """ Record a stage duration in STAGE_SECONDS{stage=...} and tell the active stage listener"""
+    STAGE_SECONDS.observe(duration, stage=stage)
+    listener = STAGE_LISTENER.get()
+    if listener is not None:
+        listener(stage, duration)
+
+
+@contextmanager
+def stage_timer(stage):
+    """ Observe the duration of the `with` body in STAGE_SECONDS{stage=...}"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def timed(stage):
+    """ Decorator version of stage_timer"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with stage_timer(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,140 @@
+""" Near-duplicate text blocks: MinHash signatures of the blocks and an LSH index over them.
+
+Blocks of a template that differ only by a reference number, a date or a name have different
+sha256_hash_str: each one is unique. A signature summarises the set of shingles of a block (character
+k-grams of its normalised text) in NUM_PERM integers, and the fraction of equal integers between two
+signatures estimates the Jaccard similarity of the two sets. Signatures are cut into LSH_BANDS bands:
+blocks sharing a band are candidates, verified on their signatures, so families of near-duplicate
+blocks are found in time linear in the number of distinct blocks (no pairwise comparison).
+
+Signatures only depend on the text (fixed hash functions, no random state): they are stored in
+partial indexes and templates and compared across machines and runs.
+
+    sig = minhash_signature(text)
+    families = near_duplicate_families({hash: sig}, 0.7)   # {hash: hash of its family representative}
+"""
+import hashlib
+import os
+import re
+import zlib
+
+
+NEAR_DUPLICATE_ENV = "CCM_NEAR_DUPLICATE_THRESHOLD"  # estimated Jaccard similarity of a family, 0 disables
+DEFAULT_NEAR_DUPLICATE_THRESHOLD = 0.7
+NUM_PERM = 64
+LSH_BANDS = 16  # of NUM_PERM // LSH_BANDS rows: a pair at similarity 0.7 shares a band with probability 0.99
+SHINGLE_SIZE = 4
+_PRIME = 4294967291  # largest prime < 2**32
+_SHINGLE_MASK = (1 << 31) - 1  # a*x + b < 2**64: computed in uint64
+
+_DIGITS_RE = re.compile(r"\d")
+_SPACES_RE = re.compile(r"\s+")
+
+
+def _hash_params():
+    """ NUM_PERM (a, b) of the hash functions (a*x + b) mod _PRIME, derived from sha256: the same everywhere"""
+    params = []
+    for i in range(NUM_PERM):
+        digest = hashlib.sha256(f"ccm-minhash-{i}".encode()).digest()
+        params.append((int.from_bytes(digest[:4], "big") % (_PRIME - 1) + 1, int.from_bytes(digest[4:8], "big") % _PRIME))
+    return params
+
+
+_PARAMS = _hash_params()
+_params_arrays = None
+
+
+def normalize_text(text):
+    """ Lower case, digits as 0 (references, dates and amounts of the same shape are equal), no spaces (the
+    same text wrapped in other lines, or read from raw glyphs, has the same shingles)"""
+    return _SPACES_RE.sub("", _DIGITS_RE.sub("0", text.lower()))
+
+
+def shingles(text, k=SHINGLE_SIZE):
+    """ crc32 (31 bits) of the character k-grams of the normalised text (the whole text if shorter)"""
+    text = normalize_text(text)
+    if not text:
+        return set()
+    data = text.encode("utf-8")
+    if len(data) <= k:
+        return {zlib.crc32(data) & _SHINGLE_MASK}
+    return {zlib.crc32(data[i:i + k]) & _SHINGLE_MASK for i in range(len(data) - k + 1)}
+
+
+def minhash_signature(text):
+    """ MinHash signature of a text
+
+    Returns:
+    ---
+        list: NUM_PERM integers, None for a text without shingles (blank)
+    """
+    global _params_arrays
+    values = shingles(text)
+    if not values:
+        return None
+    import numpy as np  # kept off the import path of the server
+    if _params_arrays is None:
+        _params_arrays = (np.array([a for a, _ in _PARAMS], dtype=np.uint64),
+                          np.array([b for _, b in _PARAMS], dtype=np.uint64))
+    a, b = _params_arrays
+    x = np.fromiter(values, dtype=np.uint64, count=len(values))[:, None]
+    return ((x * a + b) % np.uint64(_PRIME)).min(axis=0).tolist()
+
+
+def similarity(sig_a, sig_b):
+    """ Estimated Jaccard similarity of the shingles of two signatures"""
+    return sum(1 for u, v in zip(sig_a, sig_b) if u == v) / len(sig_a)
+
+
+def band_keys(sig):
+    """ LSH keys of a signature: one per band"""
+    rows = len(sig) // LSH_BANDS
+    return [(band, tuple(sig[band * rows:(band + 1) * rows])) for band in range(LSH_BANDS)]
+
+
+def near_duplicate_families(signatures, threshold):
+    """ Group keys whose signatures are near-duplicates
+
+    Each LSH bucket is checked against its first member only (linear time), so a family is a connected
+    component of "similar to a bucket representative" links.
+
+    Args:
+    ---
+        signatures (dict): key -> signature (keys are sortable, e.g. block hashes)
+        threshold (float): min estimated similarity of two linked keys
+
+    Returns:
+    ---
+        dict: key -> smallest key of its family, for the keys of families of 2 or more
+    """
+    parent = {}
+
+    def find(key):
+        root = key
+        while parent.get(root, root) != root:
+            root = parent[root]
+        while key != root:
+            parent[key], key = root, parent[key]
+        return root
+
+    buckets = {}
+    for key in sorted(signatures):
+        sig = signatures[key]
+        for band_key in band_keys(sig):
+            first = buckets.setdefault(band_key, key)
+            if first == key:
+                continue
+            root_a, root_b = find(first), find(key)
+            if root_a != root_b and similarity(signatures[first], sig) >= threshold:
+                parent[max(root_a, root_b)] = min(root_a, root_b)
+    families = {}
+    for key in parent:
+        families[key] = root = find(key)
+        families[root] = root
+    return families
+
+
+def threshold_from_env():
+    """ CCM_NEAR_DUPLICATE_THRESHOLD, None if near-duplicate detection is disabled (0)"""
+    threshold = float(os.environ.get(NEAR_DUPLICATE_ENV, DEFAULT_NEAR_DUPLICATE_THRESHOLD))
+    return threshold if threshold > 0 else None
@@ -5,24 +5,31 @@ PROJECT_DIR = '/'.join(this_dir.split('/')[:-2])
 if PROJECT_DIR not in sys.path:
     sys.path.insert(1, PROJECT_DIR)
 
+import hashlib
+import json
+from contextlib import nullcontext
 from io import BytesIO, StringIO
 from pathlib import Path
 from typing import Dict, List
 
 from pdfminer.converter import (HTMLConverter, PDFPageAggregator,
                                 TextConverter, XMLConverter)
-from pdfminer.layout import LAParams, LTFigure,LTPage,LTImage
+from pdfminer.layout import LAParams, LTChar, LTFigure,LTPage,LTImage
 from pdfminer.pdfdocument import PDFDocument
-from pdfminer.pdfinterp import PDFPageInterpreter, PDFResourceManager
+from pdfminer.pdfinterp import PDFPageInterpreter
 from pdfminer.pdfpage import PDFPage, PDFTextExtractionNotAllowed
 from pdfminer.pdfparser import PDFParser
+from pdfminer.pdftypes import PDFStream, resolve1
+from pdfminer.psparser import PSLiteral
 from lxml import etree
 
 from src.utils import grouping_text
+from src.utils.metrics import timed
+from src.utils.resource_cache import new_resource_manager
 
 
 def pdf_to_string(path, format='xml', password=''):
-    rsrcmgr = PDFResourceManager()
+    rsrcmgr = new_resource_manager()
     out_stream = BytesIO()
     laparams = LAParams()
     if format == 'text':
@@ -34,15 +41,14 @@ def pdf_to_string(path, format='xml', password=''):
     else:
         raise ValueError('provide format, either text, html or xml!')
     
-    fp = open(path, 'rb')
     interpreter = PDFPageInterpreter(rsrcmgr, device)
     maxpages = 0
     caching = True
     pagenos=set()
-    for page in PDFPage.get_pages(fp, pagenos, maxpages=maxpages, password=password,caching=caching, check_extractable=True):
-        interpreter.process_page(page)
+    with open(path, 'rb') as fp:
+        for page in PDFPage.get_pages(fp, pagenos, maxpages=maxpages, password=password,caching=caching, check_extractable=True):
+            interpreter.process_page(page)
 
-    fp.close()
     device.close()
 
     text = out_stream.getvalue().decode("utf-8")
@@ -59,36 +65,167 @@ def pdf_to_pages(path):
     Returns:
         list of pdfminer.layout.LTPage
     """
-    fp = open(path, 'rb')
-    # Create a PDF parser object associated with the file object.
-    parser = PDFParser(fp)
-    # Create a PDF document object that stores the document structure.
-    # Supply the password for initialization.
-    document = PDFDocument(parser)
-    # Check if the document allows text extraction. If not, abort.
-    if not document.is_extractable:
-        raise PDFTextExtractionNotAllowed
-    # Create a PDF resource manager object that stores shared resources.
-    rsrcmgr = PDFResourceManager()
-    # Set parameters for analysis.
-    laparams = LAParams()
-    # Create a PDF page aggregator object.
-    device = PDFPageAggregator(rsrcmgr, laparams=laparams)
-    interpreter = PDFPageInterpreter(rsrcmgr, device)
-    output = []
-    for page in PDFPage.get_pages(fp):
-        interpreter.process_page(page)
-        # receive the LTPage object for the page.
-        layout:LTPage = device.get_result()
-        output.append(layout)
+    with open(path, 'rb') as fp:
+        # Create a PDF parser object associated with the file object.
+        parser = PDFParser(fp)
+        # Create a PDF document object that stores the document structure.
+        # Supply the password for initialization.
+        document = PDFDocument(parser)
+        # Check if the document allows text extraction. If not, abort.
+        if not document.is_extractable:
+            raise PDFTextExtractionNotAllowed
+        # Create a PDF resource manager object that stores shared resources.
+        rsrcmgr = new_resource_manager()
+        # Set parameters for analysis.
+        laparams = LAParams()
+        # Create a PDF page aggregator object.
+        device = PDFPageAggregator(rsrcmgr, laparams=laparams)
+        interpreter = PDFPageInterpreter(rsrcmgr, device)
+        output = []
+        for page in PDFPage.create_pages(document):
+            interpreter.process_page(page)
+            # receive the LTPage object for the page.
+            layout:LTPage = device.get_result()
+            output.append(layout)
     return output
 
 
-def pdf_to_xml_tree(path:str):
-    """ Read pdf file and return lxml etree object"""
-    string = pdf_to_string(path)
-    tree = etree.fromstring(string.encode("utf-8"))
-    return tree
+def iter_xml_pages(path, password='', maxpages=0, caching=True):
+    """ Run pdfminer's XMLConverter page by page and yield each <page> as soon as it is produced.
+
+    Only one page of XML is held in memory at a time (the converter buffer is reset after each page).
+
+    Args:
+    ---
+        path (str): pdf path
+        password (str, optional): pdf password
+        maxpages (int, optional): stop after this number of pages, 0 = all pages
+        caching (bool, optional): keep the parsed pdf objects of the document (faster when pages share
+            them). False: only the fonts are kept, memory does not grow with the number of pages.
+
+    Yield
+    ---
+        etree._Element: <page> node
+    """
+    rsrcmgr = new_resource_manager()
+    out_stream = BytesIO()
+    device = XMLConverter(rsrcmgr, out_stream, laparams=LAParams())
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    # drop the '<?xml ?><pages>' header written by the converter, pages are parsed one by one
+    out_stream.seek(0)
+    out_stream.truncate()
+    with open(path, 'rb') as fp:
+        for page in PDFPage.get_pages(fp, set(), maxpages=maxpages, password=password, caching=caching, check_extractable=True):
+            interpreter.process_page(page)
+            page_xml = out_stream.getvalue()
+            out_stream.seek(0)
+            out_stream.truncate()
+            yield etree.fromstring(page_xml)
+
+
+@timed("pdf_to_xml_tree")
+def pdf_to_xml_tree(path:str, maxpages=0):
+    """ Read pdf file and return lxml etree object (<pages> root)"""
+    root = etree.Element("pages")
+    for page in iter_xml_pages(path, maxpages=maxpages):
+        root.append(page)
+    return root
+
+
+def xmlfile_write_element(xf, element, level=1, pretty_print=False):
+    """ Write an element into an opened `etree.xmlfile`, indented at `level` when pretty_print is set"""
+    if pretty_print:
+        etree.indent(element, space="    ", level=level)
+        xf.write("\n" + "    " * level)
+    xf.write(element)
+
+
+@timed("write_raw_xml")
+def write_raw_xml(path, out, pretty_print=False, keep_pages=1, stats=None):
+    """ Stream the pdfminer XML of a pdf into `out`, page by page, with `etree.xmlfile`.
+
+    Args:
+    ---
+        path (str): pdf path
+        out (str or file-like): output path (gzip/zstd compressed if it ends with .gz/.zst, see open_raw_xml)
+            or binary stream
+        pretty_print (bool, optional): indent output. Defaults to False (compact, for machine consumers)
+        keep_pages (int, optional): number of first pages kept in the returned tree. Defaults to 1.
+        stats (dict, optional): if given, filled with "pages" and "glyphs" counts of the document
+
+    Returns:
+    ---
+        etree: <pages> root holding the first `keep_pages` pages (the ones used for block extraction)
+    """
+    root = etree.Element("pages")
+    out_file = open_raw_xml(out, "wb") if isinstance(out, (str, Path)) else nullcontext(out)
+    with out_file as f, etree.xmlfile(f, encoding="utf-8") as xf:
+        xf.write_declaration()
+        with xf.element("pages"):
+            for i, page in enumerate(iter_xml_pages(path)):
+                if stats is not None:
+                    stats["pages"] = i + 1
+                    stats["glyphs"] = stats.get("glyphs", 0) + count_glyphs(page)
+                xmlfile_write_element(xf, page, pretty_print=pretty_print)
+                if i < keep_pages:
+                    root.append(page)
+            if pretty_print:
+                xf.write("\n")
+    return root
+
+
+def open_raw_xml(path, mode="rb"):
+    """ Open a raw xml file, compressed according to its suffix: .gz (gzip) or .zst (zstd, needs the
+    `zstandard` package), plain file otherwise.
+    """
+    path = str(path)
+    if path.endswith(".gz"):
+        import gzip
+        return gzip.open(path, mode, compresslevel=6)
+    if path.endswith(".zst"):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstd compressed raw xml needs the `zstandard` package") from None
+        return zstandard.open(path, mode)
+    return open(path, mode)
+
+
+def iter_raw_xml_pages(path, maxpages=0):
+    """ Parse a raw xml written by write_raw_xml (plain, .gz or .zst) and yield its <page> one by one.
+
+    Uses etree.iterparse: each page is detached from the tree before being yielded, so memory stays
+    bounded by one page whatever the size of the document.
+
+    Args:
+    ---
+        path (str): raw xml path
+        maxpages (int, optional): stop after this number of pages, 0 = all pages
+
+    Yield
+    ---
+        etree._Element: <page> node
+    """
+    with open_raw_xml(path) as f:
+        for i, (_, page) in enumerate(etree.iterparse(f, events=("end",), tag="page"), 1):
+            page.getparent().remove(page)
+            yield page
+            if maxpages and i >= maxpages:
+                break
+
+
+@timed("raw_xml_to_tree")
+def raw_xml_to_tree(path, maxpages=0):
+    """ Same as pdf_to_xml_tree but from a stored raw xml, without running pdfminer"""
+    root = etree.Element("pages")
+    for page in iter_raw_xml_pages(path, maxpages=maxpages):
+        root.append(page)
+    return root
+
+
+def count_glyphs(node):
+    """ Number of <text> nodes with a bbox (= characters) under node"""
+    return int(node.xpath("count(.//text[@bbox])"))
 
 
 def get_attrib(node,_attrib):
@@ -123,32 +260,50 @@ def get_page_dimension(root, pageno=1):
         _, _, pageW, pageH = bbox
         return pageW, pageH
    
-def fontinfo_textnode(textnode:etree._Element):
+def format_fontinfo(font, size=None, color=None):
     """ return fontinfo pattern: fontFamilyName$#size=XX$#color=(0,0,0)
+
+    Args:
+    ---
+        font (str): font name
+        size (str, optional): font size as written by pdfminer ("12.000")
+        color (str, optional): ncolour as written by pdfminer ("0", "0.5", "(0.075, 0.424, 0.741)", "[0.1, 0.2, 0.3]"
+            for colours set with sc / scn, or "None")
     """
-    fontname = ""  
-    if "font" in textnode.attrib:
-        fontname = get_attrib(textnode,"font")
-        size = get_attrib(textnode,"size")
-        color = get_attrib(textnode,"ncolour")
-        if size:
-            size = str(round(float(size)))
-            fontname += "$#size="+size
-        if color:
-            if color == "0":
-                color = "(0,0,0)"
-            else:  # ncolour="(0.075, 0.424, 0.741)"
-                color = [str(int(float(r)*255)) for r in color[1:-1].split(",")]   # convert to RGB 255 base
-                color = ",".join(color)
-                color = "("+ color + ")"
-            fontname += "$#color=" + color
+    fontname = font
+    if size:
+        size = str(round(float(size)))
+        fontname += "$#size="+size
+    if color and color != "None":
+        if color == "0":
+            color = "(0,0,0)"
+        else:
+            if color[0] in "([":  # ncolour="(0.075, 0.424, 0.741)" or "[0.5]"
+                components = [c for c in color[1:-1].split(",") if c.strip()]
+            else:  # gray level ncolour="0.5"
+                components = [color]
+            color = [str(int(float(r)*255)) for r in components]   # convert to RGB 255 base
+            if len(color) == 1:  # gray level
+                color = color * 3
+            color = "(" + ",".join(color) + ")"
+        fontname += "$#color=" + color
     return fontname
 
-def get_text_with_fontinfo_in_linenode(line_node:etree._Element):
+
+def fontinfo_textnode(textnode:etree._Element):
+    """ return fontinfo pattern: fontFamilyName$#size=XX$#color=(0,0,0)
+    """
+    attrib = textnode.attrib
+    if "font" in attrib:
+        return format_fontinfo(attrib["font"], attrib.get("size"), attrib.get("ncolour"))
+    return ""
+
+def get_text_with_fontinfo_in_linenode(line_node:etree._Element, fontinfo=None):
     """ 
     Args:
     ---
         line_node (_Element):
+        fontinfo (callable, optional): attrib of a <text> -> fontinfo string, fontinfo_textnode by default
     Returns:
     ---
         list,dict: line_text, {font_name: [char positions]}
@@ -161,21 +316,7 @@ def get_text_with_fontinfo_in_linenode(line_node:etree._Element):
             # if len(textnode.text) > 1:
             #     print(textnode.text)
             line_text.append(textnode.text)
-            fontname = get_attrib(textnode,"font")
-            size = get_attrib(textnode,"size")
-            color = get_attrib(textnode,"ncolour")
-            if size:
-                size = str(round(float(size)))
-                fontname += "$#size="+size
-            if color:
-                if color == "0":
-                    color = "(0,0,0)"
-                else:  # ncolour="(0.075, 0.424, 0.741)"
-                    color = [str(int(float(r)*255)) for r in color[1:-1].split(",")]   # convert to RGB 255 base
-                    color = ",".join(color)
-                    color = "("+ color + ")"
-                fontname += "$#color=" + color
-
+            fontname = fontinfo(textnode.attrib) if fontinfo is not None else fontinfo_textnode(textnode)
             if fontname in font_info:
                 font_info[fontname].append(pos)
             else:
@@ -187,6 +328,90 @@ def get_text_with_fontinfo_in_linenode(line_node:etree._Element):
 
     return line_text, font_info
 
+def _parse_bbox(bbox):
+    return tuple(map(float, bbox.split(","))) if bbox else None
+
+
+def visit_page(page):
+    """ Collect in a single pass over a <page> everything the block heuristics need.
+
+    Equivalent to find_all_textbox_nodes + find_textnodes_in_figure + find_all_images_in_xml +
+    get_page_dimension on this page, but each node is visited once and the fontinfo string is
+    computed once per (font, size, colour).
+
+    Args:
+    ---
+        page (etree): <page> node
+
+    Returns:
+    ---
+        dict: {"page_dim": (pageW, pageH) or None,
+               "textboxes": [(bbox, line_list)] with line=(bbox,txt,font_info),
+               "figure_chars": [(bbox,text,fontname)] of <text> directly in a <figure>,
+               "images": [(bbox of parent node,(W,H))]}
+    """
+    fontinfos = {}  # (font, size, ncolour) -> fontinfo string
+
+    def fontinfo(attrib):
+        key = (attrib["font"], attrib.get("size"), attrib.get("ncolour"))
+        name = fontinfos.get(key)
+        if name is None:
+            name = fontinfos[key] = format_fontinfo(*key)
+        return name
+
+    def add_image(img, parent_bbox):
+        attrib = img.attrib
+        images.append((_parse_bbox(parent_bbox), (int(attrib["width"]), int(attrib["height"]))))
+
+    page_bbox = page.get("bbox")
+    page_dim = None
+    if page_bbox:
+        _, _, pageW, pageH = _parse_bbox(page_bbox)
+        page_dim = (pageW, pageH)
+    textboxes = []
+    figure_chars = []
+    images = []
+    for node in page:
+        tag = node.tag
+        if tag == "textbox":
+            block_bbox = node.get("bbox")
+            if not block_bbox:
+                continue
+            block_lines = []
+            for linenode in node:
+                line_bbox = linenode.get("bbox")
+                if not line_bbox:
+                    continue
+                line_text, font_info = get_text_with_fontinfo_in_linenode(linenode, fontinfo)
+                block_lines.append((_parse_bbox(line_bbox), line_text, font_info))
+            textboxes.append((_parse_bbox(block_bbox), block_lines))
+        elif tag == "figure":
+            fig_bbox = node.get("bbox")
+            for child in node:
+                child_tag = child.tag
+                if child_tag == "text":
+                    attrib = child.attrib
+                    if "bbox" in attrib:
+                        figure_chars.append((_parse_bbox(attrib["bbox"]), child.text,
+                                             fontinfo(attrib) if "font" in attrib else ""))
+                elif child_tag == "image":
+                    add_image(child, fig_bbox)
+                elif child_tag == "figure":  # nested figure: only its images are used
+                    for img in child.iter("image"):
+                        add_image(img, img.getparent().get("bbox"))
+        elif tag == "image":
+            add_image(node, page_bbox)
+    return {"page_dim": page_dim, "textboxes": textboxes, "figure_chars": figure_chars, "images": images}
+
+
+def blocks_from_page_nodes(page_nodes):
+    """ find_all_textboxes_B from the output of visit_page: <textbox> blocks + grouped <figure> text, top-down"""
+    block_list = list(page_nodes["textboxes"])   # 1st list of blocks
+    block_list += grouping_text(page_nodes["figure_chars"]) # 2nd list of blocks
+    block_list.sort(key=lambda block: -block[0][1])  # sort top-down
+    return block_list
+
+
 def find_all_tag_recursively(root, tag_name):
     """ Recursively get all <tag_name> nodes in document
 
@@ -232,15 +457,9 @@ def find_textnodes_in_figure(root):
     ---
         list: [(bbox,text,fontname)]
     """
-    character_nodes_list = []
-    for page in root:
-        # print(page)
-        figures = page.findall("figure")
-        for fig in figures:
-            characters = fig.findall("text")
-            character_nodes_list += [(get_bbox(ch),ch.text,fontinfo_textnode(ch)) for ch in characters if "bbox" in ch.attrib]
-        break # currently support 1st page
-    return character_nodes_list
+    if len(root) == 0:
+        return []
+    return visit_page(root[0])["figure_chars"]  # currently support 1st page
 
 
 def find_all_textbox_nodes(root):
@@ -256,22 +475,9 @@ def find_all_textbox_nodes(root):
             line=(bbox,txt,font_info); 
             font_info={fontname:[positions]}
     """
-    block_list = []  # list of (bbox, line_list); line=(bbox,txt)
-    for page in root:
-        textboxes = page.findall("textbox")
-        for i,textbox in enumerate(textboxes):
-            if "bbox" in textbox.attrib:
-                block_bbox = get_bbox(textbox)
-                block_lines = []
-                for linenode in textbox:
-                    if "bbox" in linenode.attrib:
-                        linebbox = get_bbox(linenode)
-                        # linetext = "".join(textline.itertext()).replace("\n","")
-                        linetext, font_info = get_text_with_fontinfo_in_linenode(linenode)
-                        block_lines.append((linebbox,linetext,font_info)) 
-                block_list.append((block_bbox,block_lines))
-        break  # 1st page only
-    return block_list
+    if len(root) == 0:
+        return []
+    return visit_page(root[0])["textboxes"]  # 1st page only
 
 
 def find_all_textboxes_A(root):
@@ -290,6 +496,7 @@ def find_all_textboxes_A(root):
     return block_list
 
 
+@timed("find_all_textboxes_B")
 def find_all_textboxes_B(root):
     """ Get all <textbox> in document, then get all <text> in <figure> and group into blocks
 
@@ -301,13 +508,9 @@ def find_all_textboxes_B(root):
     ---
         blocks_list (list): [(bbox, line_list)]. line=(bbox, txt, fontinfo)
     """
-    block_list = []  # list of (bbox, line_list). line=(bbox, txt)
-
-    block_list = find_all_textbox_nodes(root)   # 1st list of blocks
-    block_list += grouping_text(find_textnodes_in_figure(root)) # 2nd list of blocks
-    block_list.sort(key=lambda block: -block[0][1])  # sort top-down
-    return block_list
-
+    if len(root) == 0:
+        return []
+    return blocks_from_page_nodes(visit_page(root[0]))
 
 
 def find_all_images_in_xml(root):
@@ -316,17 +519,9 @@ def find_all_images_in_xml(root):
     ---
         list of (bbox,(W,H))
     """
-    img_list = []  # list of (bbox,(W,H))
-    img_tags = find_all_tag_recursively(root[0],"image")  # find in 1st page only
-    for img in img_tags:
-        parent_node = img.getparent()
-        size = (int(img.attrib["width"]),int(img.attrib["height"]))
-        bbox = None
-        # print(f'image size: {img.attrib["width"]}x{img.attrib["height"]}',)
-        if parent_node is not None:
-            bbox = get_bbox(parent_node)
-        img_list.append((bbox,size))
-    return img_list
+    if len(root) == 0:
+        return []
+    return visit_page(root[0])["images"]  # find in 1st page only
 
 
 def find_all_images_in_page(page:LTPage):
@@ -351,6 +546,7 @@ def find_all_images_in_page(page:LTPage):
     return img_list
 
 
+@timed("find_all_images_in_document")
 def find_all_images_in_document(path, first_page=False)->Dict[int,LTImage]:
     """ 
     """
@@ -362,3 +558,150 @@ def find_all_images_in_document(path, first_page=False)->Dict[int,LTImage]:
         if first_page:
             break
     return output_dict
+
+
+# ----------------------------------------------------------
+# image streams: fingerprint and file from the encoded data, decoding only on request
+
+# abbreviated filter names of inline images
+_FILTER_NAMES = {"AHx": "ASCIIHexDecode", "A85": "ASCII85Decode", "LZW": "LZWDecode", "Fl": "FlateDecode",
+                 "RL": "RunLengthDecode", "CCF": "CCITTFaxDecode", "DCT": "DCTDecode"}
+# a stream with only one of these filters is a complete image file, written as is
+PASSTHROUGH_IMAGE_EXTENSIONS = {"DCTDecode": ".jpg", "JPXDecode": ".jp2"}
+
+
+def _plain(obj):
+    """ json-able, object id independent form of a (small) pdf object"""
+    obj = resolve1(obj)
+    if isinstance(obj, dict):
+        return {str(k): _plain(v) for k, v in obj.items()}
+    if isinstance(obj, list):
+        return [_plain(v) for v in obj]
+    if isinstance(obj, PSLiteral):
+        return "/" + str(obj.name)
+    if isinstance(obj, bytes):
+        return obj.hex()
+    if isinstance(obj, PDFStream):  # e.g. JBIG2Globals
+        return "stream:" + hashlib.sha256(encoded_stream_data(obj)).hexdigest()
+    return obj
+
+
+def image_filters(stream):
+    """ [(filter name, decode params)] of a stream, full filter names"""
+    filters = []
+    for f, params in stream.get_filters():
+        name = str(getattr(f, "name", f))
+        filters.append((_FILTER_NAMES.get(name, name), _plain(params) or None))
+    return filters
+
+
+def encoded_stream_data(stream):
+    """ Data of a stream before its filters (deciphered if the document is encrypted), /Length bytes:
+    pdfminer also keeps the end of line before "endstream", other pdf libraries do not.
+
+    pdfminer drops the encoded data once get_data() was called, the decoded data is returned then.
+    """
+    data = stream.get_rawdata()
+    if data is None:
+        return stream.get_data()
+    length = resolve1(stream.attrs.get("Length"))
+    if isinstance(length, int) and 0 <= length < len(data):
+        data = data[:length]
+    if stream.decipher:
+        data = stream.decipher(stream.objid, stream.genno, data, stream.attrs)
+    return data
+
+
+def image_stream_hash(stream):
+    """ sha256 of an image from its encoded data, filters with their decode parameters and sample
+    format (width, height, bits per component): no decompression.
+    """
+    key = {"filters": image_filters(stream), "width": _plain(stream.get_any(("W", "Width"))),
+           "height": _plain(stream.get_any(("H", "Height"))), "bpc": _plain(stream.get_any(("BPC", "BitsPerComponent")))}
+    h = hashlib.sha256(json.dumps(key, sort_keys=True, default=str).encode())
+    h.update(b"\0")
+    h.update(encoded_stream_data(stream))
+    return h.hexdigest()
+
+
+def image_file_extension(stream, decode=False):
+    """ Extension of the file written by image_file_data: .jpg / .jp2 for a jpeg / jpeg2000 stream,
+    else .raw (decoded samples) if decode, .bin (encoded stream) otherwise
+    """
+    filters = image_filters(stream)
+    if len(filters) == 1 and filters[0][0] in PASSTHROUGH_IMAGE_EXTENSIONS:
+        return PASSTHROUGH_IMAGE_EXTENSIONS[filters[0][0]]
+    return ".raw" if decode else ".bin"
+
+
+def image_file_data(stream, decode=False):
+    """ Bytes of the image file of a stream, see image_file_extension. Only decode=True runs the filters
+    (and pdfminer then forgets the encoded data: hash the stream first).
+    """
+    if decode and image_file_extension(stream, decode) == ".raw":
+        return stream.get_data()
+    return encoded_stream_data(stream)
+
+
+def _collect_glyphs(item, chars:List, images:List):
+    """ Recursively collect LTChar as (bbox,text,fontinfo) and LTImage of a layout object"""
+    for obj in item:
+        if isinstance(obj, LTChar):
+            bbox = tuple(round(v, 3) for v in obj.bbox)
+            fontinfo = format_fontinfo(obj.fontname, "%.3f" % obj.size, str(obj.graphicstate.ncolor))
+            chars.append((bbox, obj.get_text(), fontinfo))
+        elif isinstance(obj, LTImage):
+            images.append(obj)
+        elif isinstance(obj, LTFigure):
+            _collect_glyphs(obj, chars, images)
+
+
+def iter_glyph_pages(path, password='', maxpages=0, caching=True):
+    """ Fast path: run the pdfminer interpreter without layout analysis (laparams=None) and
+    yield the raw glyphs and images of each page. No textline/textbox grouping, no box ordering.
+
+    Args:
+    ---
+        path (str): pdf path
+        password (str, optional): pdf password
+        maxpages (int, optional): stop after this number of pages, 0 = all pages
+        caching (bool, optional): keep the parsed pdf objects of the document, see iter_xml_pages
+
+    Yield
+    ---
+        tuple: (pageW, pageH), [(bbox,text,fontname)], [LTImage]
+    """
+    rsrcmgr = new_resource_manager()
+    device = PDFPageAggregator(rsrcmgr, laparams=None)
+    interpreter = PDFPageInterpreter(rsrcmgr, device)
+    with open(path, 'rb') as fp:
+        for page in PDFPage.get_pages(fp, set(), maxpages=maxpages, password=password, caching=caching, check_extractable=True):
+            interpreter.process_page(page)
+            layout:LTPage = device.get_result()
+            chars, images = [], []
+            _collect_glyphs(layout, chars, images)
+            _, _, pageW, pageH = layout.bbox
+            yield (pageW, pageH), chars, images
+
+
+@timed("find_all_textboxes_glyphs")
+def find_all_textboxes_glyphs(path, backend=None):
+    """ Fast path equivalent of find_all_textboxes_B + find_all_images_in_document(first_page=True):
+    all glyphs of the 1st page are grouped with grouping_text, images come from the same pass.
+
+    Args:
+    ---
+        path (str): pdf path
+        backend (str, optional): extraction backend, CCM_PDF_BACKEND (pdfminer by default) if None,
+            see pdf_backends.py
+
+    Returns:
+    ---
+        tuple: blocks_list [(bbox, line_list)] top-down ordered, [LTImage], (pageW, pageH)
+    """
+    from src.utils.pdf_backends import get_backend
+    for page_dim, chars, images in get_backend(backend).iter_pages(path, maxpages=1):
+        block_list = grouping_text(chars)
+        block_list.sort(key=lambda block: -block[0][1])  # sort top-down
+        return block_list, images, page_dim
+    return [], [], None
@@ -0,0 +1,188 @@
+""" PDF extraction backends for the glyph path: pages as glyphs with their font attributes and image placements.
+
+A backend yields, for each page, what grouping_text (blocks, in the shape of find_all_textboxes_B, consumed
+by export_to_my_xml) and store_images need:
+
+    (pageW, pageH), [(bbox, text, fontinfo)], [image]
+
+- bbox in pdf space (y=0 at the bottom), as pdfminer: a glyph box goes from baseline + descent to + size;
+- fontinfo as format_fontinfo ("Helvetica$#size=12$#color=(0,0,0)");
+- an image has bbox, width, height and a pdfminer PDFStream `stream` (encoded data), so images are hashed
+  and written the same way whatever the backend.
+
+pdfminer is the reference (it also does the layout analysis of extraction="layout", which is not
+backend dependent). Another backend is chosen with CCM_PDF_BACKEND, where its package is installed:
+
+    pymupdf   PyMuPDF (MuPDF): faster page interpretation, same text and image hashes. Glyph boxes use
+              MuPDF font metrics (descent), colours are rounded instead of truncated, inline images are
+              not reported. Compare on your corpus with bench/compare_backends.py before switching.
+
+    backend = get_backend()              # CCM_PDF_BACKEND, pdfminer by default
+    for page_dim, chars, images in backend.iter_pages(path, maxpages=1):
+        ...
+"""
+import os
+from collections import namedtuple
+from io import BytesIO
+
+from src.utils.pdf2xml import iter_glyph_pages
+
+
+PDF_BACKEND_ENV = "CCM_PDF_BACKEND"
+DEFAULT_PDF_BACKEND = "pdfminer"
+
+# image of a backend other than pdfminer, with the attributes of LTImage used by the pipeline
+PlacedImage = namedtuple("PlacedImage", ["bbox", "width", "height", "stream"])
+
+
+class ExtractionBackend:
+    """ Interface of a backend, see the module docstring"""
+
+    name = None
+
+    @classmethod
+    def available(cls):
+        """ True if the package of the backend can be imported"""
+        return True
+
+    def iter_pages(self, path, password='', maxpages=0):
+        """ Pages of a pdf, parsed one at a time: memory does not grow with the number of pages
+
+        Args:
+        ---
+            path (str): pdf path
+            password (str, optional): pdf password
+            maxpages (int, optional): stop after this number of pages, 0 = all pages
+
+        Yield
+        ---
+            tuple: (pageW, pageH), [(bbox,text,fontinfo)], [image]
+        """
+        raise NotImplementedError
+
+
+class PdfminerBackend(ExtractionBackend):
+    """ Reference backend: pdfminer interpreter without layout analysis, see pdf2xml.iter_glyph_pages"""
+
+    name = "pdfminer"
+
+    def iter_pages(self, path, password='', maxpages=0):
+        return iter_glyph_pages(path, password, maxpages, caching=False)
+
+
+def _import_pymupdf():
+    try:
+        import pymupdf
+    except ImportError:
+        import fitz as pymupdf  # PyMuPDF < 1.24
+    return pymupdf
+
+
+class _PyMuPDFObjects:
+    """ Objects of a PyMuPDF document as pdfminer objects (dict, PDFStream...), parsed by pdfminer's parser.
+    Used as the `doc` of the references (PDFObjRef) found in image dictionaries.
+    """
+
+    def __init__(self, doc):
+        self.doc = doc
+        self._objs = {}
+
+    def parse(self, source):
+        from pdfminer.pdfparser import PDFParser
+        from pdfminer.psparser import PSEOF
+        parser = PDFParser(BytesIO(source.encode("latin-1") + b"\n"))  # a token ends at a delimiter
+        parser.set_document(self)
+        try:
+            _, obj = parser.nextobject()
+        except PSEOF:
+            # a top level object is only returned at the next keyword (endobj in a file): take it from the stack
+            _, obj = parser.popall()[0]
+        return obj
+
+    def getobj(self, objid):
+        obj = self._objs.get(objid)
+        if obj is None:
+            from pdfminer.pdftypes import PDFStream
+            obj = self.parse(self.doc.xref_object(objid, compressed=True))
+            if self.doc.xref_is_stream(objid):
+                # raw: before the filters, after decryption, as pdf2xml.encoded_stream_data
+                obj = PDFStream(obj, self.doc.xref_stream_raw(objid))
+                obj.set_objid(objid, 0)
+            self._objs[objid] = obj
+        return obj
+
+
+class PyMuPDFBackend(ExtractionBackend):
+    name = "pymupdf"
+
+    @classmethod
+    def available(cls):
+        try:
+            _import_pymupdf()
+        except ImportError:
+            return False
+        return True
+
+    def iter_pages(self, path, password='', maxpages=0):
+        pymupdf = _import_pymupdf()
+        with pymupdf.open(path) as doc:
+            if doc.needs_pass and not doc.authenticate(password):
+                raise ValueError(f"wrong password for {path}")
+            objects = _PyMuPDFObjects(doc)
+            for pageno, page in enumerate(doc):
+                if maxpages and pageno >= maxpages:
+                    break
+                yield self._page(page, objects)
+
+    def _page(self, page, objects):
+        pageW, pageH = page.rect.width, page.rect.height
+        fontinfos = {}  # (font, size, color) -> fontinfo string
+        chars = []
+        for block in page.get_text("rawdict", flags=0)["blocks"]:
+            for line in block.get("lines", ()):
+                for span in line["spans"]:
+                    size = span["size"]
+                    key = (span["font"], size, span["color"])
+                    fontinfo = fontinfos.get(key)
+                    if fontinfo is None:
+                        rgb = ",".join(str(c) for c in ((span["color"] >> 16) & 255, (span["color"] >> 8) & 255,
+                                                        span["color"] & 255))
+                        fontinfo = fontinfos[key] = f"{span['font']}$#size={round(size)}$#color=({rgb})"
+                    descent = span["descender"] * size
+                    for char in span["chars"]:
+                        x0, _, x1, _ = char["bbox"]
+                        y0 = pageH - char["origin"][1] + descent  # baseline + descent, y=0 at the bottom
+                        chars.append(((round(x0, 3), round(y0, 3), round(x1, 3), round(y0 + size, 3)), char["c"], fontinfo))
+        images = []
+        for info in page.get_image_info(xrefs=True):
+            if not info["xref"]:  # inline image, no stream object to hash
+                continue
+            x0, y0, x1, y1 = info["bbox"]
+            images.append(PlacedImage((x0, pageH - y1, x1, pageH - y0), info["width"], info["height"],
+                                      objects.getobj(info["xref"])))
+        return (pageW, pageH), chars, images
+
+
+BACKENDS = {"pdfminer": PdfminerBackend, "pymupdf": PyMuPDFBackend}
+
+
+def available_backends():
+    """ Names of the backends whose package is installed"""
+    return [name for name, cls in BACKENDS.items() if cls.available()]
+
+
+def get_backend(name=None):
+    """ Backend `name`, CCM_PDF_BACKEND if None (pdfminer by default)
+
+    Raises:
+    ---
+        ValueError: unknown backend
+        ImportError: its package is not installed
+    """
+    name = name or os.environ.get(PDF_BACKEND_ENV) or DEFAULT_PDF_BACKEND
+    if name not in BACKENDS:
+        raise ValueError(f"unknown pdf backend {name!r}, one of {sorted(BACKENDS)}")
+    cls = BACKENDS[name]
+    if not cls.available():
+        raise ImportError(f"pdf backend {name!r} is not installed")
+    return cls()
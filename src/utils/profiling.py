@@ -0,0 +1,129 @@
+""" On-demand profiling of one request / one document: cProfile + tracemalloc peak + stage timings.
+
+Nothing here runs unless a profile is explicitly started, so the normal path pays no overhead.
+"""
+import cProfile
+import json
+import marshal
+import os
+import threading
+import time
+import tracemalloc
+from pathlib import Path
+
+from src.utils.metrics import STAGE_LISTENER
+
+
+PROFILE_HEADER = "X-CCM-Profile"
+PROFILE_TOKEN_ENV = "CCM_PROFILE_TOKEN"  # secret that enables profiling through header/query flag
+PROFILE_DIR_ENV = "CCM_PROFILE_DIR"  # if set, profiles are written there instead of attached to the response
+
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+        elif hasattr(tracemalloc, "reset_peak"):  # python >= 3.9
+            tracemalloc.reset_peak()
+        _tracemalloc_users += 1
+
+
+def _stop_tracemalloc():
+    """ Return peak traced memory (bytes) since start, stop tracing when no profile is left"""
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _, peak = tracemalloc.get_traced_memory()
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+    return peak
+
+
+def is_profiling_requested(token):
+    """ Check a token given by a client (header or query flag) against CCM_PROFILE_TOKEN"""
+    expected = os.environ.get(PROFILE_TOKEN_ENV)
+    return bool(expected) and token == expected
+
+
+class DocumentProfile:
+    """ Profile of one request or document.
+
+    Usage::
+
+        with DocumentProfile("doc1") as profile:
+            ...
+        profile.write(output_dir)
+
+    cProfile only sees the calling thread. tracemalloc is process-wide, so the memory peak
+    also includes concurrent work when several requests run at the same time.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}  # {stage: [seconds]}
+        self.wall_seconds = None
+        self.tracemalloc_peak_bytes = None
+        self._profiler = cProfile.Profile()
+        self._start = None
+        self._listener_token = None
+        self._previous_listener = None
+
+    def _on_stage(self, stage, seconds):
+        self.stages.setdefault(stage, []).append(seconds)
+        if self._previous_listener is not None:  # e.g. a worker collecting timings for its parent
+            self._previous_listener(stage, seconds)
+
+    def start(self):
+        _start_tracemalloc()
+        self._previous_listener = STAGE_LISTENER.get()
+        self._listener_token = STAGE_LISTENER.set(self._on_stage)
+        self._start = time.perf_counter()
+        self._profiler.enable()
+        return self
+
+    def stop(self):
+        self._profiler.disable()
+        self.wall_seconds = time.perf_counter() - self._start
+        STAGE_LISTENER.reset(self._listener_token)
+        self.tracemalloc_peak_bytes = _stop_tracemalloc()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()
+
+    def prof_bytes(self):
+        """ Content of a .prof file, readable with pstats / snakeviz"""
+        self._profiler.create_stats()
+        return marshal.dumps(self._profiler.stats)
+
+    def timings(self):
+        return {
+            "name": self.name,
+            "wall_seconds": self.wall_seconds,
+            "tracemalloc_peak_bytes": self.tracemalloc_peak_bytes,
+            "stages": self.stages,
+        }
+
+    def timings_bytes(self):
+        return json.dumps(self.timings(), indent=2).encode("utf-8")
+
+    def write(self, output_dir):
+        """ Write <name>.prof and <name>.timings.json in output_dir
+
+        Returns:
+        ---
+            (Path, Path): prof path, timings path
+        """
+        output_dir = Path(output_dir)
+        output_dir.mkdir(parents=True, exist_ok=True)
+        prof_path = output_dir / f"{self.name}.prof"
+        timings_path = output_dir / f"{self.name}.timings.json"
+        prof_path.write_bytes(self.prof_bytes())
+        timings_path.write_bytes(self.timings_bytes())
+        return prof_path, timings_path
@@ -0,0 +1,167 @@
+""" Process-wide font cache shared by every document parsed in a worker.
+
+pdfminer's PDFResourceManager caches fonts by object id, which is only meaningful inside one
+document, so a fresh manager is created for each pdf and every font is parsed again. Here fonts
+are cached by a fingerprint of their content (font dict, descriptor, widths, encoding, ToUnicode
+cmap and, when pdfminer needs them, embedded font files) which is stable across documents produced
+by the same template.
+
+Each document still gets its own CachingResourceManager (keeping pdfminer's per-document objid
+cache); the managers share FONT_CACHE, a bounded LRU protected by a lock.
+
+Note: a cached font keeps a reference to the document it was first parsed from (through its
+descriptor), the cache size also bounds the number of such documents kept alive.
+"""
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from pdfminer.pdfinterp import PDFResourceManager
+from pdfminer.pdftypes import PDFObjRef, PDFStream
+from pdfminer.psparser import PSKeyword, PSLiteral
+
+from src.utils.metrics import Counter, REGISTRY
+
+
+FONT_CACHE_SIZE_ENV = "CCM_FONT_CACHE_SIZE"
+DEFAULT_FONT_CACHE_SIZE = 256
+_MAX_DEPTH = 8
+
+FONT_CACHE_REQUESTS = REGISTRY.register(Counter(
+    "ccm_font_cache_requests_total", "Font lookups in the shared font cache.", ["result"]))
+
+
+FONT_PROGRAM_KEYS = {"FontFile", "FontFile2", "FontFile3"}
+
+
+def _update_fingerprint(h, obj, depth, seen, hash_programs):
+    if depth > _MAX_DEPTH:
+        h.update(b"<deep>")
+        return
+    if isinstance(obj, PDFObjRef):
+        key = (id(obj.doc), obj.objid)
+        if key in seen:  # reference cycle
+            h.update(b"<cycle>")
+            return
+        seen = seen | {key}
+        try:
+            obj = obj.resolve()
+        except Exception:
+            h.update(b"<unresolved>")
+            return
+    if isinstance(obj, dict):
+        h.update(b"{")
+        for k in sorted(obj, key=str):
+            if k in ("Parent", "Length"):  # not part of the font itself
+                continue
+            h.update(str(k).encode() + b":")
+            if k in FONT_PROGRAM_KEYS and not hash_programs:
+                h.update(b"<program>")  # not read by pdfminer for this font, do not load it
+                continue
+            _update_fingerprint(h, obj[k], depth + 1, seen, hash_programs)
+        h.update(b"}")
+    elif isinstance(obj, (list, tuple)):
+        h.update(b"[")
+        for v in obj:
+            _update_fingerprint(h, v, depth + 1, seen, hash_programs)
+            h.update(b",")
+        h.update(b"]")
+    elif isinstance(obj, PDFStream):
+        h.update(b"stream")
+        _update_fingerprint(h, obj.attrs, depth + 1, seen, hash_programs)
+        if obj.rawdata is not None:
+            h.update(b"raw" + hashlib.sha1(obj.rawdata).digest())
+        else:
+            h.update(b"data" + hashlib.sha1(obj.data or b"").digest())
+    elif isinstance(obj, (PSLiteral, PSKeyword)):
+        h.update(b"/" + str(obj.name).encode())
+    elif isinstance(obj, bytes):
+        h.update(b"b" + obj)
+    else:
+        h.update(repr(obj).encode())
+
+
+def font_fingerprint(spec):
+    """ Content hash of a font spec (dict), independent of object ids.
+
+    Embedded font programs (FontFile*) are big and pdfminer only reads them to recover the unicode
+    mapping when there is no ToUnicode cmap (and, for simple fonts, no Encoding): only in that case
+    are they hashed. Otherwise they are left unresolved, which keeps the fingerprint cheap.
+    """
+    subtype = spec.get("Subtype")
+    is_type0 = isinstance(subtype, PSLiteral) and subtype.name == "Type0"
+    hash_programs = "ToUnicode" not in spec and (is_type0 or "Encoding" not in spec)
+    h = hashlib.sha1()
+    _update_fingerprint(h, spec, 0, frozenset(), hash_programs)
+    return h.hexdigest()
+
+
+class FontCache:
+    """ Thread-safe LRU {fingerprint: PDFFont} with a maximum number of fonts"""
+
+    def __init__(self, max_fonts=DEFAULT_FONT_CACHE_SIZE):
+        self.max_fonts = max_fonts
+        self._fonts = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            font = self._fonts.get(key)
+            if font is not None:
+                self._fonts.move_to_end(key)
+                self.hits += 1
+            else:
+                self.misses += 1
+        FONT_CACHE_REQUESTS.inc(result="hit" if font is not None else "miss")
+        return font
+
+    def put(self, key, font):
+        if self.max_fonts <= 0:
+            return
+        with self._lock:
+            self._fonts[key] = font
+            self._fonts.move_to_end(key)
+            while len(self._fonts) > self.max_fonts:
+                self._fonts.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._fonts.clear()
+
+    def __len__(self):
+        return len(self._fonts)
+
+
+FONT_CACHE = FontCache(int(os.environ.get(FONT_CACHE_SIZE_ENV, DEFAULT_FONT_CACHE_SIZE)))
+
+
+class CachingResourceManager(PDFResourceManager):
+    """ PDFResourceManager for one document, fonts are looked up in a shared FontCache first"""
+
+    def __init__(self, font_cache=None, caching=True):
+        PDFResourceManager.__init__(self, caching=caching)
+        self.font_cache = font_cache if font_cache is not None else FONT_CACHE
+
+    def get_font(self, objid, spec):
+        # per document cache by objid, same as pdfminer
+        if objid and objid in self._cached_fonts:
+            return self._cached_fonts[objid]
+        if self.font_cache.max_fonts <= 0:
+            return PDFResourceManager.get_font(self, objid, spec)
+        key = font_fingerprint(spec)
+        font = self.font_cache.get(key)
+        if font is None:
+            # objid=None: do not let pdfminer cache it by objid, done below
+            font = PDFResourceManager.get_font(self, None, spec)
+            self.font_cache.put(key, font)
+        if objid and self.caching:
+            self._cached_fonts[objid] = font
+        return font
+
+
+def new_resource_manager():
+    """ Resource manager for one document, backed by the process-wide font cache"""
+    return CachingResourceManager()
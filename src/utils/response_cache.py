@@ -0,0 +1,185 @@
+""" Cache of /pdf2xml results keyed by a hash of the upload and of the request options.
+
+Upstream systems resubmit the same pdf (retries, the same notice sent to many recipients): results
+are kept in a memory LRU with a byte budget and, optionally, in a folder with its own budget (shared
+by the server processes, survives restarts). Concurrent requests for the same key are coalesced:
+one of them computes the result, the others wait for it.
+
+    cache = ResponseCache(max_bytes=128 * 2**20, disk_dir="/var/cache/ccm", max_disk_bytes=2**30)
+    data, status = cache.get_or_compute(key, compute)  # status: hit, disk, coalesced or miss
+"""
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from src.utils.metrics import Counter, Gauge, REGISTRY
+
+
+CACHE_MB_ENV = "CCM_RESPONSE_CACHE_MB"  # memory budget, 0 disables the cache
+CACHE_DIR_ENV = "CCM_RESPONSE_CACHE_DIR"  # disk tier, none by default
+CACHE_DISK_MB_ENV = "CCM_RESPONSE_CACHE_DISK_MB"
+DEFAULT_CACHE_MB = 128
+DEFAULT_CACHE_DISK_MB = 1024
+CACHE_VERSION = 2  # part of every key: bump when the outputs change, the disk tier survives deployments
+
+CACHE_REQUESTS = REGISTRY.register(Counter(
+    "ccm_response_cache_requests_total", "Lookups in the response cache.", ["result"]))
+CACHE_BYTES = REGISTRY.register(Gauge(
+    "ccm_response_cache_bytes", "Size of the cached responses.", ["tier"]))
+
+
+def cache_key(data_hash, options):
+    """ Key of a result: sha256 of the upload (hex) and the options that change the output (json-able dict)"""
+    options = dict(options, cache_version=CACHE_VERSION)
+    return hashlib.sha256((data_hash + json.dumps(options, sort_keys=True)).encode()).hexdigest()
+
+
+class _Flight:
+    """ A result being computed, waited for by the coalesced requests"""
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.data = None
+        self.error = None
+
+
+class ResponseCache:
+    """ Thread-safe LRU {key: bytes} in memory, and in a folder if disk_dir is given"""
+
+    def __init__(self, max_bytes, disk_dir=None, max_disk_bytes=0):
+        self.max_bytes = max_bytes
+        self.max_disk_bytes = max_disk_bytes if disk_dir else 0
+        self.disk_dir = Path(disk_dir) if disk_dir else None
+        self._lock = threading.Lock()
+        self._mem = OrderedDict()  # key -> bytes
+        self._mem_bytes = 0
+        self._disk = OrderedDict()  # key -> size, least recently used first
+        self._disk_bytes = 0
+        self._inflight = {}  # key -> _Flight
+        if self.disk_dir is not None:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            files = sorted(self.disk_dir.glob("*.zip"), key=lambda p: p.stat().st_mtime)
+            for path in files:
+                self._disk[path.stem] = path.stat().st_size
+                self._disk_bytes += self._disk[path.stem]
+            CACHE_BYTES.set(self._disk_bytes, tier="disk")
+
+    def _disk_path(self, key):
+        return self.disk_dir / f"{key}.zip"
+
+    def _read_disk(self, key):
+        """ Result from the disk tier (also written by other server processes), None if absent"""
+        if self.disk_dir is None:
+            return None
+        try:
+            data = self._disk_path(key).read_bytes()
+        except OSError:
+            return None
+        with self._lock:
+            if key not in self._disk:
+                self._disk_bytes += len(data)
+            self._disk[key] = len(data)
+            self._disk.move_to_end(key)
+        return data
+
+    def _write_disk(self, key, data):
+        if not self.max_disk_bytes or len(data) > self.max_disk_bytes:
+            return
+        path = self._disk_path(key)
+        tmp_path = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            tmp_path.write_bytes(data)
+            os.replace(tmp_path, path)
+        except OSError:
+            if tmp_path.exists():
+                tmp_path.unlink()
+            return
+        evicted = []
+        with self._lock:
+            self._disk_bytes += len(data) - self._disk.pop(key, 0)
+            self._disk[key] = len(data)
+            while self._disk_bytes > self.max_disk_bytes:
+                old_key, size = self._disk.popitem(last=False)
+                self._disk_bytes -= size
+                evicted.append(old_key)
+            CACHE_BYTES.set(self._disk_bytes, tier="disk")
+        for old_key in evicted:
+            try:
+                self._disk_path(old_key).unlink()
+            except OSError:
+                pass
+
+    def _put_memory(self, key, data):
+        if len(data) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._mem:
+                self._mem_bytes -= len(self._mem.pop(key))
+            self._mem[key] = data
+            self._mem_bytes += len(data)
+            while self._mem_bytes > self.max_bytes:
+                _, old = self._mem.popitem(last=False)
+                self._mem_bytes -= len(old)
+            CACHE_BYTES.set(self._mem_bytes, tier="memory")
+
+    def get_or_compute(self, key, compute):
+        """ Cached result of key, else compute() once for all the concurrent callers
+
+        Args:
+        ---
+            key (str): see cache_key
+            compute (callable): compute() -> bytes, its exceptions are raised to every waiting caller
+
+        Returns:
+        ---
+            tuple: bytes, "hit" (memory), "disk", "coalesced" (computed for another request) or "miss"
+        """
+        with self._lock:
+            data = self._mem.get(key)
+            if data is not None:
+                self._mem.move_to_end(key)
+            else:
+                flight = self._inflight.get(key)
+                leader = flight is None
+                if leader:
+                    flight = self._inflight[key] = _Flight()
+        if data is not None:
+            CACHE_REQUESTS.inc(result="hit")
+            return data, "hit"
+        if not leader:
+            flight.done.wait()
+            CACHE_REQUESTS.inc(result="coalesced")
+            if flight.error is not None:
+                raise flight.error
+            return flight.data, "coalesced"
+
+        try:
+            data = self._read_disk(key)
+            status = "disk"
+            if data is None:
+                data = compute()
+                status = "miss"
+                self._write_disk(key, data)
+            self._put_memory(key, data)
+            flight.data = data
+        except BaseException as e:
+            flight.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._inflight[key]
+            flight.done.set()
+        CACHE_REQUESTS.inc(result=status)
+        return data, status
+
+
+def cache_from_env():
+    """ ResponseCache configured by CCM_RESPONSE_CACHE_*, None if disabled"""
+    max_mb = int(os.environ.get(CACHE_MB_ENV, DEFAULT_CACHE_MB))
+    if max_mb <= 0:
+        return None
+    return ResponseCache(max_mb * 2**20, os.environ.get(CACHE_DIR_ENV),
+                         int(os.environ.get(CACHE_DISK_MB_ENV, DEFAULT_CACHE_DISK_MB)) * 2**20)
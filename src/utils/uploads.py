@@ -0,0 +1,109 @@
+""" Uploaded files spooled in memory up to a threshold, then on disk, hashed while they are received.
+
+The multipart parser writes each uploaded file into a SpooledUpload chunk by chunk, so a request never
+holds the whole pdf as one bytes object: small uploads stay in memory, larger ones are written to a
+temporary file as they arrive, and the pipeline reads that file in place (no second copy). The sha256
+of the content (key of the response cache) is updated on each chunk, no extra pass over the data.
+"""
+import hashlib
+import io
+import os
+import tempfile
+
+from src.utils.metrics import Counter, REGISTRY
+
+
+UPLOAD_SPOOL_MB_ENV = "CCM_UPLOAD_SPOOL_MB"  # uploads above this size are spooled to disk
+UPLOAD_MAX_MB_ENV = "CCM_MAX_UPLOAD_MB"  # max request body, larger requests get 413
+DEFAULT_UPLOAD_SPOOL_MB = 1
+DEFAULT_UPLOAD_MAX_MB = 200
+
+UPLOADS = REGISTRY.register(Counter(
+    "ccm_uploads_total", "Uploaded files, by where they were spooled.", ["spool"]))
+
+
+class SpooledUpload(io.RawIOBase):
+    """ Writable then readable file: in memory up to max_memory bytes, then a named temporary file
+
+    Args:
+    ---
+        max_memory (int): bytes kept in memory before spilling to disk
+        dir (str, optional): folder of the temporary file. Defaults to the system temporary folder.
+    """
+
+    def __init__(self, max_memory, dir=None):
+        io.RawIOBase.__init__(self)
+        self.max_memory = max_memory
+        self.dir = dir
+        self.path = None  # temporary file once spilled to disk
+        self.size = 0
+        self._file = io.BytesIO()
+        self._sha256 = hashlib.sha256()
+
+    def _rollover(self):
+        fd, self.path = tempfile.mkstemp(prefix="ccm_upload_", suffix=".pdf", dir=self.dir)
+        disk_file = os.fdopen(fd, "w+b")
+        disk_file.write(self._file.getbuffer())
+        self._file = disk_file
+
+    def readable(self):
+        return True
+
+    def writable(self):
+        return True
+
+    def seekable(self):
+        return True
+
+    def write(self, data):
+        self._sha256.update(data)
+        self.size += len(data)
+        if self.path is None and self._file.tell() + len(data) > self.max_memory:
+            self._rollover()
+        return self._file.write(data)
+
+    def readinto(self, buffer):
+        return self._file.readinto(buffer)
+
+    def read(self, size=-1):
+        return self._file.read(size)
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        return self._file.seek(offset, whence)
+
+    def tell(self):
+        return self._file.tell()
+
+    def flush(self):
+        self._file.flush()
+
+    def hexdigest(self):
+        """ sha256 of everything written so far"""
+        return self._sha256.hexdigest()
+
+    def save_pdf(self, folder):
+        """ Path of the content on disk: the spooled file itself, or a copy of the memory buffer in folder
+
+        Returns:
+        ---
+            str
+        """
+        if self.path is not None:
+            self._file.flush()
+            return self.path
+        pdf_path = os.path.join(folder, "input.pdf")
+        with open(pdf_path, "wb") as f:
+            f.write(self._file.getbuffer())
+        return pdf_path
+
+    def close(self):
+        if self.closed:
+            return
+        io.RawIOBase.close(self)  # flushes, before the underlying file is closed
+        UPLOADS.inc(spool="memory" if self.path is None else "disk")
+        self._file.close()
+        if self.path is not None:
+            try:
+                os.remove(self.path)
+            except OSError:
+                pass
@@ -0,0 +1,291 @@
+""" Worker processes running one document at a time under a wall-clock deadline and a memory ceiling.
+
+A single pathological pdf can keep pdfminer (or grouping_text) busy for minutes, or make it allocate
+gigabytes, and stall everything queued behind it. Documents given to a WorkerPool run in separate
+processes:
+
+- a document still running after `timeout` seconds has its worker killed and replaced: DocumentTimeout;
+- a worker may allocate at most `memory_limit` bytes above its size at start (RLIMIT_AS, Linux): a
+  document hitting the ceiling gets a MemoryError in the worker (or the error C code raises instead, see
+  is_memory_error), which is replaced: DocumentMemoryError;
+- a worker that dies (segfault, killed by the OOM killer) is replaced: WorkerCrashed;
+- a worker is replaced after `max_tasks` documents, to bound the memory pdfminer and the process-wide
+  caches keep between documents.
+
+Workers are started by a fork server (where available) which has preloaded the pipeline modules: new
+workers are cheap, and are never forked from a multi-threaded process (a lock held by another thread
+at fork time would stay locked in the child). The function and its arguments are pickled to the
+worker, so they must be module-level / picklable.
+Other exceptions raised by the function are raised again in the caller. Stage timings (metrics.stage_timer)
+measured in the worker are observed in the calling process.
+"""
+import multiprocessing
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from src.utils.metrics import Counter, REGISTRY, STAGE_LISTENER, observe_stage
+
+
+PRELOAD = ["src.strategies"]
+
+WORKER_EVENTS = REGISTRY.register(Counter(
+    "ccm_worker_events_total", "Document worker processes started, recycled or killed.", ["event"]))
+
+
+class WorkerError(Exception):
+    """ A document could not be processed by its worker"""
+
+    def __init__(self, message, seconds=None):
+        Exception.__init__(self, message)
+        self.seconds = seconds
+
+
+class DocumentTimeout(WorkerError):
+    pass
+
+
+class DocumentMemoryError(WorkerError):
+    pass
+
+
+class WorkerCrashed(WorkerError):
+    pass
+
+
+def _address_space():
+    """ Virtual memory size of this process in bytes (Linux), 0 if unknown"""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmSize:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    return 0
+
+
+_memory_limited = False  # set in a worker by _limit_memory
+
+
+def _limit_memory(memory_limit):
+    global _memory_limited
+    import resource
+    soft = _address_space() + memory_limit
+    _, hard = resource.getrlimit(resource.RLIMIT_AS)
+    if hard != resource.RLIM_INFINITY:
+        soft = min(soft, hard)
+    resource.setrlimit(resource.RLIMIT_AS, (soft, hard))
+    _memory_limited = True
+
+
+def is_memory_error(exc):
+    """ True if exc is an allocation failure: a MemoryError, or in a worker under a memory limit, the error
+    raised instead by C code when mmap / malloc fail (a thread stack: "can't start new thread", libxml2:
+    "unknown error" or "Memory allocation failed")"""
+    if isinstance(exc, MemoryError):
+        return True
+    if not _memory_limited:
+        return False
+    message = str(exc)
+    if isinstance(exc, RuntimeError):
+        return "can't start new thread" in message
+    return type(exc).__module__ == "lxml.etree" and ("unknown error" in message or "Memory allocation failed" in message)
+
+
+def _worker_main(conn, memory_limit):
+    """ Worker loop: run (func, args, kwargs) tasks until None or a MemoryError"""
+    if memory_limit:
+        _limit_memory(memory_limit)
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            break
+        if task is None:
+            break
+        func, args, kwargs = task
+        stages = []
+        token = STAGE_LISTENER.set(lambda stage, seconds: stages.append((stage, seconds)))
+        try:
+            result = ("ok", func(*args, **kwargs))
+        except MemoryError:
+            result = ("memory", None)
+        except Exception as e:
+            result = ("memory", None) if is_memory_error(e) else ("error", e)
+        finally:
+            STAGE_LISTENER.reset(token)
+        try:
+            conn.send(result + (stages,))
+        except Exception as e:  # result or exception that does not pickle
+            conn.send(("error", RuntimeError(f"{type(e).__name__} sending the result: {e}"), stages))
+        if result[0] == "memory":
+            break  # after a MemoryError the state of the process is not trusted
+
+
+class _Worker:
+    def __init__(self, ctx, memory_limit):
+        self.conn, child_conn = ctx.Pipe()
+        self.process = ctx.Process(target=_worker_main, args=(child_conn, memory_limit), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.tasks = 0
+        WORKER_EVENTS.inc(event="started")
+
+    def stop(self, kill=False):
+        if not kill:
+            try:
+                self.conn.send(None)
+            except OSError:
+                kill = True
+        if kill:
+            self.process.kill()
+        self.process.join(5)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class WorkerPool:
+    """ Fixed number of worker processes, each running one document at a time (thread-safe)
+
+    Args:
+    ---
+        processes (int, optional): number of workers. Defaults to 1.
+        timeout (float, optional): seconds a document may run, None = no limit
+        memory_limit (int, optional): bytes a worker may allocate above its size at start, None = no limit
+        max_tasks (int, optional): documents processed by a worker before it is replaced, None = never
+        start_method (str, optional): multiprocessing start method. Defaults to "forkserver" where available.
+        preload (list, optional): modules imported once by the fork server. Defaults to PRELOAD
+    """
+
+    def __init__(self, processes=1, timeout=None, memory_limit=None, max_tasks=None, start_method=None, preload=None):
+        if memory_limit:
+            try:
+                import resource  # noqa: F401
+            except ImportError:
+                raise RuntimeError("memory_limit needs the resource module (unix)")
+        self.processes = processes
+        self.timeout = timeout
+        self.memory_limit = memory_limit
+        self.max_tasks = max_tasks
+        if start_method is None and "forkserver" in multiprocessing.get_all_start_methods():
+            start_method = "forkserver"
+        self._ctx = multiprocessing.get_context(start_method)
+        if start_method == "forkserver":
+            self._ctx.set_forkserver_preload(preload or PRELOAD)
+        self._lock = threading.Lock()
+        self._closed = False
+        self._workers = set()  # alive workers, idle or busy
+        self._idle = queue.Queue()
+        for _ in range(processes):
+            self._idle.put(self._new_worker())
+        self._threads = None
+
+    def _new_worker(self):
+        worker = _Worker(self._ctx, self.memory_limit)
+        with self._lock:
+            self._workers.add(worker)
+        return worker
+
+    def _release(self, worker, replace=False, kill=False, event=None):
+        """ Give the worker back to the pool, or a new one in its place"""
+        if self._closed:
+            replace, kill = True, True
+        if replace:
+            with self._lock:
+                self._workers.discard(worker)
+            worker.stop(kill)
+            WORKER_EVENTS.inc(event=event)
+            if self._closed:
+                return
+            worker = self._new_worker()
+        self._idle.put(worker)
+
+    def _acquire(self):
+        while True:
+            try:
+                return self._idle.get(timeout=0.5)
+            except queue.Empty:
+                if self._closed:
+                    raise RuntimeError("worker pool is shut down")
+
+    def run(self, func, *args, **kwargs):
+        """ func(*args, **kwargs) in a worker, waits for a free worker
+
+        Raises:
+        ---
+            DocumentTimeout, DocumentMemoryError, WorkerCrashed, or the exception raised by func
+        """
+        worker = self._acquire()
+        start = time.perf_counter()
+        released = False
+        try:
+            try:
+                worker.conn.send((func, args, kwargs))
+                ready = worker.conn.poll(self.timeout)
+            except OSError:  # killed by shutdown(wait=False)
+                raise WorkerCrashed("worker stopped", time.perf_counter() - start)
+            if not ready:
+                self._release(worker, replace=True, kill=True, event="timeout")
+                released = True
+                raise DocumentTimeout(f"document not processed in {self.timeout}s", time.perf_counter() - start)
+            try:
+                status, value, stages = worker.conn.recv()
+            except (EOFError, OSError):
+                worker.process.join(5)
+                exitcode = worker.process.exitcode
+                self._release(worker, replace=True, kill=True, event="crashed")
+                released = True
+                raise WorkerCrashed(f"worker died (exit code {exitcode})", time.perf_counter() - start)
+            for stage, seconds in stages:
+                observe_stage(stage, seconds)
+            worker.tasks += 1
+            if status == "memory":
+                self._release(worker, replace=True, event="memory")
+                released = True
+                raise DocumentMemoryError(f"document exceeded {self.memory_limit} bytes", time.perf_counter() - start)
+            recycle = self.max_tasks is not None and worker.tasks >= self.max_tasks
+            self._release(worker, replace=recycle, event="recycled")
+            released = True
+            if status == "error":
+                raise value
+            return value
+        finally:
+            if not released:  # interrupted while the worker was busy, its state is unknown
+                self._release(worker, replace=True, kill=True, event="killed")
+
+    def submit(self, func, *args, **kwargs):
+        """ run() in a background thread
+
+        Returns:
+        ---
+            concurrent.futures.Future
+        """
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("submit after shutdown")
+            if self._threads is None:
+                self._threads = ThreadPoolExecutor(self.processes, thread_name_prefix="ccm-worker-pool")
+        return self._threads.submit(self.run, func, *args, **kwargs)
+
+    def shutdown(self, wait=True):
+        """ Stop the workers, after the running documents if wait, else now (running documents get WorkerCrashed)"""
+        if self._threads is not None and wait:
+            self._threads.shutdown(wait=True)
+        with self._lock:
+            self._closed = True
+            workers = list(self._workers)
+            self._workers.clear()
+        for worker in workers:
+            worker.stop(kill=not wait)
+        if self._threads is not None and not wait:
+            self._threads.shutdown(wait=False)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.shutdown()
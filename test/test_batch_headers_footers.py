@@ -0,0 +1,54 @@
+""" batch.py --mode oth_main: headers / footers detected by the workers (under the document limits) and
+aggregated from the checkpoint give the same headers_footers.json as strategies.oth_main.
+
+    python -m pytest -q test/test_batch_headers_footers.py
+"""
+import json
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from bench.corpus import generate_corpus
+from src.batch import run_batch
+from src.strategies import oth_main
+
+HEADER = "COMPAGNIE GENERALE DES ASSURANCES\nService clients - 12 avenue des Champs, 75008 PARIS"
+
+
+class BatchHeadersFootersTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        generate_corpus(self.tmp / "corpus", 6)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def run_batch(self, **kwargs):
+        run_batch(self.tmp / "corpus", self.tmp / "out", mode="oth_main", **kwargs)
+        with open(self.tmp / "out" / "headers_footers.json") as f:
+            return json.load(f)
+
+    def test_workers_under_limits_match_library(self):
+        result = self.run_batch(workers=2, doc_timeout=60, doc_memory_limit=500 * 2**20)
+        self.assertEqual(len(result["documents"]), 6)
+        self.assertIn(HEADER, [block["text"] for block in result["corpus"]["header"]])
+
+        library_dir = self.tmp / "library"
+        shutil.copytree(self.tmp / "corpus", library_dir / "corpus", ignore=shutil.ignore_patterns("*.xml*", "*.json"))
+        (library_dir / "out").mkdir()
+        oth_main((library_dir / "corpus").as_posix(), (library_dir / "out").as_posix())
+        with open(library_dir / "out" / "headers_footers.json") as f:
+            self.assertEqual(json.load(f), result)
+
+    def test_resumed_run_gives_the_same_result(self):
+        result = self.run_batch()
+        checkpoint = self.tmp / "out" / ".ccm_batch" / "checkpoint.jsonl"
+        lines = checkpoint.read_text().splitlines(True)
+        checkpoint.write_text("".join(lines[:-2]))  # interrupted before the last 2 documents
+        self.assertEqual(self.run_batch(), result)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,83 @@
+""" Glyph fast path (find_all_textboxes_glyphs) against the layout path (find_all_textboxes_B): same text
+and same fontinfo on coloured text, whatever operator set the colour (rg, g, sc / scn).
+
+    python -m pytest -q test/test_glyph_extraction.py
+"""
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from bench.corpus import PAGE_H, PAGE_W, _PDFWriter, _pdf_string, make_pdf, DEFAULT_PROFILES
+from src.utils.pdf2xml import find_all_textboxes_B, find_all_textboxes_glyphs, format_fontinfo, pdf_to_xml_tree
+
+# (colour operators, text, expected color of the fontinfo)
+COLOURED_LINES = [
+    (b"0.1 0.2 0.3 rg", "Texte en couleur rg", "(25,51,76)"),
+    (b"0.5 g", "Texte en gris g", "(127,127,127)"),
+    (b"/DeviceRGB cs 0.1 0.2 0.3 sc", "Texte en couleur sc", "(25,51,76)"),     # ncolour "[0.1, 0.2, 0.3]"
+    (b"/DeviceRGB cs 0.1 0.2 0.3 scn", "Texte en couleur scn", "(25,51,76)"),
+    (b"/DeviceGray cs 0.5 scn", "Texte en gris scn", "(127,127,127)"),          # ncolour "[0.5]"
+]
+
+
+def coloured_pdf():
+    """ One page, one line per entry of COLOURED_LINES, far enough apart to be separate blocks"""
+    w = _PDFWriter()
+    catalog_id, pages_id = w.reserve(), w.reserve()
+    font_id = w.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    content = b""
+    for i, (ops, text, _) in enumerate(COLOURED_LINES):
+        content += ops + b" BT /F1 12 Tf 50 %d Td " % (PAGE_H - 100 - i * 60) + _pdf_string(text) + b" Tj ET\n"
+    content_id = w.add_stream(b"", content)
+    page_id = w.add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 %d 0 R >> >> "
+                    b"/Contents %d 0 R >>" % (pages_id, PAGE_W, PAGE_H, font_id, content_id))
+    w.set(pages_id, b"<< /Type /Pages /Kids [%d 0 R] /Count 1 >>" % page_id)
+    w.set(catalog_id, b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    return w.tobytes(catalog_id)
+
+
+def block_fonts(blocks):
+    """ {block text: set of fontinfo} of [(bbox, line_list)]"""
+    out = {}
+    for _, linelist in blocks:
+        text = "\n".join("".join(line[1]) for line in linelist)
+        out[text] = {font for line in linelist for font in line[2]}
+    return out
+
+
+class ColouredTextTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_format_fontinfo_colours(self):
+        self.assertEqual(format_fontinfo("F", "12.000", "[0.1, 0.2, 0.3]"), "F$#size=12$#color=(25,51,76)")
+        self.assertEqual(format_fontinfo("F", "12.000", "[0.5]"), "F$#size=12$#color=(127,127,127)")
+        self.assertEqual(format_fontinfo("F", "12.000", "(0.1, 0.2, 0.3)"), "F$#size=12$#color=(25,51,76)")
+        self.assertEqual(format_fontinfo("F", "12.000", "0"), "F$#size=12$#color=(0,0,0)")
+        self.assertEqual(format_fontinfo("F", "12.000", "None"), "F$#size=12")
+
+    def test_list_coloured_text_in_both_paths(self):
+        path = self.tmp / "coloured.pdf"
+        path.write_bytes(coloured_pdf())
+        layout = block_fonts(find_all_textboxes_B(pdf_to_xml_tree(path.as_posix(), maxpages=1)))
+        glyphs = block_fonts(find_all_textboxes_glyphs(path.as_posix(), backend="pdfminer")[0])
+        for _, text, color in COLOURED_LINES:
+            self.assertEqual(layout[text], {f"Helvetica$#size=12$#color={color}"}, text)
+        self.assertEqual(glyphs, layout)
+
+    def test_corpus_documents_have_the_same_fonts_in_both_paths(self):
+        for docno, profile in enumerate(DEFAULT_PROFILES[:3]):
+            path = self.tmp / f"{profile['name']}.pdf"
+            path.write_bytes(make_pdf(profile, docno=docno))
+            layout = block_fonts(find_all_textboxes_B(pdf_to_xml_tree(path.as_posix(), maxpages=1)))
+            glyphs = block_fonts(find_all_textboxes_glyphs(path.as_posix(), backend="pdfminer")[0])
+            self.assertEqual(set().union(*glyphs.values()), set().union(*layout.values()), profile["name"])
+
+
+if __name__ == "__main__":
+    unittest.main()
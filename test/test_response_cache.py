@@ -0,0 +1,148 @@
+""" Response cache of /pdf2xml (utils/response_cache.py): concurrent requests for the same upload are
+computed once, repeated ones are served from memory or from the disk tier, and a client sending back
+the ETag gets 304.
+
+    python -m pytest -q test/test_response_cache.py
+"""
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+from bench.corpus import generate_corpus
+from src.utils.response_cache import CACHE_DIR_ENV, CACHE_MB_ENV, ResponseCache
+
+
+N_THREADS = 8
+
+
+class GetOrComputeTest(unittest.TestCase):
+
+    def concurrent_calls(self, cache, compute):
+        """ [(result or exception, status)] of N_THREADS get_or_compute of the same key"""
+        def call():
+            try:
+                return cache.get_or_compute("key", compute)
+            except Exception as e:
+                return e, "error"
+        with ThreadPoolExecutor(N_THREADS) as executor:
+            futures = [executor.submit(call) for _ in range(N_THREADS)]
+            return [f.result() for f in futures]
+
+    def test_concurrent_callers_are_coalesced(self):
+        cache = ResponseCache(2**20)
+        calls = []
+        release = threading.Event()
+
+        def compute():
+            calls.append(1)
+            release.wait(10)  # every other caller arrives while the result is computed
+            return b"result"
+        threading.Timer(0.5, release.set).start()
+        results = self.concurrent_calls(cache, compute)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual({data for data, _ in results}, {b"result"})
+        statuses = sorted(status for _, status in results)
+        self.assertEqual(statuses, ["coalesced"] * (N_THREADS - 1) + ["miss"])
+        self.assertEqual(cache.get_or_compute("key", compute), (b"result", "hit"))
+        self.assertEqual(len(calls), 1)
+
+    def test_error_is_raised_to_every_waiting_caller_and_not_cached(self):
+        cache = ResponseCache(2**20)
+        release = threading.Event()
+
+        def compute():
+            release.wait(10)
+            raise ValueError("bad pdf")
+        threading.Timer(0.5, release.set).start()
+        results = self.concurrent_calls(cache, compute)
+        self.assertEqual({status for _, status in results}, {"error"})
+        self.assertTrue(all(isinstance(e, ValueError) for e, _ in results))
+        self.assertEqual(cache.get_or_compute("key", lambda: b"result"), (b"result", "miss"))
+
+    def test_memory_budget_evicts_least_recently_used(self):
+        cache = ResponseCache(10)
+        cache.get_or_compute("a", lambda: b"12345")
+        cache.get_or_compute("b", lambda: b"12345")
+        cache.get_or_compute("a", lambda: b"other")  # a is now the most recently used
+        cache.get_or_compute("c", lambda: b"12345")
+        self.assertEqual(cache.get_or_compute("a", lambda: b"other"), (b"12345", "hit"))
+        self.assertEqual(cache.get_or_compute("b", lambda: b"other"), (b"other", "miss"))
+
+
+class Pdf2xmlCacheTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = Path(tempfile.mkdtemp())
+        cls.pdf = generate_corpus(cls.tmp / "corpus", 1)[0][0]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def app(self, **env):
+        with mock.patch.dict(os.environ, dict({CACHE_MB_ENV: "16"}, **env)):
+            from src.server_app import flask_app
+            return flask_app()
+
+    def post(self, app, options=None, headers=None):
+        with app.test_client() as client:
+            return client.post("/pdf2xml", content_type="multipart/form-data", headers=headers,
+                               data=dict(options or {}, pdf_file=(io.BytesIO(self.pdf.read_bytes()), self.pdf.name)))
+
+    def test_repeated_upload_is_a_hit_with_the_same_etag(self):
+        app = self.app()
+        first, second = self.post(app), self.post(app)
+        self.assertEqual((first.status_code, second.status_code), (200, 200))
+        self.assertEqual(first.headers["X-Cache"], "MISS")
+        self.assertEqual(second.headers["X-Cache"], "HIT")
+        self.assertEqual(second.data, first.data)
+        self.assertTrue(first.headers["ETag"].startswith('W/"'))
+        self.assertEqual(second.headers["ETag"], first.headers["ETag"])
+
+        other = self.post(app, {"format": "json"})
+        self.assertEqual(other.headers["X-Cache"], "MISS")
+        self.assertNotEqual(other.headers["ETag"], first.headers["ETag"])
+
+    def test_if_none_match_gives_304(self):
+        app = self.app()
+        etag = self.post(app).headers["ETag"]
+        response = self.post(app, headers={"If-None-Match": etag})
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.data, b"")
+        self.assertEqual(response.headers["ETag"], etag)
+        self.assertEqual(self.post(app, headers={"If-None-Match": 'W/"another"'}).status_code, 200)
+
+    def test_concurrent_uploads_are_computed_once(self):
+        app = self.app()
+        with ThreadPoolExecutor(N_THREADS) as executor:
+            responses = list(executor.map(lambda _: self.post(app), range(N_THREADS)))
+        self.assertEqual({r.status_code for r in responses}, {200})
+        statuses = [r.headers["X-Cache"] for r in responses]
+        self.assertEqual(statuses.count("MISS"), 1)
+        self.assertTrue(set(statuses) <= {"MISS", "COALESCED", "HIT"}, statuses)
+        self.assertEqual(len({r.data for r in responses}), 1)
+
+    def test_disk_tier_is_shared_by_server_processes(self):
+        disk_dir = (self.tmp / "cache").as_posix()
+        first = self.post(self.app(**{CACHE_DIR_ENV: disk_dir}))
+        second = self.post(self.app(**{CACHE_DIR_ENV: disk_dir}))  # another process, empty memory tier
+        self.assertEqual(first.headers["X-Cache"], "MISS")
+        self.assertEqual(second.headers["X-Cache"], "DISK")
+        self.assertEqual(second.data, first.data)
+
+    def test_disabled_cache_has_no_etag(self):
+        response = self.post(self.app(**{CACHE_MB_ENV: "0"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("X-Cache", response.headers)
+        self.assertNotIn("ETag", response.headers)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+""" Concurrency stress test of /pdf2xml: requests processed at the same time by the threaded app give
+complete zips, byte-identical to the ones of a sequential run.
+
+    python -m pytest -q test/test_server_concurrency.py
+"""
+import io
+import os
+import tempfile
+import unittest
+import zipfile
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from unittest import mock
+
+from bench.corpus import generate_corpus
+from src.utils.response_cache import CACHE_MB_ENV
+
+
+N_DOCS = 6
+N_THREADS = 8
+ROUNDS = 3  # every document is sent ROUNDS times concurrently
+OPTIONS = [{}, {"format": "json", "compression": "deflate"}, {"extraction": "glyphs", "artifacts": "blocks"}]
+
+
+class Pdf2xmlConcurrencyTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = tempfile.TemporaryDirectory()
+        cls.pdfs = [path for path, _ in generate_corpus(Path(cls.tmp.name) / "corpus", N_DOCS)]
+        # no response cache: every request is computed, none is served from another one
+        with mock.patch.dict(os.environ, {CACHE_MB_ENV: "0"}):
+            from src.server_app import flask_app
+            cls.app = flask_app()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.tmp.cleanup()
+
+    def post(self, pdf_path, options):
+        with self.app.test_client() as client:
+            response = client.post("/pdf2xml", content_type="multipart/form-data",
+                                   data=dict(options, pdf_file=(io.BytesIO(pdf_path.read_bytes()), pdf_path.name)))
+        self.assertEqual(response.status_code, 200, response.data[:200])
+        return response.data
+
+    def check_zip(self, data, pdf_path, options):
+        with zipfile.ZipFile(io.BytesIO(data)) as z:
+            self.assertIsNone(z.testzip())
+            names = set(z.namelist())
+        artifacts = options.get("artifacts", "both")
+        expected = set()
+        if artifacts in ("both", "raw"):
+            expected.add(pdf_path.stem + ".raw.xml")
+        if artifacts in ("both", "blocks"):
+            expected.add(pdf_path.stem + ".blocks." + options.get("format", "xml"))
+        self.assertEqual(names, expected)
+
+    def test_concurrent_requests_match_sequential(self):
+        jobs = [(pdf, i) for pdf in self.pdfs for i in range(len(OPTIONS))]
+        sequential = {}
+        for pdf, i in jobs:
+            sequential[pdf, i] = self.post(pdf, OPTIONS[i])
+            self.check_zip(sequential[pdf, i], pdf, OPTIONS[i])
+
+        concurrent_jobs = jobs * ROUNDS
+        with ThreadPoolExecutor(N_THREADS) as executor:
+            results = list(executor.map(lambda job: self.post(job[0], OPTIONS[job[1]]), concurrent_jobs))
+        for (pdf, i), data in zip(concurrent_jobs, results):
+            self.check_zip(data, pdf, OPTIONS[i])
+            self.assertEqual(data, sequential[pdf, i], f"{pdf.name} {OPTIONS[i]}")
+
+    def test_no_workspace_left_behind(self):
+        before = set(Path(tempfile.gettempdir()).glob("ccm_*"))
+        with ThreadPoolExecutor(N_THREADS) as executor:
+            list(executor.map(lambda pdf: self.post(pdf, {}), self.pdfs * 2))
+        self.assertEqual(set(Path(tempfile.gettempdir()).glob("ccm_*")), before)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,58 @@
+""" Map / merge / analyse of src/sharding.py: the shards of a corpus, indexed separately and merged in any
+order, give the aggregate structure and template of a single process run.
+
+    python -m pytest -q test/test_sharding.py
+"""
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+
+from bench.corpus import generate_corpus
+from src.sharding import merge_partial_files, run_local, run_shard
+from src.strategies import analyse_corpus_index, analyse_partial_index, index_corpus
+
+N_DOCS = 8
+N_SHARDS = 3
+
+
+class ShardingTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = Path(tempfile.mkdtemp())
+        generate_corpus(cls.tmp / "corpus", N_DOCS)
+        (cls.tmp / "single").mkdir()
+        index = index_corpus((cls.tmp / "corpus").as_posix(), (cls.tmp / "single").as_posix(), export_org_xml=False,
+                             export_blocks=False)
+        cls.expected = analyse_corpus_index(index)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_map_merge_equals_single_process(self):
+        out_dir = self.tmp / "map" / "images"  # does not exist yet: created by the map step
+        paths = [run_shard((self.tmp / "corpus").as_posix(), out_dir.as_posix(), i, N_SHARDS,
+                           (self.tmp / f"partial_{i}.json.gz").as_posix(), export_org_xml=False, export_blocks=False)
+                 for i in range(N_SHARDS)]
+        self.assertTrue(out_dir.is_dir())
+        merged = merge_partial_files(paths)
+        self.assertEqual(len(merged["documents"]), N_DOCS)
+        self.assertEqual(analyse_partial_index(merged), self.expected)
+        # merge order does not matter
+        self.assertEqual(merge_partial_files(reversed(paths)), merged)
+
+    def test_local_workflow_equals_single_process(self):
+        result = run_local((self.tmp / "corpus").as_posix(), (self.tmp / "local").as_posix(), N_SHARDS,
+                           export_org_xml=False, export_blocks=False)
+        self.assertEqual(result, self.expected)
+
+    def test_shard_out_of_range(self):
+        with self.assertRaises(ValueError):
+            run_shard((self.tmp / "corpus").as_posix(), (self.tmp / "bad").as_posix(), N_SHARDS, N_SHARDS,
+                      (self.tmp / "bad.json").as_posix())
+
+
+if __name__ == "__main__":
+    unittest.main()
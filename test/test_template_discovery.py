@@ -0,0 +1,129 @@
+""" Sample-then-verify template discovery (template.discover_template) followed by matching (match_pdf):
+on a corpus of one layout it finds the template of the full analysis (main_ignore), moving families of
+near-duplicate blocks survive verification, rejected ones leave no trace in the template.
+
+    python -m pytest -q test/test_template_discovery.py
+"""
+import os
+import random
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from bench.corpus import DEFAULT_PROFILES, PAGE_H, PAGE_W, _PDFWriter, _pdf_string, _random_sentence, generate_corpus
+from src.strategies import main_ignore
+from src.template import discover_template, load_template, match_pdf
+from src.utils.minhash import NEAR_DUPLICATE_ENV
+
+N_DOCS = 10
+SAMPLE_SIZE = 4
+SEED = 0
+HEADER = "COMPAGNIE GENERALE DES ASSURANCES"
+
+
+def make_document(docno, offer=True, reference_at=None):
+    """ One page: a fixed header, a reference line moving with docno (moving family, or at reference_at), an
+    offer line at a fixed place (fixed family, replaced by unrelated text if not offer) and a body of random
+    words"""
+    rnd = random.Random(docno)
+    x, y = reference_at or (60 + 7 * docno, 560 - 37 * docno)
+    lines = [(50, PAGE_H - 60, HEADER),
+             (x, y, f"Reference of this notice: {10000 + 7919 * docno} / AB"),
+             (50, 160, f"Offre valable jusqu'au {docno % 28 + 1:02d}/12 pour le client {docno:05d}" if offer
+              else "Aucune offre commerciale ne vous est proposee cette annee")]
+    lines += [(300, 700 - 14 * i, _random_sentence(rnd, 40)) for i in range(8)]
+    w = _PDFWriter()
+    catalog_id, pages_id = w.reserve(), w.reserve()
+    font_id = w.add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica /Encoding /WinAnsiEncoding >>")
+    content = b"".join(b"0 g BT /F1 10 Tf %d %d Td " % (x, y) + _pdf_string(text) + b" Tj ET\n" for x, y, text in lines)
+    content_id = w.add_stream(b"", content)
+    page_id = w.add(b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 %d %d] /Resources << /Font << /F1 %d 0 R >> >> "
+                    b"/Contents %d 0 R >>" % (pages_id, PAGE_W, PAGE_H, font_id, content_id))
+    w.set(pages_id, b"<< /Type /Pages /Kids [%d 0 R] /Count 1 >>" % page_id)
+    w.set(catalog_id, b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id)
+    return w.tobytes(catalog_id)
+
+
+class SampleThenVerifyTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = Path(tempfile.mkdtemp())
+        cls.corpus = cls.tmp / "corpus"
+        generate_corpus(cls.corpus, N_DOCS, profiles=[DEFAULT_PROFILES[0]])
+        (cls.tmp / "out").mkdir()
+        main_ignore(cls.corpus.as_posix(), (cls.tmp / "out").as_posix(), template_path=(cls.tmp / "full.json").as_posix())
+        cls.full = load_template(cls.tmp / "full.json")
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def test_same_template_as_the_full_analysis(self):
+        template = discover_template(self.corpus.as_posix(), sample_size=SAMPLE_SIZE, seed=SEED)
+        discovery = template.pop("discovery")
+        self.assertEqual(template, self.full)
+        self.assertEqual((discovery["verified_documents"], discovery["coverage"]), (N_DOCS - SAMPLE_SIZE, 1.0))
+        self.assertEqual(discovery["rejected"], {})
+        for block in discovery["blocks"].values():
+            self.assertEqual(block, {"present_in": N_DOCS, "max_missing_rate_95": 0.0})
+
+    def test_verify_limit_bounds_the_missing_rate(self):
+        template = discover_template(self.corpus.as_posix(), sample_size=SAMPLE_SIZE, seed=SEED, verify_limit=2)
+        discovery = template["discovery"]
+        self.assertEqual(set(template["blocks"]), set(self.full["blocks"]))
+        self.assertEqual((discovery["verified_documents"], discovery["coverage"]), (2, (SAMPLE_SIZE + 2) / N_DOCS))
+        for block in discovery["blocks"].values():
+            self.assertEqual(block, {"present_in": SAMPLE_SIZE + 2, "max_missing_rate_95": 3 / (SAMPLE_SIZE + 2)})
+
+
+class DiscoverThenMatchTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        corpus = self.tmp / "corpus"
+        corpus.mkdir()
+        paths = [corpus / f"doc{i:02d}.pdf" for i in range(N_DOCS)]
+        # same sample as discover_template: the document without an offer is verified, not sampled
+        sample = set(random.Random(SEED).sample(paths, SAMPLE_SIZE))
+        self.without_offer = next(p for p in paths if p not in sample)
+        for i, path in enumerate(paths):
+            path.write_bytes(make_document(i, offer=path != self.without_offer))
+        with mock.patch.dict(os.environ, {NEAR_DUPLICATE_ENV: "0.7"}):
+            self.template = discover_template(corpus.as_posix(), sample_size=SAMPLE_SIZE, seed=SEED)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def test_rejected_family_is_removed_from_bands(self):
+        rejected = self.template["discovery"]["rejected"]
+        self.assertEqual(set(rejected.values()), {self.without_offer.stem})
+        blocks = self.template["blocks"]
+        self.assertTrue(self.template["bands"])
+        for hashes in self.template["bands"].values():
+            self.assertTrue(set(hashes) <= set(blocks))
+        self.assertFalse(set(rejected) & {h for hashes in self.template["bands"].values() for h in hashes})
+
+    def test_moving_family_survives_verification(self):
+        families = [b for b in self.template["blocks"].values() if "minhash" in b]
+        self.assertEqual(len(families), 1)
+        self.assertFalse(families[0]["fixedLocation"])
+        self.assertEqual(self.template["discovery"]["verified_documents"], N_DOCS - SAMPLE_SIZE)
+
+    def test_match_after_discovery(self):
+        new_doc = self.tmp / "new.pdf"
+        # new reference, at a new place, and an offer of the rejected family
+        new_doc.write_bytes(make_document(42, reference_at=(120, 400)))
+        result = match_pdf(self.template, new_doc.as_posix())
+        self.assertEqual(result["score"], 1.0)
+        family_blocks = [b for b in result["blocks"] if "family" in b]
+        self.assertEqual(len(family_blocks), 1)
+        self.assertEqual(family_blocks[0]["status"], "universal")
+        offer = [b for b in result["blocks"] if abs(float(b["bbox"].split(",")[1]) - 158) < 3]
+        self.assertEqual([b["status"] for b in offer], ["variable"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,125 @@
+""" Compiled corpus templates (template.py): learned once by main_ignore, then new documents are matched
+against them (match_document / match_pdf, /match) without the corpus.
+
+    python -m pytest -q test/test_template_match.py
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from bench.corpus import DEFAULT_PROFILES, generate_corpus, make_pdf
+from src.strategies import main_ignore
+from src.template import TEMPLATE_VERSION, compile_template, load_template, match_document, match_pdf
+from src.utils import sha256_hash_str
+from src.utils.response_cache import CACHE_MB_ENV
+
+FONT = "Helvetica$#size=10$#color=(0,0,0)"
+SIMPLE, SCAN_LIKE = DEFAULT_PROFILES[0], DEFAULT_PROFILES[4]
+HEADER, HEADER_BBOX = "COMPAGNIE GENERALE DES ASSURANCES", "50.0,780.0,350.0,800.0"
+FOOTER, FOOTER_BBOX = "Page 1 / 1", "500.0,30.0,540.0,38.0"
+HEADER_HASH, FOOTER_HASH = sha256_hash_str(HEADER), sha256_hash_str(FOOTER)
+
+
+def text_block(bbox, text):
+    """ (bbox, line_list) of a one line block, as extract_first_page"""
+    return (bbox, [(bbox, list(text), {FONT: list(range(len(text)))})])
+
+
+class CorpusTemplateTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = Path(tempfile.mkdtemp())
+        generate_corpus(cls.tmp / "corpus", 5, profiles=[SIMPLE])
+        (cls.tmp / "out").mkdir()
+        cls.template_path = cls.tmp / "template.json"
+        main_ignore((cls.tmp / "corpus").as_posix(), (cls.tmp / "out").as_posix(),
+                    template_path=cls.template_path.as_posix())
+        cls.template = load_template(cls.template_path)
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def new_document(self, profile, docno=99):
+        path = self.tmp / f"new_{profile['name']}.pdf"
+        path.write_bytes(make_pdf(profile, docno=docno))
+        return path
+
+    def test_document_of_the_corpus_layout(self):
+        result = match_pdf(self.template, self.new_document(SIMPLE).as_posix())
+        self.assertEqual(result["score"], 1.0)
+        self.assertEqual(result["missing"], [])
+        self.assertEqual(result["universal_found"], len(self.template["blocks"]))
+        universal = [b for b in result["blocks"] if b["status"] == "universal"]
+        self.assertEqual({b["hash"] for b in universal}, set(self.template["blocks"]))
+        self.assertFalse(any(b.get("moved") for b in universal))
+        self.assertIn("pagination", {b["type"] for b in universal})
+
+    def test_document_of_another_layout(self):
+        result = match_pdf(self.template, self.new_document(SCAN_LIKE).as_posix())
+        self.assertEqual(result["score"], 0.0)
+        self.assertEqual({m["hash"] for m in result["missing"]}, set(self.template["blocks"]))
+        self.assertEqual({b["status"] for b in result["blocks"]}, {"variable"})
+        replaced = [b["replaces"] for b in result["blocks"] if "replaces" in b]
+        self.assertTrue(replaced)
+        self.assertTrue(set(replaced) <= set(self.template["blocks"]))
+
+    def test_match_endpoint_gives_the_library_result(self):
+        pdf = self.new_document(SIMPLE)
+        with mock.patch.dict(os.environ, {CACHE_MB_ENV: "0"}):
+            from src.server_app import flask_app
+            app = flask_app()
+        with app.test_client() as client:
+            response = client.post("/match", content_type="multipart/form-data", data={
+                "pdf_file": (io.BytesIO(pdf.read_bytes()), pdf.name),
+                "template_file": (io.BytesIO(self.template_path.read_bytes()), "template.json")})
+        self.assertEqual(response.status_code, 200, response.data[:200])
+        self.assertEqual(response.get_json(), json.loads(json.dumps(match_pdf(self.template, pdf.as_posix()))))
+
+    def test_template_of_another_version_is_refused(self):
+        old = dict(self.template, version=TEMPLATE_VERSION - 1)
+        old_path = self.tmp / "old.json"
+        old_path.write_text(json.dumps(old))
+        with self.assertRaises(ValueError):
+            load_template(old_path)
+
+
+class MatchDocumentTest(unittest.TestCase):
+
+    def setUp(self):
+        inverse_index = {HEADER_HASH: {"doc0": [HEADER_BBOX], "doc1": [HEADER_BBOX]},
+                         FOOTER_HASH: {"doc0": [FOOTER_BBOX], "doc1": [FOOTER_BBOX]}}
+        self.template = compile_template({HEADER_HASH, FOOTER_HASH}, {HEADER_HASH, FOOTER_HASH}, inverse_index, {},
+                                         block_with_page={FOOTER_HASH}, address_bbox="320.0,680.0,450.0,720.0",
+                                         corpus_size=2)
+
+    def test_statuses(self):
+        result = match_document(self.template, [
+            text_block((50.0, 700.0, 350.0, 720.0), HEADER),                # universal, not at its place
+            text_block((500.0, 30.0, 540.0, 38.0), "Page 1 / 2"),               # variable, where the footer is
+            text_block((320.0, 680.0, 450.0, 720.0), "M. Jean Dupont\nParis"),  # variable, the address
+        ], [])
+        header, footer, address = result["blocks"]
+        self.assertEqual((header["status"], header["moved"]), ("universal", True))
+        self.assertEqual((footer["status"], footer["replaces"]), ("variable", FOOTER_HASH))
+        self.assertEqual((address["status"], address["type"]), ("variable", "address"))
+        self.assertEqual(result["missing"], [{"hash": FOOTER_HASH, "kind": "text", "type": "pagination",
+                                              "bbox": FOOTER_BBOX}])
+        self.assertEqual(result["score"], 0.5)
+
+    def test_block_at_its_place_is_not_moved(self):
+        result = match_document(self.template, [text_block((50.0, 780.0, 350.0, 800.0), HEADER),
+                                                text_block((500.0, 30.0, 540.0, 38.0), FOOTER)], [])
+        self.assertEqual([(b["status"], b.get("moved", False)) for b in result["blocks"]],
+                         [("universal", False), ("universal", False)])
+        self.assertEqual(result["score"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
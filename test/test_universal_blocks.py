@@ -0,0 +1,114 @@
+""" Universal blocks of a corpus (analyse_corpus_index / analyse_partial_index): exact text and families of
+near-duplicate blocks (utils/minhash.py) must be found in every document, at most once per document.
+
+    python -m pytest -q test/test_universal_blocks.py
+"""
+import unittest
+
+from lxml import etree
+
+from src.strategies import analyse_corpus_index, analyse_partial_index, index_document, merge_partial_indexes, \
+                        new_corpus_index, partial_index_from_corpus_index
+from src.template import match_document
+
+FONT = "Helvetica$#size=10$#color=(0,0,0)"
+PAGE_DIM = (595, 842)
+HEADER = "COMPAGNIE GENERALE DES ASSURANCES"
+BODIES = ["Votre contrat habitation est renouvele", "Nous accusons reception de votre sinistre",
+          "Le montant de la prime annuelle change", "Merci de nous retourner le formulaire signe"]
+
+
+def text_block(bbox, text):
+    """ (bbox, line_list) of a one line block, as extract_first_page"""
+    return (bbox, [(bbox, list(text), {FONT: list(range(len(text)))})])
+
+
+def corpus(documents):
+    """ Corpus index of {docid: [(bbox, text)]}"""
+    index = new_corpus_index()
+    for docid, blocks in sorted(documents.items()):
+        index_document(index, docid, [text_block(bbox, text) for bbox, text in blocks], [], PAGE_DIM)
+    return index
+
+
+def universal_blocks(xml):
+    """ [(text, attributes)] of the <textblock> of <universal_blocks>"""
+    root = etree.fromstring(xml)
+    return [("".join(root_span.text or "" for root_span in node.iter("span")), dict(node.attrib))
+            for node in root.find("universal_blocks").iter("textblock")]
+
+
+def documents_with(n_docs, extra=None):
+    """ n_docs documents with the same header at the same place, and the blocks of extra[docid]"""
+    docs = {f"doc{i}": [((50.0, 780.0, 350.0, 800.0), HEADER), ((50.0, 400.0, 300.0, 410.0), BODIES[i])]
+            for i in range(n_docs)}
+    for docid, blocks in (extra or {}).items():
+        docs[docid] += blocks
+    return docs
+
+
+class ExactTextTest(unittest.TestCase):
+
+    def test_block_in_every_document_is_universal(self):
+        xml, template = analyse_corpus_index(corpus(documents_with(4)), near_duplicate_threshold=0)
+        blocks = universal_blocks(xml)
+        self.assertEqual([text for text, _ in blocks], [HEADER])
+        self.assertEqual(blocks[0][1]["fixedLocation"], "true")
+        self.assertEqual(blocks[0][1]["bbox"], "50.0,780.0,350.0,800.0")
+        self.assertNotIn("nearDuplicates", blocks[0][1])
+
+    def test_block_in_half_the_corpus_is_not_universal(self):
+        twice = [((50.0, 600.0, 300.0, 610.0), "Only in two documents")] * 2  # twice in each of them
+        docs = documents_with(4, {"doc0": twice, "doc1": twice})
+        xml, _ = analyse_corpus_index(corpus(docs), near_duplicate_threshold=0)
+        self.assertEqual([text for text, _ in universal_blocks(xml)], [HEADER])
+
+
+class NearDuplicatesTest(unittest.TestCase):
+
+    def test_family_in_half_the_corpus_is_not_universal(self):
+        variants = [((50.0, 600.0, 300.0, 610.0), "Reference of this notice: 12345 / AB"),
+                    ((50.0, 580.0, 300.0, 590.0), "Reference of this notice: 67890 / AB")]
+        docs = documents_with(4, {"doc0": variants, "doc1": variants})
+        xml, template = analyse_corpus_index(corpus(docs), near_duplicate_threshold=0.7)
+        self.assertEqual([text for text, _ in universal_blocks(xml)], [HEADER])
+
+    def test_family_in_every_document_is_universal(self):
+        docs = documents_with(4, {f"doc{i}": [((50.0, 600.0, 300.0, 610.0), f"Reference of this notice: 1000{i} / AB")]
+                                  for i in range(4)})
+        xml, _ = analyse_corpus_index(corpus(docs), near_duplicate_threshold=0.7)
+        blocks = dict(universal_blocks(xml))
+        self.assertEqual(set(blocks), {HEADER, "Reference of this notice: 10000 / AB"})
+        family = blocks["Reference of this notice: 10000 / AB"]
+        self.assertEqual(family["nearDuplicates"], "4")
+        self.assertEqual(family["fixedLocation"], "true")
+
+    def test_merged_shards_count_distinct_documents(self):
+        variants = [((50.0, 600.0, 300.0, 610.0), "Reference of this notice: 12345 / AB"),
+                    ((50.0, 580.0, 300.0, 590.0), "Reference of this notice: 67890 / AB")]
+        docs = documents_with(4, {"doc0": variants, "doc2": variants})
+        shards = [corpus({d: b for d, b in docs.items() if d in pair}) for pair in (("doc0", "doc1"), ("doc2", "doc3"))]
+        partial = merge_partial_indexes(*(partial_index_from_corpus_index(s, near_duplicates=True) for s in shards))
+        xml, _ = analyse_partial_index(partial, near_duplicate_threshold=0.7)
+        self.assertEqual([text for text, _ in universal_blocks(xml)], [HEADER])
+        self.assertEqual(xml, analyse_corpus_index(corpus(docs), near_duplicate_threshold=0.7)[0])
+
+
+class TemplateMatchTest(unittest.TestCase):
+
+    def test_block_of_a_family_is_matched_through_its_bands(self):
+        docs = documents_with(4, {f"doc{i}": [((50.0, 600.0, 300.0, 610.0), f"Reference of this notice: 1000{i} / AB")]
+                                  for i in range(4)})
+        _, template = analyse_corpus_index(corpus(docs), near_duplicate_threshold=0.7)
+        self.assertTrue(template["bands"])
+        new_doc = [text_block((50.0, 780.0, 350.0, 800.0), HEADER),
+                   text_block((50.0, 600.0, 300.0, 610.0), "Reference of this notice: 98765 / AB"),
+                   text_block((50.0, 400.0, 300.0, 410.0), "Un texte sans rapport avec le corpus")]
+        result = match_document(template, new_doc, [])
+        statuses = [(block["status"], "family" in block) for block in result["blocks"]]
+        self.assertEqual(statuses, [("universal", False), ("universal", True), ("variable", False)])
+        self.assertEqual(result["score"], 1.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
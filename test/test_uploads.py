@@ -0,0 +1,98 @@
+""" Uploads of /pdf2xml (utils/uploads.py): bodies above CCM_MAX_UPLOAD_MB get 413, uploads above
+CCM_UPLOAD_SPOOL_MB are spooled to a temporary file removed after the request, with the same result as
+uploads kept in memory.
+
+    python -m pytest -q test/test_uploads.py
+"""
+import hashlib
+import io
+import os
+import shutil
+import tempfile
+import unittest
+from pathlib import Path
+from unittest import mock
+
+from bench.corpus import generate_corpus
+from src.utils.response_cache import CACHE_MB_ENV
+from src.utils.uploads import UPLOAD_MAX_MB_ENV, UPLOAD_SPOOL_MB_ENV, SpooledUpload
+
+
+class SpooledUploadTest(unittest.TestCase):
+
+    def test_rollover_to_disk(self):
+        chunks = [b"%PDF-1.4\n", b"x" * 100, b"y" * 100]
+        upload = SpooledUpload(max_memory=150)
+        upload.write(chunks[0])
+        upload.write(chunks[1])
+        self.assertIsNone(upload.path)
+        upload.write(chunks[2])
+        path = upload.path
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(upload.size, 209)
+        self.assertEqual(upload.hexdigest(), hashlib.sha256(b"".join(chunks)).hexdigest())
+        self.assertEqual(upload.save_pdf("unused"), path)
+        self.assertEqual(Path(path).read_bytes(), b"".join(chunks))
+        upload.close()
+        self.assertFalse(os.path.exists(path))
+
+    def test_memory_upload_is_saved_in_the_folder(self):
+        tmp = tempfile.mkdtemp()
+        try:
+            upload = SpooledUpload(max_memory=2**20)
+            upload.write(b"%PDF-1.4\n")
+            pdf_path = upload.save_pdf(tmp)
+            self.assertEqual(os.path.dirname(pdf_path), tmp)
+            self.assertEqual(Path(pdf_path).read_bytes(), b"%PDF-1.4\n")
+            upload.close()
+        finally:
+            shutil.rmtree(tmp)
+
+
+class Pdf2xmlUploadTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.tmp = Path(tempfile.mkdtemp())
+        cls.pdf = generate_corpus(cls.tmp / "corpus", 1)[0][0]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(cls.tmp)
+
+    def app(self, **env):
+        with mock.patch.dict(os.environ, dict({CACHE_MB_ENV: "0"}, **env)):
+            from src.server_app import flask_app
+            return flask_app()
+
+    def post(self, app, data, name="document.pdf"):
+        with app.test_client() as client:
+            return client.post("/pdf2xml", content_type="multipart/form-data",
+                               data={"pdf_file": (io.BytesIO(data), name)})
+
+    def test_oversized_upload_gets_413(self):
+        size = self.pdf.stat().st_size
+        app = self.app(**{UPLOAD_MAX_MB_ENV: str(size / 2 / 2**20)})
+        response = self.post(app, self.pdf.read_bytes())
+        self.assertEqual(response.status_code, 413)
+        self.assertEqual(response.get_json()["error"], "upload too large")
+
+        app = self.app(**{UPLOAD_MAX_MB_ENV: str(2 * size / 2**20)})
+        self.assertEqual(self.post(app, self.pdf.read_bytes()).status_code, 200)
+
+    def test_spooled_upload_gives_the_same_zip(self):
+        in_memory = self.post(self.app(), self.pdf.read_bytes(), self.pdf.name)
+        before = set(Path(tempfile.gettempdir()).glob("ccm_upload_*"))
+        on_disk = self.post(self.app(**{UPLOAD_SPOOL_MB_ENV: "0"}), self.pdf.read_bytes(), self.pdf.name)
+        self.assertEqual((in_memory.status_code, on_disk.status_code), (200, 200))
+        self.assertEqual(on_disk.data, in_memory.data)
+        self.assertEqual(set(Path(tempfile.gettempdir()).glob("ccm_upload_*")), before)
+
+    def test_empty_upload_gets_400(self):
+        response = self.post(self.app(), b"")
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.get_json()["desc"], "PDF file is empty")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+""" WorkerPool (utils/worker_pool.py): a document running past the timeout or allocating past the memory
+limit has its worker killed and replaced, and the next documents are processed normally.
+
+    python -m pytest -q test/test_worker_pool.py
+"""
+import os
+import time
+import unittest
+
+from src.utils.worker_pool import DocumentMemoryError, DocumentTimeout, WorkerPool
+
+
+TIMEOUT = 2
+MEMORY_LIMIT = 200 * 2**20
+
+
+class WorkerPoolTest(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = WorkerPool(1, timeout=TIMEOUT, memory_limit=MEMORY_LIMIT)
+
+    def tearDown(self):
+        self.pool.shutdown()
+
+    def worker_pid(self):
+        return self.pool.run(os.getpid)
+
+    def test_timeout_kills_and_replaces_the_worker(self):
+        pid = self.worker_pid()
+        start = time.perf_counter()
+        with self.assertRaises(DocumentTimeout) as cm:
+            self.pool.run(time.sleep, 60)
+        self.assertLess(time.perf_counter() - start, 30)
+        self.assertGreaterEqual(cm.exception.seconds, TIMEOUT)
+        self.assertNotEqual(self.worker_pid(), pid)
+        self.assertEqual(self.pool.run(len, "after the timeout"), 17)
+
+    def test_memory_limit_kills_and_replaces_the_worker(self):
+        pid = self.worker_pid()
+        self.assertEqual(len(self.pool.run(bytearray, MEMORY_LIMIT // 4)), MEMORY_LIMIT // 4)
+        with self.assertRaises(DocumentMemoryError):
+            self.pool.run(bytearray, 2 * MEMORY_LIMIT)
+        self.assertNotEqual(self.worker_pid(), pid)
+        self.assertEqual(self.pool.run(len, "after the memory error"), 22)
+
+    def test_other_errors_are_raised_and_keep_the_worker(self):
+        pid = self.worker_pid()
+        with self.assertRaises(ValueError):
+            self.pool.run(int, "not a number")
+        self.assertEqual(self.worker_pid(), pid)
+
+    def test_worker_is_recycled_after_max_tasks(self):
+        pool = WorkerPool(1, max_tasks=2)
+        try:
+            pids = [pool.run(os.getpid) for _ in range(4)]
+        finally:
+            pool.shutdown()
+        self.assertEqual(pids[0], pids[1])
+        self.assertEqual(pids[2], pids[3])
+        self.assertNotEqual(pids[1], pids[2])
+
+
+if __name__ == "__main__":
+    unittest.main()